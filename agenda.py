@@ -0,0 +1,133 @@
+# Vistas de agenda por semana / mes: una sola consulta por rango agrupada en una grilla (estilista × día × slot)
+import bisect
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from disponibilidad import normalizar_fecha, normalizar_hora
+
+VISTAS = ('semana', 'mes')
+
+CONSULTA_RANGO = """
+SELECT C.IDCita, C.IDEstilista, C.Fecha, C.Hora, C.Estado, CL.Nombre AS Cliente, S.NombreServicio
+FROM CITA C
+JOIN CLIENTE CL ON C.IDCliente = CL.IDCliente
+JOIN SERVICIO S ON C.IDServicio = S.IDServicio
+WHERE C.Fecha BETWEEN ? AND ?
+"""
+
+
+def rango_vista(vista, fecha):
+    """Días que cubre la vista: la semana (lunes a domingo) o el mes que contienen 'fecha'."""
+    if vista == 'mes':
+        desde = fecha.replace(day=1)
+        hasta = (desde + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    else:
+        desde = fecha - timedelta(days=fecha.weekday())
+        hasta = desde + timedelta(days=6)
+    return desde, hasta
+
+
+def desplazar(vista, fecha, pasos):
+    """Fecha de la semana/mes anterior (pasos=-1) o siguiente (pasos=1), para la navegación."""
+    if vista == 'mes':
+        mes = fecha.year * 12 + fecha.month - 1 + pasos
+        return date(mes // 12, mes % 12 + 1, 1)
+    return fecha + timedelta(days=7 * pasos)
+
+
+def consultar_rango(cursor, desde, hasta, id_estilista=None):
+    """Todas las citas del rango en un solo viaje a la BD (opcionalmente de un solo estilista)."""
+    query, params = CONSULTA_RANGO, [desde, hasta]
+    if id_estilista is not None:
+        query += "AND C.IDEstilista = ?\n"
+        params.append(id_estilista)
+    cursor.execute(query + "ORDER BY C.Fecha, C.Hora, C.IDCita", *params)
+    return cursor.fetchall()
+
+
+# -------------------------------------------------------------------
+# --- GRILLA ESTILISTA × DÍA × SLOT ---
+# -------------------------------------------------------------------
+
+class GrillaAgenda:
+    """
+    Estructura dispersa: solo guarda las celdas con citas, indexadas por
+    (id_estilista, fecha ISO, índice de slot). Cada cita es una tupla
+    (IDCita, Hora, Estado, Cliente, Servicio). Una celda puede tener más de una
+    cita (p. ej. una cancelada y la que ocupó su lugar).
+    """
+
+    def __init__(self, estilistas, desde, hasta, horas):
+        self.estilistas = list(estilistas)  # [(IDEstilista, Nombre)]
+        self.dias = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+        self.horas = list(horas)  # [(hora_24, hora_ampm)]
+        self._inicios = [hora_24 for hora_24, _ in self.horas]
+        self._celdas = defaultdict(list)
+        self._por_dia = defaultdict(lambda: defaultdict(int))  # fecha -> id_estilista -> citas activas
+
+    def _slot(self, hora):
+        # Una cita fuera de la grilla (p. ej. 10:15 importada) cae en el slot que la contiene
+        return max(bisect.bisect_right(self._inicios, normalizar_hora(hora)) - 1, 0)
+
+    def agregar(self, filas):
+        """Agrupa las filas de consultar_rango() en sus celdas."""
+        for id_cita, id_estilista, fecha, hora, estado, cliente, servicio in filas:
+            fecha = normalizar_fecha(fecha)
+            self._celdas[(id_estilista, fecha, self._slot(hora))].append((id_cita, hora, estado, cliente, servicio))
+            if estado != 'Cancelada':
+                self._por_dia[fecha][id_estilista] += 1
+        return self
+
+    def citas(self, id_estilista, dia, indice_slot):
+        return self._celdas.get((id_estilista, normalizar_fecha(dia), indice_slot), [])
+
+    def conteo(self, dia, id_estilista=None):
+        """Citas no canceladas del día (de un estilista o de todos)."""
+        por_estilista = self._por_dia.get(normalizar_fecha(dia), {})
+        if id_estilista is not None:
+            return por_estilista.get(id_estilista, 0)
+        return sum(por_estilista.values())
+
+
+# -------------------------------------------------------------------
+# --- VALIDACIÓN CONDICIONAL (ETag / Last-Modified) ---
+# -------------------------------------------------------------------
+
+def calcular_etag(clave, filas, estilistas, hoy):
+    """
+    Huella de los datos que alimentan la vista: si no cambian, el HTML tampoco. Incluye
+    'hoy', que la vista resalta: pasada la medianoche una copia guardada ya no sirve.
+    """
+    huella = hashlib.sha1(repr((clave, hoy.isoformat())).encode())
+    huella.update(repr([tuple(e) for e in estilistas]).encode())
+    for fila in filas:
+        huella.update(repr(tuple(fila)).encode())
+    return huella.hexdigest()
+
+
+class RegistroVersiones:
+    """
+    Recuerda, por vista (clave), el último ETag servido y desde cuándo es el mismo:
+    ese instante es el Last-Modified. Acotado a 'capacidad' claves (LRU).
+    """
+
+    def __init__(self, capacidad=1024):
+        self.capacidad = capacidad
+        self._versiones = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ultima_modificacion(self, clave, etag):
+        with self._lock:
+            anterior = self._versiones.get(clave)
+            if anterior and anterior[0] == etag:
+                self._versiones.move_to_end(clave)
+                return anterior[1]
+            # Last-Modified tiene resolución de segundos
+            ahora = datetime.now(timezone.utc).replace(microsecond=0)
+            self._versiones[clave] = (etag, ahora)
+            self._versiones.move_to_end(clave)
+            while len(self._versiones) > self.capacidad:
+                self._versiones.popitem(last=False)
+            return ahora
@@ -1,14 +1,53 @@
 # Importaciones necesarias de Flask y utilidades
-from flask import Flask, render_template, request, redirect, url_for, session, g
-import pyodbc
+from flask import (Flask, render_template, request, redirect, url_for, session, g, jsonify, Response, stream_with_context,
+                   has_app_context, has_request_context)
 from datetime import date, datetime, time, timedelta
+import contextlib
+import csv
+import functools
+import os
+import secrets
 import string
 import random
 
+import conexiones
+from catalogos import CacheCatalogos
+from sesiones import crear_interfaz_sesion
+from busqueda import IndiceClientes
+import metricas
+import exportar
+import importar
+import click
+import instrumentacion
+import paginas
+import agenda
+import eventos
+import fragmentos
+import horarios
+import idempotencia
+import escritura
+import credenciales
+import migraciones
+import estados
+import series
+import espera
+import trabajos
+import notificaciones
+import sucursales
+from disponibilidad import (IndiceDisponibilidad, buscar_slots_libres, hora_ampm, hora_de_minutos, minutos,
+                            normalizar_fecha, normalizar_hora)
+
 app = Flask(__name__)
 # Es CRÍTICO que esta clave sea estable para que las sesiones funcionen
 app.secret_key = 'clave_secreta_rossy_2025'
 
+# Sesión del lado del servidor: la cookie solo lleva un ID opaco ('memoria' o 'sqlite')
+app.config['SESSION_BACKEND'] = os.environ.get('ROSSY_SESSION_BACKEND', 'sqlite')
+app.config['SESSION_SQLITE_PATH'] = os.environ.get('ROSSY_SESSION_SQLITE_PATH',
+                                                   os.path.join(app.root_path, 'sesiones.db'))
+app.config['SESSION_VALOR_TTL'] = 600  # segundos que se conservan los resultados de búsqueda
+app.session_interface = crear_interfaz_sesion(app.config)
+
 # -------------------------------------------------------------------
 # --- MAPPING: ASOCIACIÓN DE ROL CON ENDPOINT (FUNCIÓN) CORRECTO ---
 # -------------------------------------------------------------------
@@ -28,8 +67,8 @@ ROLE_ENDPOINT_MAP = {
 
 @app.context_processor
 def inject_global_vars():
-    """Hace la variable 'app' accesible en todos los templates de Jinja2."""
-    return dict(app=app)
+    """Hace accesibles en todos los templates de Jinja2 la 'app' y las sucursales (para el selector)."""
+    return dict(app=app, sucursales=list(SUCURSALES.values()), id_sucursal=sucursal_actual())
 
 
 # -------------------------------------------------------------------
@@ -43,37 +82,951 @@ conn_str = (
     r'Trusted_Connection=yes;'
 )
 
+# Backend y pool de conexiones. 'sqlite' usa el archivo local para pruebas de carga.
+app.config['DB_BACKEND'] = os.environ.get('ROSSY_DB_BACKEND', 'sqlserver')
+app.config['SQLITE_PATH'] = os.environ.get('ROSSY_SQLITE_PATH', os.path.join(app.root_path, 'rossy_salon.db'))
+app.config['DB_POOL_SIZE'] = int(os.environ.get('ROSSY_DB_POOL_SIZE', 10))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('ROSSY_DB_POOL_TIMEOUT', 5))
+app.config['DB_POOL_MAX_IDLE'] = float(os.environ.get('ROSSY_DB_POOL_MAX_IDLE', 300))
+app.config['DB_QUERY_TIMEOUT'] = float(os.environ.get('ROSSY_DB_QUERY_TIMEOUT', 0))  # segundos por sentencia (0 = sin límite)
+app.config['CATALOGO_TTL'] = float(os.environ.get('ROSSY_CATALOGO_TTL', 300))
+app.config['BUSQUEDA_POR_PAGINA'] = 20
+app.config['META_INGRESOS_MES'] = 20000  # meta mensual mostrada en el dashboard
+app.config['BUSQUEDA_LIMITE_MAX'] = 50  # tope duro de resultados por página
+app.config['BUSQUEDA_RECARGA'] = 600  # segundos entre reconstrucciones completas del índice
+app.config['HISTORIAL_POR_PAGINA'] = 10  # citas pasadas por página en el perfil del cliente
+app.config['PROXIMAS_CITAS_MAX'] = 20  # tope de próximas citas mostradas
+app.config['EVENTOS_MAX_SUSCRIPTORES'] = int(os.environ.get('ROSSY_EVENTOS_MAX_SUSCRIPTORES', 500))
+app.config['EVENTOS_LATIDO'] = 15  # segundos entre latidos de las conexiones SSE
+app.config['FRAGMENTOS_TTL'] = float(os.environ.get('ROSSY_FRAGMENTOS_TTL', 60))  # tope por escrituras de otros procesos
+app.config['SQL_LENTA_MS'] = float(os.environ.get('ROSSY_SQL_LENTA_MS', 200))  # umbral del log de consultas lentas
+app.config['METRICS_TOKEN'] = os.environ.get('ROSSY_METRICS_TOKEN')  # para que Prometheus lea /metrics sin sesión
+app.config['HORARIO_APERTURA'] = os.environ.get('ROSSY_HORARIO_APERTURA', '09:00')  # jornada de quien no tiene turnos propios
+app.config['HORARIO_CIERRE'] = os.environ.get('ROSSY_HORARIO_CIERRE', '21:00')
+app.config['PASO_AGENDA'] = int(os.environ.get('ROSSY_PASO_AGENDA', 30))  # minutos entre horas de inicio ofrecidas
+app.config['DURACION_SERVICIO_DEFECTO'] = 90  # minutos, para servicios sin DuracionMin
+app.config['IDEMPOTENCIA_TTL'] = 600  # segundos que se recuerda cada envío de formulario
+app.config['IDEMPOTENCIA_ESPERA'] = 10  # segundos que un duplicado espera al envío original
+app.config['ESCRITURA_AGRUPADA'] = os.environ.get('ROSSY_ESCRITURA_AGRUPADA', '0') == '1'  # commit agrupado en horas pico
+app.config['ESCRITURA_MAX_LOTE'] = int(os.environ.get('ROSSY_ESCRITURA_MAX_LOTE', 32))
+app.config['CREDENCIAL_METODO'] = os.environ.get('ROSSY_CREDENCIAL_METODO', 'scrypt:32768:8:1')  # factor de trabajo del hash
+app.config['LOGIN_INTENTOS_IP'] = (20, 60)  # intentos por IP: 20 seguidos, que se recargan en 60 s
+app.config['LOGIN_FALLOS_CUENTA'] = (5, 900)  # claves incorrectas por cuenta: 5 cada 15 min
+app.config['LOGIN_CACHE_NEGATIVA_TTL'] = 60  # segundos que se recuerda un correo inexistente
+app.config['ESPERA_RECARGA'] = 300  # segundos entre relecturas de LISTA_ESPERA (solicitudes de otros procesos)
+app.config['ESPERA_ANTELACION_MIN'] = 60  # un horario que se libera con menos antelación no se reasigna
+app.config['TRABAJOS_SQLITE_PATH'] = os.environ.get('ROSSY_TRABAJOS_SQLITE_PATH',
+                                                    os.path.join(app.root_path, 'trabajos.db'))
+app.config['TRABAJOS_HILOS'] = int(os.environ.get('ROSSY_TRABAJOS_HILOS', 2))  # 0 = solo encolar ('flask trabajos' los procesa)
+app.config['TRABAJOS_MAX_INTENTOS'] = 5
+app.config['RECORDATORIO_HORAS_ANTES'] = 24
+app.config['NOTIFICACIONES_ENVIADOR'] = os.environ.get('ROSSY_NOTIFICACIONES', 'consola')  # 'consola' o 'smtp'
+app.config['SMTP_HOST'] = os.environ.get('ROSSY_SMTP_HOST', 'localhost')
+app.config['SMTP_PUERTO'] = int(os.environ.get('ROSSY_SMTP_PUERTO', 1025))
+app.config['SMTP_REMITENTE'] = os.environ.get('ROSSY_SMTP_REMITENTE', 'citas@rossysalon.com')
+app.config['SMTP_USUARIO'] = os.environ.get('ROSSY_SMTP_USUARIO')
+app.config['SMTP_CLAVE'] = os.environ.get('ROSSY_SMTP_CLAVE')
+app.config['SMTP_STARTTLS'] = os.environ.get('ROSSY_SMTP_STARTTLS', '0') == '1'
+
+# Sucursales: cada una en su propia BD o archivo (ROSSY_SUCURSALES; ver sucursales.cargar)
+SUCURSALES = sucursales.cargar(app.config, conn_str)
+app.config['SUCURSAL_PRINCIPAL'] = int(os.environ.get('ROSSY_SUCURSAL', next(iter(SUCURSALES))))  # CLI y sesiones nuevas
+app.config['SUCURSAL_TIMEOUT'] = 10  # segundos que el dashboard espera a cada sucursal
+
+
+# -------------------------------------------------------------------
+# --- SUCURSALES: ENRUTAMIENTO A LA PARTICIÓN DE CADA UNA ---
+# -------------------------------------------------------------------
+
+def sucursal_actual():
+    """
+    Sucursal con la que trabaja la solicitud (o el hilo): la fijada en 'g' (en_sucursal,
+    login), la elegida en la sesión o, si no hay ninguna, SUCURSAL_PRINCIPAL.
+    """
+    if has_app_context() and 'sucursal' in g:
+        return g.sucursal
+    if has_request_context() and session.get('id_sucursal') in SUCURSALES:
+        return session['id_sucursal']
+    return app.config['SUCURSAL_PRINCIPAL']
+
+
+def extensiones_sucursal():
+    """
+    Como app.extensions, pero de la sucursal actual: pool, índices y cachés de cada
+    sucursal van por separado, así que una sucursal con mucha carga no agota las
+    conexiones ni invalida las cachés de las otras.
+    """
+    return app.extensions.setdefault('por_sucursal', {}).setdefault(sucursal_actual(), {})
+
+
+@contextlib.contextmanager
+def en_sucursal(id_sucursal):
+    """Contexto de app propio (con su conexión) fijado a una sucursal, para hilos y consultas a otra sucursal."""
+    with app.app_context():
+        g.sucursal = id_sucursal
+        yield
+
+
+def obtener_consulta_paralela():
+    """Ejecutor compartido para consultar todas las sucursales a la vez (dashboard)."""
+    consulta = app.extensions.get('consulta_sucursales')
+    if consulta is None:
+        consulta = app.extensions.setdefault('consulta_sucursales', sucursales.ConsultaParalela())
+    return consulta
+
+
+def obtener_pool():
+    """Devuelve el pool de conexiones de la sucursal actual, creándolo la primera vez."""
+    extensiones = extensiones_sucursal()
+    pool = extensiones.get('pool_conexiones')
+    if pool is None:
+        sucursal = SUCURSALES[sucursal_actual()]
+        backend = conexiones.crear_backend(sucursal.config(app.config), sucursal.destino)
+        pool = conexiones.PoolConexiones(backend,
+                                         tamano_max=app.config['DB_POOL_SIZE'],
+                                         timeout=app.config['DB_POOL_TIMEOUT'],
+                                         max_inactividad=app.config['DB_POOL_MAX_IDLE'])
+        comprobar_sucursal(pool, sucursal)
+        # setdefault: si dos hilos lo crean a la vez, ambos usan el mismo
+        pool = extensiones.setdefault('pool_conexiones', pool)
+    return pool
+
+
+def comprobar_sucursal(pool, sucursal):
+    """Lanza SucursalEquivocada si la BD del pool dice ser de otra sucursal (sin la tabla SUCURSAL no se comprueba)."""
+    conn = pool.obtener()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT IDSucursal FROM SUCURSAL")
+        sucursales.comprobar(cursor.fetchall(), sucursal)
+    except conexiones.DatabaseError:
+        pass  # BD sin migrar: 'flask migrar' crea la tabla y la anota
+    finally:
+        pool.devolver(conn)
+
 
 def obtener_conexion():
-    """Establece la conexión a la base de datos, reutilizando la existente en 'g'."""
+    """Obtiene una conexión del pool, reutilizando la ya asignada a la solicitud en 'g'."""
     try:
         # Usar getattr/setattr para almacenar la conexión en g y reutilizarla
         conn = getattr(g, '_database', None)
         if conn is None:
-            conn = g._database = pyodbc.connect(conn_str)
+            pool = obtener_pool()
+            conn = g._database = instrumentacion.ConexionInstrumentada(
+                pool.obtener(), registro_sql(), app.config['SQL_LENTA_MS'])
+            g._database_pool = pool
         return conn
     except Exception as e:
-        print(f"ERROR DE CONEXIÓN CON SQL SERVER: {e}")
+        print(f"ERROR DE CONEXIÓN CON LA BD: {e}")
         return None
 
 
-# Cierra la conexión al finalizar la solicitud
+# Devuelve la conexión al pool al finalizar la solicitud
 @app.teardown_appcontext
 def close_connection(exception):
-    """Cierra la conexión a la base de datos al finalizar la solicitud."""
-    conn = getattr(g, '_database', None)
+    """Devuelve la conexión al pool (con rollback de lo no confirmado) al finalizar la solicitud."""
+    conn = g.pop('_database', None)
     if conn is not None:
-        conn.close()
+        # Al pool del que salió, aunque la solicitud haya cambiado de sucursal después
+        g.pop('_database_pool').devolver(conn.conexion_real)
+
+
+def registro_sql():
+    """Registro de consultas de la solicitud (o del comando CLI) en curso."""
+    registro = getattr(g, '_registro_sql', None)
+    if registro is None:
+        registro = g._registro_sql = instrumentacion.RegistroSolicitud()
+    return registro
+
+
+@app.before_request
+def iniciar_registro_sql():
+    g._registro_sql = instrumentacion.RegistroSolicitud()
+
+
+@app.before_request
+def arrancar_trabajadores():
+    # Con la primera solicitud, para que los recordatorios ya programados salgan aunque nadie encole nada nuevo
+    if app.config['TRABAJOS_HILOS'] > 0 and 'trabajadores' not in app.extensions:
+        obtener_trabajadores().arrancar()
+
+
+@app.after_request
+def agregar_server_timing(response):
+    """Expone conteo y tiempo de SQL de la solicitud en el header Server-Timing y lo acumula en /metrics."""
+    registro = registro_sql()
+    duracion = registro.transcurrido()
+    response.headers['Server-Timing'] = instrumentacion.server_timing(registro, duracion)
+    instrumentacion.METRICAS.observar_solicitud(request.endpoint or 'desconocido', registro, duracion)
+    if registro.consultas and registro.tiempo_db * 1000 >= app.config['SQL_LENTA_MS']:
+        instrumentacion.logger_sql.warning(
+            "Solicitud con BD lenta %s %s: %d consultas, %.1f ms. Más lentas: %s", request.method, request.path,
+            registro.consultas, registro.tiempo_db * 1000,
+            '; '.join(f"{ms * 1000:.1f} ms {sql[:120]}" for sql, ms in registro.mas_lentas()))
+    return response
+
+
+def tabla_disponible(conn, tabla):
+    """
+    True si la tabla existe (la crea 'flask migrar'). Se comprueba como mucho una vez por
+    minuto por tabla, para que las funciones opcionales (CREDENCIAL, LISTA_ESPERA) se
+    apaguen solas en una BD sin migrar en lugar de fallar.
+    """
+    tablas = extensiones_sucursal().setdefault('tablas_disponibles', {})
+    estado = tablas.get(tabla)
+    if estado is not None and datetime.now() - estado[1] < timedelta(seconds=60):
+        return estado[0]
+    try:
+        conn.cursor().execute(f"SELECT COUNT(*) FROM {tabla} WHERE 1 = 0").fetchall()
+        existe = True
+    except conexiones.DatabaseError:
+        existe = False
+    tablas[tabla] = (existe, datetime.now())
+    return existe
 
 
 def row_to_list(rows):
     """
-    Convierte una lista de objetos pyodbc.Row a una lista de listas.
+    Convierte una lista de filas (pyodbc.Row o tuplas de sqlite3) a una lista de listas.
     Esto es CRÍTICO para la serialización en la sesión y para el manejo en Jinja2.
     """
     return [list(row) for row in rows]
 
 
+# -------------------------------------------------------------------
+# --- 2. DISPONIBILIDAD DE HORARIOS (ANTI-CHOQUE EN MEMORIA) ---
+# -------------------------------------------------------------------
+
+def cargar_horas_ocupadas(id_estilista, fecha):
+    """(Hora, duración) de las citas activas de un estilista en una fecha (carga inicial del índice)."""
+    conn = obtener_conexion()
+    if conn is None:
+        raise RuntimeError("No se pudo conectar con la BD para cargar la disponibilidad.")
+    cursor = conn.cursor()
+    marcas_estado = ', '.join('?' for _ in estados.ESTADOS_ACTIVOS)
+    query = f"""
+    SELECT Hora, IDServicio
+    FROM CITA
+    WHERE IDEstilista = ?
+      AND Fecha = ?
+      AND Estado IN ({marcas_estado})
+    """
+    cursor.execute(query, id_estilista, fecha, *estados.ESTADOS_ACTIVOS)
+    return [(hora, duracion_servicio(id_servicio)) for hora, id_servicio in cursor.fetchall()]
+
+
+def obtener_disponibilidad():
+    """Devuelve el índice de disponibilidad del proceso, creándolo la primera vez."""
+    indice = extensiones_sucursal().get('disponibilidad')
+    if indice is None:
+        indice = IndiceDisponibilidad(cargar_horas_ocupadas, lambda id_estilista, fecha:
+                                      obtener_jornadas().turnos(id_estilista, fecha))
+        indice = extensiones_sucursal().setdefault('disponibilidad', indice)
+    return indice
+
+
+def obtener_jornadas():
+    """
+    Turnos por estilista armados desde los catálogos 'turnos' y 'ausencias'. Se
+    reconstruyen solo cuando la caché de catálogos trae una copia nueva.
+    """
+    turnos = obtener_catalogos().obtener('turnos')
+    ausencias = obtener_catalogos().obtener('ausencias')
+    actual = extensiones_sucursal().get('jornadas')
+    if actual is None or actual[0] is not turnos or actual[1] is not ausencias:
+        actual = (turnos, ausencias, horarios.Jornadas(turnos, ausencias, app.config['HORARIO_APERTURA'],
+                                                        app.config['HORARIO_CIERRE']))
+        extensiones_sucursal()['jornadas'] = actual
+    return actual[2]
+
+
+def duracion_servicio(id_servicio):
+    """Minutos que dura un servicio (DuracionMin, o el valor por defecto si no está cargado)."""
+    duraciones = dict(obtener_catalogos().obtener('duraciones'))
+    return int(duraciones.get(int(id_servicio)) or app.config['DURACION_SERVICIO_DEFECTO'])
+
+
+# -------------------------------------------------------------------
+# --- CACHÉ DE CATÁLOGOS (SERVICIOS Y ESTILISTAS ACTIVOS) ---
+# -------------------------------------------------------------------
+
+def _consultar_catalogo(query):
+    conn = obtener_conexion()
+    if conn is None:
+        raise RuntimeError("No se pudo conectar con la BD para cargar el catálogo.")
+    cursor = conn.cursor()
+    cursor.execute(query)
+    return cursor.fetchall()
+
+
+def _consultar_catalogo_opcional(query):
+    """Como _consultar_catalogo, pero si la tabla o columna aún no existe devuelve [] (valores por defecto)."""
+    try:
+        return _consultar_catalogo(query)
+    except conexiones.DatabaseError as e:
+        print(f"Catálogo opcional no disponible ('flask migrar' lo crea): {e}")
+        return []
+
+
+def obtener_catalogos():
+    """Devuelve la caché de catálogos del proceso, creándola la primera vez."""
+    cache = extensiones_sucursal().get('catalogos')
+    if cache is None:
+        cache = CacheCatalogos(ttl=app.config['CATALOGO_TTL'])
+        # Columnas: 0=IDServicio, 1=NombreServicio, 2=Precio
+        cache.registrar('servicios', lambda: _consultar_catalogo(
+            "SELECT IDServicio, NombreServicio, Precio FROM SERVICIO ORDER BY NombreServicio"))
+        # Columnas: 0=IDEstilista, 1=Nombre
+        cache.registrar('estilistas', lambda: _consultar_catalogo(
+            "SELECT IDEstilista, Nombre FROM ESTILISTA WHERE Estado = 'Activo' ORDER BY Nombre"))
+        # Motor de horarios: 0=IDServicio, 1=DuracionMin / 0=IDEstilista, 1=DiaSemana, 2=HoraInicio, 3=HoraFin
+        cache.registrar('duraciones', lambda: _consultar_catalogo_opcional(
+            "SELECT IDServicio, DuracionMin FROM SERVICIO"))
+        cache.registrar('turnos', lambda: _consultar_catalogo_opcional(
+            "SELECT IDEstilista, DiaSemana, HoraInicio, HoraFin FROM HORARIO_ESTILISTA"))
+        cache.registrar('ausencias', lambda: _consultar_catalogo_opcional(
+            "SELECT IDEstilista, Fecha FROM AUSENCIA_ESTILISTA"))
+        cache = extensiones_sucursal().setdefault('catalogos', cache)
+    return cache
+
+
+def obtener_servicios():
+    return obtener_catalogos().obtener('servicios')
+
+
+def obtener_estilistas():
+    return obtener_catalogos().obtener('estilistas')
+
+
+TABLAS_CATALOGO = {'servicios': 'SERVICIO', 'estilistas': 'ESTILISTA', 'duraciones': 'SERVICIO',
+                   'turnos': 'HORARIO_ESTILISTA', 'ausencias': 'AUSENCIA_ESTILISTA'}
+
+
+def invalidar_catalogos(*nombres):
+    """
+    Hook para llamar después de escribir en SERVICIO ('servicios', 'duraciones'), ESTILISTA
+    ('estilistas'), HORARIO_ESTILISTA ('turnos') o AUSENCIA_ESTILISTA ('ausencias').
+    """
+    obtener_catalogos().invalidar(*nombres)
+    marcar_escritura(*(TABLAS_CATALOGO[nombre] for nombre in nombres or TABLAS_CATALOGO))
+
+
+# -------------------------------------------------------------------
+# --- CACHÉ DE FRAGMENTOS DE PLANTILLAS ---
+# -------------------------------------------------------------------
+
+def obtener_versiones_datos():
+    """Versiones por tabla del proceso: suben con cada escritura (ver marcar_escritura)."""
+    versiones = extensiones_sucursal().get('versiones_datos')
+    if versiones is None:
+        versiones = extensiones_sucursal().setdefault('versiones_datos', fragmentos.VersionesDatos())
+    return versiones
+
+
+def obtener_cache_fragmentos():
+    cache = extensiones_sucursal().get('cache_fragmentos')
+    if cache is None:
+        cache = extensiones_sucursal().setdefault('cache_fragmentos', fragmentos.CacheFragmentos(
+            obtener_versiones_datos(), ttl=app.config['FRAGMENTOS_TTL']))
+    return cache
+
+
+def marcar_escritura(*tablas):
+    """Llamar después del commit: los fragmentos que dependen de esas tablas se vuelven a renderizar."""
+    obtener_versiones_datos().incrementar(*tablas)
+
+
+@app.template_global()
+def fragmento(nombre, tablas=(), clave=None, caller=None):
+    """
+    Guarda en memoria el HTML del bloque y lo reutiliza mientras no cambien las tablas indicadas:
+
+        {% call fragmento('opciones_servicios', ['SERVICIO']) %} ... {% endcall %}
+
+    'clave' distingue variantes del mismo fragmento (p. ej. la fecha). El bloque no
+    debe depender del usuario ni de la sesión.
+    """
+    return obtener_cache_fragmentos().renderizar(nombre, tuple(tablas), clave, caller)
+
+
+# -------------------------------------------------------------------
+# --- ESCRITURAS: ENVÍOS IDEMPOTENTES Y COMMIT AGRUPADO ---
+# -------------------------------------------------------------------
+
+def obtener_almacen_idempotencia():
+    almacen = app.extensions.get('idempotencia')
+    if almacen is None:
+        almacen = app.extensions.setdefault('idempotencia', idempotencia.AlmacenIdempotencia(
+            ttl=app.config['IDEMPOTENCIA_TTL']))
+    return almacen
+
+
+@app.template_global()
+def nueva_clave_idempotencia():
+    """Clave para el campo oculto 'clave_idempotencia' de los formularios que escriben."""
+    return secrets.token_urlsafe(16)
+
+
+def idempotente(vista):
+    """
+    Para rutas POST que responden con redirect. Si el formulario trae 'clave_idempotencia',
+    un segundo envío con la misma clave no vuelve a ejecutar la ruta: recibe el mismo
+    redirect y los mismos cambios de sesión que el primero (esperándolo si sigue en curso).
+    Solo se guarda un redirect de un envío que confirmó su escritura (ejecutar_escritura):
+    los errores, aunque vuelvan como redirect con ?error=, no se repiten y el envío
+    corregido con la misma clave se procesa.
+    """
+    @functools.wraps(vista)
+    def envoltura(*args, **kwargs):
+        clave = request.form.get('clave_idempotencia')
+        if not clave:
+            return vista(*args, **kwargs)
+
+        almacen = obtener_almacen_idempotencia()
+        llave = (request.endpoint, clave)
+        envio, primero = almacen.comenzar(llave)
+        if not primero:
+            if not envio.listo.wait(app.config['IDEMPOTENCIA_ESPERA']):
+                return Response("La solicitud anterior todavía se está procesando.", status=409)
+            if envio.resultado is None:
+                # El original no dejó respuesta que repetir: este envío se procesa como un reintento
+                return vista(*args, **kwargs)
+            destino, cambios, quitadas = envio.resultado
+            session.update(cambios)
+            for nombre in quitadas:
+                session.pop(nombre, None)
+            return redirect(destino)
+
+        antes = dict(session)
+        g.pop('_escritura_confirmada', None)
+        try:
+            respuesta = vista(*args, **kwargs)
+        except Exception:
+            almacen.descartar(llave, envio)
+            raise
+        if getattr(respuesta, 'status_code', None) in (301, 302, 303) and g.get('_escritura_confirmada'):
+            cambios = {nombre: valor for nombre, valor in session.items() if antes.get(nombre) != valor}
+            almacen.terminar(envio, (respuesta.location, cambios, [nombre for nombre in antes if nombre not in session]))
+        else:
+            almacen.descartar(llave, envio)
+        return respuesta
+    return envoltura
+
+
+def obtener_escritor():
+    """Escritor con commit agrupado del proceso, o None si ESCRITURA_AGRUPADA está apagado."""
+    if not app.config['ESCRITURA_AGRUPADA']:
+        return None
+    escritor = extensiones_sucursal().get('escritor')
+    if escritor is None:
+        escritor = extensiones_sucursal().setdefault('escritor', escritura.EscritorAgrupado(
+            obtener_pool().backend, max_lote=app.config['ESCRITURA_MAX_LOTE']))
+    return escritor
+
+
+def ejecutar_escritura(conn, trabajo):
+    """
+    Ejecuta trabajo(cursor) y confirma. Por defecto en la conexión de la solicitud;
+    con ESCRITURA_AGRUPADA, en el escritor compartido, que junta en un solo commit
+    las escrituras que llegan a la vez. Devuelve lo que devuelva 'trabajo'.
+    Tras el commit marca la solicitud para que @idempotente guarde su respuesta.
+    """
+    escritor = obtener_escritor()
+    if escritor is not None:
+        # El hilo del escritor no tiene contexto: lleva la sucursal para que obtener_pool() apunte a la misma BD
+        id_sucursal = sucursal_actual()
+
+        def trabajo_en_sucursal(cursor):
+            with en_sucursal(id_sucursal):
+                return trabajo(cursor)
+        resultado = escritor.ejecutar(trabajo_en_sucursal)
+    else:
+        resultado = trabajo(conn.cursor())
+        conn.commit()
+    g._escritura_confirmada = True
+    return resultado
+
+
+# -------------------------------------------------------------------
+# --- CREDENCIALES: CACHÉ NEGATIVA Y LÍMITE DE INTENTOS ---
+# -------------------------------------------------------------------
+
+def obtener_cache_negativa():
+    cache = extensiones_sucursal().get('login_cache_negativa')
+    if cache is None:
+        cache = extensiones_sucursal().setdefault('login_cache_negativa', credenciales.CacheNegativa(
+            ttl=app.config['LOGIN_CACHE_NEGATIVA_TTL']))
+    return cache
+
+
+def obtener_limitadores_login():
+    """(por IP, por cuenta) del proceso. El de IP cuenta todos los intentos; el de cuenta, solo los fallidos."""
+    limitadores = app.extensions.get('login_limitadores')
+    if limitadores is None:
+        limitadores = app.extensions.setdefault('login_limitadores', (
+            credenciales.LimitadorIntentos(*app.config['LOGIN_INTENTOS_IP']),
+            credenciales.LimitadorIntentos(*app.config['LOGIN_FALLOS_CUENTA'])))
+    return limitadores
+
+
+@app.cli.command('migrar-credenciales')
+@click.option('--borrar-texto-plano', is_flag=True, help="Vacía CLIENTE.contraseña de las cuentas migradas.")
+def migrar_credenciales_cmd(borrar_texto_plano):
+    """Crea CREDENCIAL y guarda con hash las claves de clientes y estilistas que aún no la tienen."""
+    conn = obtener_conexion()
+    if conn is None:
+        raise SystemExit("No se pudo conectar con la BD.")
+    creadas = credenciales.migrar(conn.cursor(), obtener_pool().backend.nombre, app.config['CREDENCIAL_METODO'],
+                                  borrar_texto_plano=borrar_texto_plano)
+    conn.commit()
+    extensiones_sucursal().pop('tablas_disponibles', None)
+    print(f"Credenciales creadas: {creadas}.")
+
+
+# -------------------------------------------------------------------
+# --- ÍNDICE DE BÚSQUEDA DE CLIENTES ---
+# -------------------------------------------------------------------
+
+def _cargar_clientes():
+    # Columnas: 0=IDCliente, 1=Nombre, 2=Telefono, 3=Correo, 4=FechaRegistro
+    return _consultar_catalogo("SELECT IDCliente, Nombre, Telefono, Correo, FechaRegistro FROM CLIENTE")
+
+
+def obtener_indice_clientes():
+    """Devuelve el índice de búsqueda de clientes del proceso, creándolo la primera vez."""
+    indice = extensiones_sucursal().get('indice_clientes')
+    if indice is None:
+        indice = IndiceClientes(_cargar_clientes, recargar_cada=app.config['BUSQUEDA_RECARGA'])
+        indice = extensiones_sucursal().setdefault('indice_clientes', indice)
+    return indice
+
+
+def serializar_cliente(cliente):
+    """
+    Convierte la FechaRegistro (índice 4) a cadena para poder guardarla/serializarla
+    y evitar el problema de .strftime() en Jinja.
+    """
+    cliente_list = list(cliente)
+    if isinstance(cliente_list[4], (date, datetime)):
+        cliente_list[4] = cliente_list[4].strftime('%Y-%m-%d')
+    return cliente_list
+
+
+# -------------------------------------------------------------------
+# --- RESÚMENES DIARIOS PARA EL DASHBOARD ---
+# -------------------------------------------------------------------
+
+def actualizar_resumen(funcion, cursor, *args):
+    """
+    Aplica un cambio incremental a RESUMEN_DIARIO dentro de la transacción en curso.
+    Si falla, no se bloquea la operación principal ('flask reconstruir-metricas' lo corrige).
+    """
+    try:
+        funcion(cursor, *args)
+    except Exception as e:
+        print(f"Error al actualizar RESUMEN_DIARIO ({funcion.__name__}): {e}")
+
+
+@app.cli.command('reconstruir-metricas')
+def reconstruir_metricas_cmd():
+    """Crea RESUMEN_DIARIO si falta y la recalcula completa desde CITA y CLIENTE."""
+    conn = obtener_conexion()
+    if conn is None:
+        raise SystemExit("No se pudo conectar con la BD.")
+    cursor = conn.cursor()
+    dias = metricas.reconstruir(cursor, obtener_pool().backend.nombre)
+    conn.commit()
+    print(f"RESUMEN_DIARIO reconstruida: {dias} días.")
+
+
+@app.cli.command('preparar-horarios')
+def preparar_horarios_cmd():
+    """Agrega SERVICIO.DuracionMin y crea HORARIO_ESTILISTA y AUSENCIA_ESTILISTA si faltan."""
+    conn = obtener_conexion()
+    if conn is None:
+        raise SystemExit("No se pudo conectar con la BD.")
+    horarios.preparar_esquema(conn.cursor(), obtener_pool().backend.nombre)
+    conn.commit()
+    invalidar_catalogos('duraciones', 'turnos', 'ausencias')
+    print("Tablas de horarios listas.")
+
+
+@app.cli.command('migrar')
+@click.option('--hasta', type=int, default=None, help="Aplica solo hasta esta versión.")
+def migrar_cmd(hasta):
+    """Aplica las migraciones pendientes del esquema (en la BD de la sucursal ROSSY_SUCURSAL, o la principal)."""
+    conn = obtener_conexion()
+    if conn is None:
+        raise SystemExit("No se pudo conectar con la BD.")
+    backend = obtener_pool().backend.nombre
+    try:
+        aplicadas = migraciones.aplicar(conn, backend, hasta)
+        if migraciones.version_actual(conn.cursor(), backend) >= migraciones.VERSION_SUCURSAL:
+            sucursales.registrar(conn.cursor(), SUCURSALES[sucursal_actual()])
+    except (conexiones.DatabaseError, sucursales.SucursalEquivocada) as e:
+        raise SystemExit(f"Error en la migración: {e}")
+    if aplicadas:
+        invalidar_catalogos()
+        extensiones_sucursal().pop('tablas_disponibles', None)
+    print(f"Sucursal {SUCURSALES[sucursal_actual()].nombre}: esquema en la versión "
+          f"{migraciones.version_actual(conn.cursor(), backend)} ({len(aplicadas)} migraciones aplicadas).")
+    conn.commit()
+
+
+@app.cli.command('verificar-esquema')
+@click.option('--planes', is_flag=True, help="Muestra el plan completo de cada consulta crítica.")
+def verificar_esquema_cmd(planes):
+    """Muestra la versión del esquema, índices faltantes y si las consultas calientes usan seeks."""
+    conn = obtener_conexion()
+    if conn is None:
+        raise SystemExit("No se pudo conectar con la BD.")
+    estado = migraciones.verificar(conn.cursor(), obtener_pool().backend.nombre)
+    conn.rollback()
+    print(f"Versión del esquema: {estado['version']}")
+    print(f"Migraciones pendientes: {estado['pendientes'] or 'ninguna'}")
+    print(f"Índices faltantes: {estado['indices_faltantes'] or 'ninguno'}")
+    for nombre, (lineas, usa_scan) in estado['planes'].items():
+        print(f"  {'SCAN' if usa_scan else 'seek'}  {nombre}")
+        if planes or usa_scan:
+            for linea in lineas:
+                print(f"        {linea}")
+    if estado['pendientes'] or estado['indices_faltantes'] or any(scan for _, scan in estado['planes'].values()):
+        raise SystemExit(1)
+
+
+# -------------------------------------------------------------------
+# --- EVENTOS EN VIVO DE LA AGENDA (PUB/SUB + SSE) ---
+# -------------------------------------------------------------------
+
+def obtener_bus_eventos():
+    """Bus de eventos del proceso: las rutas de escritura publican, las conexiones SSE escuchan."""
+    bus = app.extensions.get('bus_eventos')
+    if bus is None:
+        bus = app.extensions.setdefault('bus_eventos',
+                                        eventos.BusEventos(max_suscriptores=app.config['EVENTOS_MAX_SUSCRIPTORES']))
+    return bus
+
+
+def canales_agenda(fecha, id_estilista):
+    """Canal del día de la sucursal (Recepción) y canal del día de la estilista."""
+    base = f'agenda:{sucursal_actual()}:{normalizar_fecha(fecha)}'
+    return [base, f'{base}:{int(id_estilista)}']
+
+
+def publicar_evento_agenda(tipo, fecha, id_estilista, **datos):
+    """Publica un cambio de la agenda después del commit. Si falla, la cita ya quedó guardada: solo se informa."""
+    try:
+        datos.update(fecha=normalizar_fecha(fecha), id_estilista=int(id_estilista))
+        obtener_bus_eventos().publicar(canales_agenda(fecha, id_estilista), tipo, datos)
+    except Exception as e:
+        print(f"Error al publicar el evento '{tipo}': {e}")
+
+
+def publicar_nueva_cita(cursor, id_cita, id_cliente, id_servicio, id_estilista, fecha, hora, nombre_cliente=None):
+    """Evento 'nueva_cita' con los nombres ya resueltos (catálogos en caché) para que el navegador no consulte nada."""
+    if not obtener_bus_eventos().hay_suscriptores(canales_agenda(fecha, id_estilista)):
+        return
+    try:
+        if nombre_cliente is None:
+            cursor.execute("SELECT Nombre FROM CLIENTE WHERE IDCliente = ?", id_cliente)
+            fila = cursor.fetchone()
+            nombre_cliente = fila[0] if fila else None
+        servicio = next((s[1] for s in obtener_servicios() if s[0] == int(id_servicio)), None)
+        estilista = next((e[1] for e in obtener_estilistas() if e[0] == int(id_estilista)), None)
+    except Exception as e:
+        print(f"Error al preparar el evento 'nueva_cita': {e}")
+        return
+    hora = normalizar_hora(hora)
+    publicar_evento_agenda('nueva_cita', fecha, id_estilista, id_cita=int(id_cita), hora=hora,
+                           hora_ampm=datetime.strptime(hora, '%H:%M:%S').strftime('%I:%M %p'),
+                           cliente=nombre_cliente, servicio=servicio, estilista=estilista, estado='Pendiente')
+
+
+@app.route('/eventos/agenda')
+def eventos_agenda():
+    """
+    Flujo SSE con los cambios de la agenda de un día (query arg: fecha, por defecto hoy).
+    Recepción recibe los de todas las estilistas; cada Estilista solo los suyos.
+    No usa la BD: la conexión queda esperando eventos del bus.
+    """
+    rol = session.get('rol')
+    if rol not in ['Recepcionista', 'Estilista']:
+        return Response(status=403)
+    try:
+        fecha = normalizar_fecha(request.args.get('fecha') or date.today())
+    except ValueError:
+        return Response("Fecha inválida", status=400)
+
+    if rol == 'Estilista':
+        try:
+            canales = [canales_agenda(fecha, int(session.get('id_usuario')))[1]]
+        except (ValueError, TypeError):
+            return Response(status=403)
+    else:
+        canales = [f'agenda:{sucursal_actual()}:{fecha}']
+
+    ultimo_id = request.headers.get('Last-Event-ID', type=int)
+    bus = obtener_bus_eventos()
+    try:
+        suscripcion, pendientes, completo = bus.suscribir(canales, ultimo_id)
+    except eventos.DemasiadosSuscriptores:
+        return Response("Demasiadas conexiones en vivo", status=503, headers={'Retry-After': '30'})
+
+    respuesta = Response(eventos.flujo_sse(bus, suscripcion, pendientes, completo,
+                                           latido=app.config['EVENTOS_LATIDO']),
+                         mimetype='text/event-stream')
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    respuesta.headers['X-Accel-Buffering'] = 'no'  # que un proxy nginx no acumule el flujo
+    respuesta.call_on_close(lambda: bus.cancelar(suscripcion))
+    return respuesta
+
+
+# -------------------------------------------------------------------
+# --- TRABAJOS EN SEGUNDO PLANO: NOTIFICACIONES ---
+# -------------------------------------------------------------------
+
+def obtener_cola_trabajos():
+    cola = app.extensions.get('cola_trabajos')
+    if cola is None:
+        cola = app.extensions.setdefault('cola_trabajos', trabajos.ColaTrabajos(
+            app.config['TRABAJOS_SQLITE_PATH'], max_intentos=app.config['TRABAJOS_MAX_INTENTOS']))
+    return cola
+
+
+def obtener_trabajadores():
+    grupo = app.extensions.get('trabajadores')
+    if grupo is None:
+        grupo = app.extensions.setdefault('trabajadores', trabajos.GrupoTrabajadores(
+            obtener_cola_trabajos(), MANEJADORES_TRABAJOS, hilos=app.config['TRABAJOS_HILOS']))
+    return grupo
+
+
+def obtener_enviador():
+    enviador = app.extensions.get('enviador')
+    if enviador is None:
+        enviador = app.extensions.setdefault('enviador', notificaciones.crear_enviador(app.config))
+    return enviador
+
+
+def encolar_trabajo(tipo, datos, ejecutar_en=None, clave=None):
+    """Encola un trabajo después del commit. Si falla, lo principal ya quedó guardado: solo se informa."""
+    try:
+        obtener_cola_trabajos().encolar(tipo, datos, ejecutar_en, clave)
+    except Exception as e:
+        print(f"Error al encolar el trabajo '{tipo}': {e}")
+
+
+def programar_notificaciones_cita(id_cita, fecha, hora):
+    """Confirmación inmediata y recordatorio RECORDATORIO_HORAS_ANTES de la cita (si todavía falta tanto)."""
+    datos = {'id_cita': int(id_cita), 'sucursal': sucursal_actual()}
+    encolar_trabajo('confirmacion_cita', datos)
+    inicio = datetime.fromisoformat(f"{normalizar_fecha(fecha)} {normalizar_hora(hora)}")
+    recordar = inicio - timedelta(hours=app.config['RECORDATORIO_HORAS_ANTES'])
+    if recordar > datetime.now():
+        encolar_trabajo('recordatorio_cita', datos, recordar.timestamp(),
+                        clave=f'recordatorio:{sucursal_actual()}:{int(id_cita)}')
+
+
+def cancelar_recordatorio(id_cita):
+    try:
+        obtener_cola_trabajos().cancelar(f'recordatorio:{sucursal_actual()}:{int(id_cita)}')
+    except Exception as e:
+        print(f"Error al cancelar el recordatorio de la cita {id_cita}: {e}")
+
+
+def _datos_cita(datos):
+    """(Nombre, Correo, Servicio, Estilista, Fecha, Hora, Estado) de la cita, leídos desde el hilo trabajador."""
+    # Los trabajos encolados antes de haber sucursales no la traen: son de la principal
+    with en_sucursal(datos.get('sucursal', app.config['SUCURSAL_PRINCIPAL'])):
+        conn = obtener_conexion()
+        if conn is None:
+            raise RuntimeError("Sin conexión con la BD.")  # se reintenta más tarde
+        cursor = conn.cursor()
+        cursor.execute("""
+        SELECT CL.Nombre, CL.Correo, S.NombreServicio, E.Nombre, C.Fecha, C.Hora, C.Estado
+        FROM CITA C
+        JOIN CLIENTE CL ON C.IDCliente = CL.IDCliente
+        JOIN SERVICIO S ON C.IDServicio = S.IDServicio
+        JOIN ESTILISTA E ON C.IDEstilista = E.IDEstilista
+        WHERE C.IDCita = ?
+        """, datos['id_cita'])
+        return cursor.fetchone()
+
+
+def _notificar_cita(datos, mensaje, estados_validos):
+    # La consulta libera la conexión antes de hablar con el servidor de correo
+    fila = _datos_cita(datos)
+    if fila is None or not fila[1] or fila[6] not in estados_validos:
+        return  # cita borrada, cliente sin correo o cita que ya no aplica: nada que enviar
+    nombre, correo, servicio, estilista, fecha, hora = fila[:6]
+    asunto, cuerpo = mensaje(nombre, servicio, estilista, normalizar_fecha(fecha), hora_ampm(minutos(hora)))
+    obtener_enviador().enviar(correo, asunto, cuerpo)
+
+
+def trabajo_confirmacion_cita(datos):
+    _notificar_cita(datos, notificaciones.confirmacion_cita, ('Pendiente', 'En Proceso'))
+
+
+def trabajo_recordatorio_cita(datos):
+    _notificar_cita(datos, notificaciones.recordatorio_cita, ('Pendiente',))
+
+
+def trabajo_bienvenida(datos):
+    asunto, cuerpo = notificaciones.bienvenida(datos['nombre'])
+    obtener_enviador().enviar(datos['correo'], asunto, cuerpo)
+
+
+MANEJADORES_TRABAJOS = {
+    'confirmacion_cita': trabajo_confirmacion_cita,
+    'recordatorio_cita': trabajo_recordatorio_cita,
+    'bienvenida': trabajo_bienvenida,
+}
+
+
+@app.cli.command('trabajos')
+@click.option('--hilos', default=2, show_default=True, help='Hilos trabajadores.')
+def trabajos_cmd(hilos):
+    """Procesa la cola de trabajos en primer plano (con ROSSY_TRABAJOS_HILOS=0 en los procesos web)."""
+    grupo = trabajos.GrupoTrabajadores(obtener_cola_trabajos(), MANEJADORES_TRABAJOS, hilos=hilos)
+    grupo.arrancar()
+    click.echo(f"Procesando la cola {app.config['TRABAJOS_SQLITE_PATH']} con {hilos} hilos (Ctrl+C para salir).")
+    grupo.unirse()
+
+
+# -------------------------------------------------------------------
+# --- LISTA DE ESPERA: RELLENO DE HORARIOS CANCELADOS ---
+# -------------------------------------------------------------------
+
+def obtener_emparejador(conn):
+    """
+    Emparejador de la lista de espera del proceso, armado con las solicitudes activas
+    y rearmado cada ESPERA_RECARGA segundos para ver las que se anotaron en otros
+    procesos. None si LISTA_ESPERA todavía no existe ('flask migrar').
+    """
+    actual = extensiones_sucursal().get('lista_espera')
+    if actual is not None and datetime.now() - actual[1] < timedelta(seconds=app.config['ESPERA_RECARGA']):
+        return actual[0]
+    if not tabla_disponible(conn, 'LISTA_ESPERA'):
+        return None
+    emparejador = espera.EmparejadorEspera(app.config['PASO_AGENDA'])
+    for solicitud in espera.cargar_activas(conn.cursor()):
+        emparejador.agregar(solicitud, duracion_servicio(solicitud.id_servicio))
+    extensiones_sucursal()['lista_espera'] = (emparejador, datetime.now())
+    return emparejador
+
+
+def asignar_desde_espera(cursor, solicitud, id_estilista, fecha, hora):
+    """INSERT de la cita y paso de la solicitud a 'Asignada', en la misma transacción."""
+    id_cita = insertar_cita(cursor, solicitud.id_cliente, id_estilista, solicitud.id_servicio, fecha, hora)
+    espera.marcar_asignada(cursor, solicitud.id, id_cita)
+    return id_cita
+
+
+def rellenar_horario(conn, id_estilista, fecha, hora, duracion):
+    """
+    Ofrece el tramo [hora, hora + duracion) que acaba de liberarse a las solicitudes de
+    la lista de espera, de la mejor a la peor, y agenda la cita a la primera que cabe
+    (y a otras, si el tramo alcanza). Devuelve los IDCita creados.
+    """
+    fecha = normalizar_fecha(fecha)
+    limite = datetime.now() + timedelta(minutes=app.config['ESPERA_ANTELACION_MIN'])
+    if datetime.fromisoformat(f"{fecha} {normalizar_hora(hora)}") < limite:
+        return []  # horario pasado o inminente (p. ej. una inasistencia marcada al cierre)
+    emparejador = obtener_emparejador(conn)
+    if emparejador is None:
+        return []
+
+    indice = obtener_disponibilidad()
+    inicio = minutos(hora)
+    creadas = []
+    for solicitud, minuto in emparejador.candidatos(id_estilista, fecha, inicio, inicio + duracion):
+        hora_inicio = hora_de_minutos(minuto)
+        duracion_solicitud = duracion_servicio(solicitud.id_servicio)
+        try:
+            if not indice.reservar(id_estilista, fecha, hora_inicio, duracion_solicitud):
+                continue  # no cabe: el tramo ya lo tomó otra solicitud o choca con la cita siguiente
+        except ValueError:
+            continue  # se sale de la jornada del estilista
+        try:
+            id_cita = ejecutar_escritura(conn, lambda cursor: asignar_desde_espera(
+                cursor, solicitud, id_estilista, fecha, hora_inicio))
+        except Exception as e:
+            indice.liberar(id_estilista, fecha, hora_inicio, duracion_solicitud)
+            if isinstance(e, espera.YaAsignada):
+                emparejador.quitar(solicitud.id)
+            else:
+                print(f"Error al asignar la solicitud de espera {solicitud.id}: {e}")
+            continue
+        emparejador.quitar(solicitud.id, asignada=True)
+        marcar_escritura('CITA')
+        publicar_nueva_cita(conn.cursor(), id_cita, solicitud.id_cliente, solicitud.id_servicio, id_estilista,
+                            fecha, hora_inicio)
+        programar_notificaciones_cita(id_cita, fecha, hora_inicio)
+        creadas.append(id_cita)
+    return creadas
+
+
+@app.route('/lista_espera', methods=['POST'])
+@idempotente
+def anotar_lista_espera():
+    """El cliente se anota para un servicio (con un estilista o cualquiera) en un rango de fechas y horas."""
+    if session.get('rol') != 'Cliente' or not session.get('id_usuario'):
+        return redirect(url_for('index'))
+
+    id_estilista = request.form.get('id_estilista') or None  # "" = cualquiera
+    try:
+        fila = {
+            'IDCliente': int(session['id_usuario']),
+            'IDServicio': int(request.form.get('id_servicio')),
+            'IDEstilista': int(id_estilista) if id_estilista else None,
+            'FechaDesde': normalizar_fecha(request.form.get('fecha_desde')),
+            'FechaHasta': normalizar_fecha(request.form.get('fecha_hasta')),
+            'HoraDesde': normalizar_hora(request.form.get('hora_desde')),
+            'HoraHasta': normalizar_hora(request.form.get('hora_hasta')),
+        }
+        espera.validar(fila['FechaDesde'], fila['FechaHasta'], fila['HoraDesde'], fila['HoraHasta'],
+                       duracion_servicio(fila['IDServicio']))
+    except (TypeError, ValueError) as e:
+        return redirect(url_for('perfil_cliente', error=f"Datos de la lista de espera no válidos: {e}"))
+
+    conn = obtener_conexion()
+    if conn is None:
+        return redirect(url_for('perfil_cliente', error="Error de conexión con la BD."))
+    emparejador = obtener_emparejador(conn)
+    if emparejador is None:
+        return redirect(url_for('perfil_cliente', error="La lista de espera no está disponible."))
+    try:
+        id_espera = ejecutar_escritura(conn, lambda cursor: conexiones.insertar_devolviendo_id(
+            cursor, obtener_pool().backend.nombre, 'LISTA_ESPERA', fila, 'IDEspera'))
+    except Exception as e:
+        return redirect(url_for('perfil_cliente', error=f"Error al anotarse en la lista de espera: {e}"))
+    emparejador.agregar(espera.Solicitud(id_espera, fila['IDCliente'], fila['IDServicio'], fila['IDEstilista'],
+                                         fila['FechaDesde'], fila['FechaHasta'], fila['HoraDesde'], fila['HoraHasta']),
+                        duracion_servicio(fila['IDServicio']))
+    return redirect(url_for('perfil_cliente', success="Quedaste en la lista de espera. Si se libera un horario que te "
+                                                      "sirva, la cita se agenda sola y aparece en tus próximas citas."))
+
+
+@app.route('/lista_espera/<int:id_espera>/cancelar', methods=['POST'])
+def cancelar_lista_espera(id_espera):
+    """El cliente retira una de sus solicitudes activas."""
+    if session.get('rol') != 'Cliente' or not session.get('id_usuario'):
+        return redirect(url_for('index'))
+    conn = obtener_conexion()
+    if conn is None:
+        return redirect(url_for('perfil_cliente', error="Error de conexión con la BD."))
+    try:
+        cancelada = ejecutar_escritura(conn, lambda cursor: espera.cancelar(cursor, id_espera, session['id_usuario']))
+    except Exception as e:
+        return redirect(url_for('perfil_cliente', error=f"Error al salir de la lista de espera: {e}"))
+    if not cancelada:
+        return redirect(url_for('perfil_cliente', error="La solicitud ya no está activa."))
+    emparejador = obtener_emparejador(conn)
+    if emparejador is not None:
+        emparejador.quitar(id_espera)
+    return redirect(url_for('perfil_cliente', success="Saliste de la lista de espera."))
+
+
 # -------------------------------------------------------------------
 # --- 3. FUNCIONES DE UTILIDAD DE SEGURIDAD ---
 # -------------------------------------------------------------------
@@ -88,6 +1041,17 @@ def generar_contrasena(longitud=8):
 # --- 4. RUTAS DE AUTENTICACIÓN Y REGISTRO PÚBLICO ---
 # -------------------------------------------------------------------
 
+def sucursal_formulario():
+    """Sucursal elegida en el formulario (login, registro), o la principal si hay una sola. None si no es válida."""
+    if len(SUCURSALES) == 1:
+        return next(iter(SUCURSALES))
+    try:
+        id_sucursal = int(request.form.get('sucursal'))
+    except (TypeError, ValueError):
+        return None
+    return id_sucursal if id_sucursal in SUCURSALES else None
+
+
 @app.route('/')
 def index():
     """Muestra el login al inicio o redirige si hay sesión activa."""
@@ -102,6 +1066,36 @@ def index():
     return render_template('login.html')
 
 
+def insertar_cliente(cursor, nombre, telefono, correo, contrasena, hash_contrasena=None):
+    """
+    INSERT del cliente que devuelve su IDCliente (sin SELECT posterior) y suma el día en RESUMEN_DIARIO.
+    Con 'hash_contrasena' la clave va solo a CREDENCIAL y CLIENTE.contraseña queda vacía.
+    """
+    id_cliente = conexiones.insertar_devolviendo_id(cursor, obtener_pool().backend.nombre, 'CLIENTE', {
+        'Nombre': nombre, 'Telefono': telefono, 'Correo': correo, 'FechaRegistro': date.today(),
+        'contraseña': '' if hash_contrasena else contrasena}, 'IDCliente')
+    if hash_contrasena:
+        credenciales.guardar(cursor, correo, 'Cliente', id_cliente, hash_contrasena)
+    actualizar_resumen(metricas.registrar_cliente_nuevo, cursor, date.today())
+    return id_cliente
+
+
+def hash_para_registro(conn, contrasena):
+    """Hash de la clave de un cliente nuevo, o None si CREDENCIAL todavía no existe."""
+    if not tabla_disponible(conn, 'CREDENCIAL'):
+        return None
+    return credenciales.crear_hash(contrasena, app.config['CREDENCIAL_METODO'])
+
+
+def insertar_cita(cursor, id_cliente, id_estilista, id_servicio, fecha, hora):
+    """INSERT de la cita 'Pendiente' que devuelve su IDCita y suma el día en RESUMEN_DIARIO."""
+    id_cita = conexiones.insertar_devolviendo_id(cursor, obtener_pool().backend.nombre, 'CITA', {
+        'IDCliente': id_cliente, 'IDEstilista': id_estilista, 'IDServicio': id_servicio,
+        'Fecha': fecha, 'Hora': hora, 'Estado': 'Pendiente'}, 'IDCita')
+    actualizar_resumen(metricas.registrar_cita, cursor, fecha)
+    return id_cita
+
+
 @app.route('/register')
 def vista_registro():
     """Muestra la interfaz de registro (register.html)."""
@@ -109,38 +1103,36 @@ def vista_registro():
 
 
 @app.route('/register', methods=['POST'])
+@idempotente
 def register():
     """Procesa el formulario, registra un nuevo CLIENTE y asigna una contraseña automática."""
+    g.sucursal = sucursal_formulario()
+    if g.sucursal is None:
+        return render_template('register.html', error="Selecciona una sucursal válida.")
     conn = obtener_conexion()
     if conn is None: return render_template('register.html', error="Error: No se pudo conectar con la BD.")
 
     try:
-        cursor = conn.cursor()
-
         nombre_completo = request.form.get('nombre') + " " + request.form.get('apellido')
         telefono = request.form.get('telefono')
-        correo = request.form.get('correo')
+        correo = credenciales.normalizar_correo(request.form.get('correo'))
 
         # 1. GENERAR CONTRASEÑA SEGURA
         nueva_contrasena = generar_contrasena()
 
-        # 2. INSERTAR EL NUEVO CLIENTE (Incluyendo el nuevo campo 'contraseña')
-        insert_query = """
-        INSERT INTO CLIENTE (Nombre, Telefono, Correo, FechaRegistro, contraseña) 
-        VALUES (?, ?, ?, ?, ?)
-        """
+        # 2 y 3. INSERTAR EL NUEVO CLIENTE Y OBTENER SU ID EN EL MISMO VIAJE (CRÍTICO para agendar_cita)
         # IMPORTANTE: Estamos asumiendo que el nombre de tu columna es 'contraseña'
-        cursor.execute(insert_query, nombre_completo, telefono, correo, date.today(), nueva_contrasena)
-
-        # 3. OBTENER EL ID DEL CLIENTE RECIÉN CREADO (CRÍTICO para agendar_cita)
-        select_id_query = "SELECT IDCliente FROM CLIENTE WHERE Correo = ? AND Telefono = ?"
-        cursor.execute(select_id_query, correo, telefono)
-        id_cliente = cursor.fetchone()[0]
-
-        conn.commit()
+        hash_contrasena = hash_para_registro(conn, nueva_contrasena)
+        id_cliente = ejecutar_escritura(conn, lambda cursor: insertar_cliente(
+            cursor, nombre_completo, telefono, correo, nueva_contrasena, hash_contrasena))
+        marcar_escritura('CLIENTE')
+        obtener_cache_negativa().olvidar(correo)
+        obtener_indice_clientes().agregar(id_cliente, nombre_completo, telefono, correo, date.today())
+        encolar_trabajo('bienvenida', {'nombre': nombre_completo, 'correo': correo})
 
         # 4. ESTABLECER SESIÓN COMPLETA
         session['rol'] = 'Cliente'
+        session['id_sucursal'] = g.sucursal
         session['nombre'] = nombre_completo
         session['id_usuario'] = id_cliente
 
@@ -148,7 +1140,7 @@ def register():
         return redirect(url_for('perfil_cliente',
                                 success=f"Registro exitoso. Tu clave de acceso es: {nueva_contrasena}. Por favor, anótala."))
 
-    except pyodbc.IntegrityError:
+    except conexiones.IntegrityError:
         return render_template('register.html', error="El correo o teléfono ya están registrados.")
     except Exception as e:
         return render_template('register.html', error=f"Error al registrar: {e}")
@@ -158,73 +1150,91 @@ def register():
 def login():
     """
     Procesa el login, guardando el ID de usuario y redirigiendo según el Rol.
-    Ahora, para el Cliente, usa la columna 'contraseña' para la verificación.
+    Clientes y estilistas se buscan por correo en una sola consulta y la clave se
+    compara contra su hash en CREDENCIAL. Una cuenta sin migrar se valida contra
+    'contraseña' (Cliente) o Telefono (Estilista) y en ese momento se guarda su hash.
     """
-    correo = request.form.get('correo')
-    password = request.form.get('password')  # Clave ingresada por el usuario (cliente, estilista, etc.)
-    conn = obtener_conexion()
-    if conn is None: return render_template('login.html', error="Error de BD.")
-
-    try:
-        cursor = conn.cursor()
-        nombre_db = None
-        rol_db = None
-        id_db = None
-        usuario = None
-
-        # 1. CHECK SYSTEM ROLES (Administradora/Recepcionista)
-        if correo == 'admin@rossysalon.com' and password == '12345':
-            rol_db = "Administradora"
-            nombre_db = "Dueña Rossy"
-            id_db = 0
-        elif correo == 'recepcion@rossysalon.com' and password == '123':
-            rol_db = "Recepcionista"
-            nombre_db = "Recepción"
-            id_db = 0
-
-        # 2. IF NOT A SYSTEM ROLE, CHECK DATABASE USERS
-        if not rol_db:
-
-            # A. Check Cliente (usando Correo y la columna 'contraseña')
-            query_cliente = "SELECT IDCliente, Nombre, 'Cliente' AS Rol FROM CLIENTE WHERE Correo = ? AND contraseña = ?"
-            cursor.execute(query_cliente, (correo, password))
-            usuario = cursor.fetchone()
-
-            if usuario is not None:
-                id_db, nombre_db, rol_db = usuario
-            else:
-                # B. Check Estilista (asumiendo que sigue usando Correo y Telefono/Contraseña de Estilista)
-                # Si los Estilistas también usan la nueva columna 'contraseña', adapta esta consulta:
-                # query_estilista = "SELECT IDEstilista, Nombre, 'Estilista' AS Rol FROM ESTILISTA WHERE Correo = ? AND contraseña = ?"
-                query_estilista = "SELECT IDEstilista, Nombre, 'Estilista' AS Rol FROM ESTILISTA WHERE Correo = ? AND Telefono = ?"
-                cursor.execute(query_estilista, (correo, password))
-                usuario = cursor.fetchone()
-
-                if usuario is not None:
-                    id_db, nombre_db, rol_db = usuario
-
-        # 3. FINAL VERIFICATION AND SESSION START
-        if rol_db is None:
-            return render_template('login.html', error="Credenciales incorrectas o usuario no registrado.")
-
-        # Establecer la sesión
-        session['rol'] = rol_db
-        session['nombre'] = nombre_db
-        if id_db is not None:
-            session['id_usuario'] = id_db
-
-        # 4. REDIRECTION
-        endpoint = ROLE_ENDPOINT_MAP.get(rol_db)
-        if endpoint:
-            return redirect(url_for(endpoint))
-        else:
-            return render_template('login.html', error="Rol de usuario no reconocido en el sistema.")
-
-    except pyodbc.Error as ex:
-        return render_template('login.html', error=f"Error en la BD: {ex}")
+    # Un solo valor normalizado para la búsqueda, CREDENCIAL, la caché negativa y el límite por cuenta
+    correo = credenciales.normalizar_correo(request.form.get('correo')) or ''
+    password = request.form.get('password') or ''  # Clave ingresada por el usuario (cliente, estilista, etc.)
+    # Las cuentas de clientes y estilistas viven en la BD de su sucursal
+    g.sucursal = sucursal_formulario()
+    if g.sucursal is None:
+        return render_template('login.html', error="Selecciona una sucursal válida.")
+
+    # 0. LÍMITE DE INTENTOS: por IP (todos los intentos) y por cuenta (solo los fallidos)
+    limite_ip, limite_cuenta = obtener_limitadores_login()
+    espera = max(limite_ip.espera(f'ip:{request.remote_addr}'),
+                 limite_cuenta.espera(f'cuenta:{g.sucursal}:{correo}'))
+    if espera:
+        return render_template('login.html', error=f"Demasiados intentos. Vuelve a intentarlo en {espera} segundos."), \
+            429, {'Retry-After': str(espera)}
+    limite_ip.consumir(f'ip:{request.remote_addr}')
+
+    nombre_db = None
+    rol_db = None
+    id_db = None
+
+    # 1. CHECK SYSTEM ROLES (Administradora/Recepcionista)
+    if correo == 'admin@rossysalon.com' and password == '12345':
+        rol_db = "Administradora"
+        nombre_db = "Dueña Rossy"
+        id_db = 0
+    elif correo == 'recepcion@rossysalon.com' and password == '123':
+        rol_db = "Recepcionista"
+        nombre_db = "Recepción"
+        id_db = 0
+
+    # 2. IF NOT A SYSTEM ROLE, CHECK DATABASE USERS
+    if not rol_db and obtener_cache_negativa().contiene(correo):
+        # Correo inexistente: no se consulta la BD, pero se compara contra un hash igual de caro
+        credenciales.verificar([], password, app.config['CREDENCIAL_METODO'])
+    elif not rol_db:
+        conn = obtener_conexion()
+        if conn is None: return render_template('login.html', error="Error de BD.")
+        try:
+            # A. Credencial, Cliente y Estilista con ese correo, en un solo viaje
+            con_credencial = tabla_disponible(conn, 'CREDENCIAL')
+            filas = credenciales.buscar(conn.cursor(), correo, con_credencial)
+        except conexiones.DatabaseError as ex:
+            return render_template('login.html', error=f"Error en la BD: {ex}")
+        if not filas:
+            obtener_cache_negativa().agregar(correo)
+
+        # B. Verificación del hash (o de la clave sin migrar)
+        usuario = credenciales.verificar(filas, password, app.config['CREDENCIAL_METODO'])
+        if usuario is not None:
+            rol_db, id_db, nombre_db, hash_nuevo = usuario
+            if hash_nuevo and con_credencial:
+                # Cuenta sin migrar o con otro factor de trabajo: si falla, el login sigue igual
+                try:
+                    ejecutar_escritura(conn, lambda cursor: credenciales.guardar(
+                        cursor, correo, rol_db, id_db, hash_nuevo))
+                except Exception as e:
+                    print(f"Error al guardar la credencial de {correo}: {e}")
+
+    # 3. FINAL VERIFICATION AND SESSION START
+    if rol_db is None:
+        limite_cuenta.consumir(f'cuenta:{g.sucursal}:{correo}')
+        return render_template('login.html', error="Credenciales incorrectas o usuario no registrado.")
+
+    # Establecer la sesión
+    session['rol'] = rol_db
+    session['nombre'] = nombre_db
+    session['id_sucursal'] = g.sucursal
+    if id_db is not None:
+        session['id_usuario'] = id_db
+
+    # 4. REDIRECTION
+    endpoint = ROLE_ENDPOINT_MAP.get(rol_db)
+    if endpoint:
+        return redirect(url_for(endpoint))
+    else:
+        return render_template('login.html', error="Rol de usuario no reconocido en el sistema.")
 
 
 @app.route('/agendar_cita', methods=['POST'])
+@idempotente
 def agendar_cita():
     """Valida la disponibilidad de horario y registra la cita (desde el Cliente)."""
     # 1. Verificar sesión de cliente
@@ -245,46 +1255,125 @@ def agendar_cita():
     if not all([id_cliente, id_servicio, id_estilista, fecha, hora]):
         return redirect(url_for('perfil_cliente', error="Faltan datos de la cita."))
 
+    # Misma forma canónica que usan el índice de disponibilidad y las sugerencias ('HH:MM' y 'HH:MM:SS' son la misma hora)
+    try:
+        fecha, hora = normalizar_fecha(fecha), normalizar_hora(hora)
+    except ValueError:
+        return redirect(url_for('perfil_cliente', error="Fecha u hora no válidas."))
+
     conn = obtener_conexion()
     if conn is None:
         return redirect(url_for('perfil_cliente', error="Error de conexión con la BD."))
 
+    indice = obtener_disponibilidad()
+    reservado = False
     try:
-        cursor = conn.cursor()
+        # 3. VERIFICACIÓN DE CONFLICTO (CÓDIGO ANTI-CHOQUE): reserva atómica del intervalo en el índice en memoria
+        duracion = duracion_servicio(id_servicio)
+        reservado = indice.reservar(int(id_estilista), fecha, hora, duracion)
+        if not reservado:
+            return redirect(url_for('perfil_cliente', error="El estilista ya tiene una cita que se cruza con ese horario. "
+                                                              "Puedes anotarte en la lista de espera."))
+
+        # 4. REGISTRAR CITA (el INSERT devuelve el IDCita)
+        id_cita = ejecutar_escritura(conn, lambda cursor: insertar_cita(
+            cursor, id_cliente, int(id_estilista), int(id_servicio), fecha, hora))
+        reservado = False  # confirmada: el intervalo ya es de la cita, pase lo que pase después
+        marcar_escritura('CITA')
+        publicar_nueva_cita(conn.cursor(), id_cita, id_cliente, id_servicio, id_estilista, fecha, hora,
+                            session.get('nombre'))
+        programar_notificaciones_cita(id_cita, fecha, hora)
 
-        # 3. LÓGICA DE VERIFICACIÓN DE CONFLICTO (CÓDIGO ANTI-CHOQUE)
-        conflict_query = """
-        SELECT COUNT(*) 
-        FROM CITA 
-        WHERE IDEstilista = ? 
-          AND Fecha = ? 
-          AND Hora = ?
-          AND Estado IN ('Pendiente', 'Realizada') 
-        """
-        cursor.execute(conflict_query, int(id_estilista), fecha, hora)
+        # 5. Éxito
+        return redirect(url_for('perfil_cliente', success="Cita agendada con éxito."))
+
+    except Exception as e:
+        # Si el INSERT falló (o se canceló por timeout sin hacerse), el intervalo vuelve a quedar libre
+        if reservado:
+            indice.liberar(int(id_estilista), fecha, hora, duracion)
+        return redirect(url_for('perfil_cliente', error=f"Error al agendar: {e}"))
+
+
+@app.route('/api/horarios_libres')
+def api_horarios_libres():
+    """
+    Devuelve en JSON los primeros N horarios (estilista, fecha, hora_24) en los que cabe
+    el servicio completo, dentro de la jornada de cada estilista, en un rango de fechas,
+    opcionalmente filtrado por estilista.
+    Parámetros: id_servicio, fecha_desde, fecha_hasta (por defecto = fecha_desde),
+    id_estilista (opcional) y limite (por defecto 10, máximo 100).
+    """
+    if session.get('rol') not in ['Cliente', 'Recepcionista']:
+        return jsonify(error="Sesión no válida."), 401
+
+    try:
+        id_servicio = int(request.args['id_servicio'])
+        fecha_desde = date.fromisoformat(request.args.get('fecha_desde') or date.today().isoformat())
+        fecha_hasta = date.fromisoformat(request.args.get('fecha_hasta') or fecha_desde.isoformat())
+        id_estilista = request.args.get('id_estilista')
+        id_estilista = int(id_estilista) if id_estilista else None
+        limite = min(int(request.args.get('limite', 10)), 100)
+    except (KeyError, ValueError):
+        return jsonify(error="Parámetros inválidos."), 400
 
-        if cursor.fetchone()[0] > 0:
-            return redirect(url_for('perfil_cliente', error="El estilista ya tiene una cita agendada a esa hora."))
+    if limite < 1:
+        return jsonify(error="El límite debe ser al menos 1."), 400
+
+    if fecha_hasta < fecha_desde or (fecha_hasta - fecha_desde).days > 62:
+        return jsonify(error="El rango de fechas debe ser válido y de máximo 62 días."), 400
+
+    conn = obtener_conexion()
+    if conn is None:
+        return jsonify(error="Error de conexión con la BD."), 503
 
-        # 4. REGISTRAR CITA
-        insert_query = """
-        INSERT INTO CITA (IDCliente, IDEstilista, IDServicio, Fecha, Hora, Estado)
-        VALUES (?, ?, ?, ?, ?, 'Pendiente')
+    try:
+        cursor = conn.cursor()
+
+        # 1. Estilistas candidatos (desde la caché de catálogos)
+        estilistas = [fila for fila in obtener_estilistas()
+                      if id_estilista is None or fila[0] == id_estilista]
+
+        # 2. Todas las citas activas del rango en una sola consulta
+        marcas_estado = ', '.join('?' for _ in estados.ESTADOS_ACTIVOS)
+        ocupadas_query = f"""
+        SELECT IDEstilista, Fecha, Hora, IDServicio
+        FROM CITA
+        WHERE Fecha BETWEEN ? AND ?
+          AND Estado IN ({marcas_estado})
         """
-        cursor.execute(insert_query, id_cliente, int(id_estilista), int(id_servicio), fecha, hora)
-        conn.commit()
+        params = [fecha_desde, fecha_hasta, *estados.ESTADOS_ACTIVOS]
+        if id_estilista is not None:
+            ocupadas_query += " AND IDEstilista = ?"
+            params.append(id_estilista)
+        cursor.execute(ocupadas_query, params)
 
-        # 5. Éxito
-        return redirect(url_for('perfil_cliente', success="Cita agendada con éxito."))
+        ocupadas = [(id_est, fecha, hora, duracion_servicio(id_serv))
+                    for id_est, fecha, hora, id_serv in cursor.fetchall()]
+
+        # 3. Huecos de cada jornada donde cabe la duración del servicio
+        jornadas = obtener_jornadas()
+        libres = buscar_slots_libres(estilistas, ocupadas, fecha_desde, fecha_hasta, jornadas.turnos,
+                                     duracion_servicio(id_servicio), app.config['PASO_AGENDA'], limite)
+        return jsonify(id_servicio=id_servicio, horarios=libres)
 
     except Exception as e:
-        return redirect(url_for('perfil_cliente', error=f"Error al agendar: {e}"))
+        print(f"Error al buscar horarios libres: {e}")
+        return jsonify(error=f"Error al buscar horarios: {e}"), 500
 
 
 # -------------------------------------------------------------------
 # --- 5. RUTAS DE RECEPCIONISTA ---
 # -------------------------------------------------------------------
 
+def cargar_agenda_dia(conn, fecha):
+    """Citas del día para la agenda de recepción ([] si la BD falla, como antes del fragmento)."""
+    try:
+        return paginas.pagina_recepcion(conn.cursor(), obtener_pool().backend.nombre, fecha)
+    except Exception as e:
+        print(f"Error al cargar la agenda del día: {e}")
+        return []
+
+
 @app.route('/recepcion')
 def agenda_recepcion():
     """Ruta para la Recepcionista: Muestra la agenda del día, servicios y estilistas."""
@@ -298,40 +1387,25 @@ def agenda_recepcion():
 
         if conn:
             try:
-                cursor = conn.cursor()
+                # 1. Agenda del Día: se consulta solo si el fragmento 'agenda_dia' no está en caché
+                citas_hoy = fragmentos.ListaPerezosa(lambda: cargar_agenda_dia(conn, fecha_hoy))
 
-                # 1. Agenda del Día
-                agenda_query = """
-                SELECT C.IDCita, C.Hora, C.Estado, CL.Nombre AS Cliente, S.NombreServicio, E.Nombre AS Estilista
-                FROM CITA C
-                JOIN CLIENTE CL ON C.IDCliente = CL.IDCliente
-                JOIN SERVICIO S ON C.IDServicio = S.IDServicio
-                JOIN ESTILISTA E ON C.IDEstilista = E.IDEstilista
-                WHERE C.Fecha = ?
-                ORDER BY C.Hora
-                """
-                cursor.execute(agenda_query, fecha_hoy)
-                citas_hoy = row_to_list(cursor.fetchall())
+                # 2. Obtener Servicios (para el formulario de agendamiento, desde la caché)
+                # Solo (IDServicio, NombreServicio) para que coincida con el bucle Jinja de 2 variables.
+                servicios = [(id_servicio, nombre) for id_servicio, nombre, _ in obtener_servicios()]
 
-                # 2. Obtener Servicios (para el formulario de agendamiento)
-                query_servicios = "SELECT IDServicio, NombreServicio FROM SERVICIO ORDER BY NombreServicio"
-                cursor.execute(query_servicios)
-                servicios = row_to_list(cursor.fetchall())
-
-                # 3. Obtener Estilistas (para el formulario de agendamiento)
-                # CORRECCIÓN: Se revierte la consulta para solo obtener 2 valores
-                # (IDEstilista, Nombre) para que coincida con el bucle Jinja de 2 variables.
-                query_estilistas = "SELECT IDEstilista, Nombre FROM ESTILISTA WHERE Estado = 'Activo' ORDER BY Nombre"
-                cursor.execute(query_estilistas)
-                estilistas = row_to_list(cursor.fetchall())
+                # 3. Obtener Estilistas activos (IDEstilista, Nombre) desde la caché
+                estilistas = obtener_estilistas()
 
             except Exception as e:
                 print(f"Error al cargar la agenda o catálogos: {e}")
 
-        # Se eliminan los clientes encontrados de la sesión después de cargarlos
-        clientes_encontrados = session.pop('clientes_encontrados', None)
+        # Se eliminan los clientes encontrados (guardados por referencia) después de cargarlos
+        clientes_encontrados = app.session_interface.obtener_valor(
+            session.pop('clientes_encontrados_ref', None), borrar=True)
         id_cliente_seleccionado = session.pop('id_cliente_seleccionado', None)
         nombre_cliente_seleccionado = session.pop('nombre_cliente_seleccionado', None)
+        reporte_serie = app.session_interface.obtener_valor(session.pop('reporte_serie_ref', None), borrar=True)
 
         return render_template('recepcionista.html',
                                citas_hoy=citas_hoy,
@@ -341,6 +1415,9 @@ def agenda_recepcion():
                                clientes_encontrados=clientes_encontrados,
                                id_cliente_seleccionado=id_cliente_seleccionado,
                                nombre_cliente_seleccionado=nombre_cliente_seleccionado,
+                               reporte_serie=reporte_serie,
+                               max_semanas=series.MAX_SEMANAS,
+                               max_ocurrencias=series.MAX_OCURRENCIAS,
                                horas=app.config.get('HOURS'),
                                error=request.args.get('error'),
                                success=request.args.get('success'))
@@ -348,6 +1425,7 @@ def agenda_recepcion():
 
 
 @app.route('/registrar_cliente_recepcion', methods=['POST'])
+@idempotente
 def registrar_cliente_recepcion():
     """Registra un nuevo cliente desde la vista de Recepción y lo selecciona para agendar cita.
        Ahora genera una contraseña."""
@@ -359,28 +1437,23 @@ def registrar_cliente_recepcion():
         return redirect(url_for('agenda_recepcion', error="Error: No se pudo conectar con la BD."))
 
     try:
-        cursor = conn.cursor()
-
         nombre_completo = request.form.get('nombre_registro')
         telefono = request.form.get('telefono_registro')
-        correo = request.form.get('correo_registro')
+        correo = credenciales.normalizar_correo(request.form.get('correo_registro'))
 
         # 1. GENERAR CONTRASEÑA SEGURA
         nueva_contrasena = generar_contrasena()
 
-        # 2. INSERTAR EL NUEVO CLIENTE (Incluyendo el nuevo campo 'contraseña')
-        insert_query = """
-        INSERT INTO CLIENTE (Nombre, Telefono, Correo, FechaRegistro, contraseña) 
-        VALUES (?, ?, ?, ?, ?)
-        """
-        cursor.execute(insert_query, nombre_completo, telefono, correo, date.today(), nueva_contrasena)
-
-        # 3. OBTENER EL ID Y NOMBRE DEL CLIENTE RECIÉN CREADO
-        select_id_query = "SELECT IDCliente, Nombre FROM CLIENTE WHERE Correo = ? AND Teléfono = ?"
-        cursor.execute(select_id_query, correo, telefono)
-        id_cliente, nombre_cliente = cursor.fetchone()
-
-        conn.commit()
+        # 2 y 3. INSERTAR EL NUEVO CLIENTE Y OBTENER SU ID EN EL MISMO VIAJE
+        hash_contrasena = hash_para_registro(conn, nueva_contrasena)
+        id_cliente = ejecutar_escritura(conn, lambda cursor: insertar_cliente(
+            cursor, nombre_completo, telefono, correo, nueva_contrasena, hash_contrasena))
+        nombre_cliente = nombre_completo
+        marcar_escritura('CLIENTE')
+        obtener_cache_negativa().olvidar(correo)
+        obtener_indice_clientes().agregar(id_cliente, nombre_cliente, telefono, correo, date.today())
+        if correo:
+            encolar_trabajo('bienvenida', {'nombre': nombre_cliente, 'correo': correo})
 
         # 4. SELECCIONAR AUTOMÁTICAMENTE EL CLIENTE PARA AGENDAR LA CITA
         session['id_cliente_seleccionado'] = id_cliente
@@ -390,7 +1463,7 @@ def registrar_cliente_recepcion():
             url_for('agenda_recepcion',
                     success=f"Cliente '{nombre_cliente}' registrado y seleccionado. Clave de acceso generada: {nueva_contrasena}. Por favor, anótala."))
 
-    except pyodbc.IntegrityError:
+    except conexiones.IntegrityError:
         return redirect(
             url_for('agenda_recepcion', error="Error de registro: El correo o teléfono ya están registrados."))
     except Exception as e:
@@ -400,55 +1473,63 @@ def registrar_cliente_recepcion():
 @app.route('/buscar', methods=['POST'])
 def buscar_cliente():
     """
-    Busca clientes por nombre o teléfono y guarda los resultados en sesión.
-    CRÍTICO: Convierte explícitamente el objeto date/datetime a cadena (string)
-             para evitar el error de serialización y el problema de .strftime() en Jinja.
+    Busca clientes por nombre o teléfono en el índice en memoria (sin LIKE '%termino%')
+    y guarda la primera página de resultados en el servidor (referencia en sesión).
     """
+    if session.get('rol') != 'Recepcionista':
+        return redirect(url_for('index'))
+
     termino = request.form.get('termino_busqueda')
-    conn = obtener_conexion()
 
     if not termino:
-        session['clientes_encontrados'] = []
+        session.pop('clientes_encontrados_ref', None)
         return redirect(url_for('agenda_recepcion'))
 
-    if conn:
-        try:
-            cursor = conn.cursor()
-            # Búsqueda por Nombre o Teléfono
-            # Columnas: 0=IDCliente, 1=Nombre, 2=Telefono, 3=Correo, 4=FechaRegistro, 5=contraseña
-            query = """
-            SELECT IDCliente, Nombre, Telefono, Correo, FechaRegistro
-            FROM CLIENTE 
-            WHERE Nombre LIKE ? OR Teléfono LIKE ?
-            """
-            termino_busqueda = f'%{termino}%'
-            cursor.execute(query, termino_busqueda, termino_busqueda)
+    try:
+        # Columnas: 0=IDCliente, 1=Nombre, 2=Telefono, 3=Correo, 4=FechaRegistro
+        total, clientes = obtener_indice_clientes().buscar(termino, limite=app.config['BUSQUEDA_POR_PAGINA'])
+        clientes_serializables = [serializar_cliente(cliente) for cliente in clientes]
 
-            raw_clientes = cursor.fetchall()
+        # Se guarda en el servidor y en la sesión solo va la referencia
+        session['clientes_encontrados_ref'] = app.session_interface.guardar_valor(
+            clientes_serializables, app.config['SESSION_VALOR_TTL'])
 
-            # --- CORRECCIÓN CRÍTICA: SERIALIZACIÓN MANUAL DE LA FECHA ---
-            clientes_serializables = []
-            for cliente_row in raw_clientes:
-                cliente_list = list(cliente_row)
+        mensaje = f"{total} clientes encontrados."
+        if total > len(clientes_serializables):
+            mensaje += f" Se muestran los {len(clientes_serializables)} más relevantes; afina la búsqueda."
+        return redirect(url_for('agenda_recepcion', success=mensaje))
 
-                # Indice 4 es FechaRegistro
-                fecha_registro = cliente_list[4]
+    except Exception as e:
+        return redirect(url_for('agenda_recepcion', error=f"Error al buscar clientes: {e}"))
 
-                # Si es un objeto de fecha (date o datetime), lo convertimos a string.
-                if isinstance(fecha_registro, (date, datetime)):
-                    cliente_list[4] = fecha_registro.strftime('%Y-%m-%d')
 
-                # Si ya es None o str, se mantiene
+@app.route('/api/clientes')
+def api_buscar_clientes():
+    """Búsqueda mientras se escribe para la pantalla de Recepción. Parámetros: q, pagina, por_pagina."""
+    if session.get('rol') != 'Recepcionista':
+        return jsonify(error="Sesión no válida."), 401
 
-                clientes_serializables.append(cliente_list)
+    termino = request.args.get('q', '').strip()
+    try:
+        pagina = max(int(request.args.get('pagina', 1)), 1)
+        por_pagina = min(max(int(request.args.get('por_pagina', app.config['BUSQUEDA_POR_PAGINA'])), 1),
+                         app.config['BUSQUEDA_LIMITE_MAX'])
+    except ValueError:
+        return jsonify(error="Parámetros inválidos."), 400
 
-            session['clientes_encontrados'] = clientes_serializables
-            return redirect(url_for('agenda_recepcion', success=f"{len(clientes_serializables)} clientes encontrados."))
+    if not termino:
+        return jsonify(total=0, pagina=pagina, por_pagina=por_pagina, clientes=[])
 
-        except Exception as e:
-            return redirect(url_for('agenda_recepcion', error=f"Error al buscar clientes: {e}"))
+    try:
+        total, clientes = obtener_indice_clientes().buscar(termino, limite=por_pagina,
+                                                           desplazamiento=(pagina - 1) * por_pagina)
+    except Exception as e:
+        print(f"Error en la búsqueda de clientes: {e}")
+        return jsonify(error=f"Error al buscar clientes: {e}"), 500
 
-    return redirect(url_for('agenda_recepcion', error="Error de conexión con la BD."))
+    columnas = ['id_cliente', 'nombre', 'telefono', 'correo', 'fecha_registro']
+    return jsonify(total=total, pagina=pagina, por_pagina=por_pagina,
+                   clientes=[dict(zip(columnas, serializar_cliente(c))) for c in clientes])
 
 
 @app.route('/seleccionar_cliente/<int:id_cliente>/<nombre_cliente>')
@@ -463,6 +1544,7 @@ def seleccionar_cliente(id_cliente, nombre_cliente):
 
 
 @app.route('/agendar_cita_recepcion', methods=['POST'])
+@idempotente
 def agendar_cita_recepcion():
     """Agrega una cita usando la información del cliente guardada en sesión."""
     if session.get('rol') != 'Recepcionista':
@@ -484,60 +1566,415 @@ def agendar_cita_recepcion():
         session['id_cliente_seleccionado'] = id_cliente
         return redirect(url_for('agenda_recepcion', error="Faltan datos de la cita."))
 
+    try:
+        fecha, hora = normalizar_fecha(fecha), normalizar_hora(hora)
+    except ValueError:
+        session['id_cliente_seleccionado'] = id_cliente
+        return redirect(url_for('agenda_recepcion', error="Fecha u hora no válidas."))
+
     conn = obtener_conexion()
     if conn is None:
         # Si falla la conexión, devolvemos el ID del cliente a la sesión
         session['id_cliente_seleccionado'] = id_cliente
         return redirect(url_for('agenda_recepcion', error="Error de conexión con la BD."))
 
+    indice = obtener_disponibilidad()
+    reservado = False
     try:
-        cursor = conn.cursor()
-
-        # 1. VERIFICACIÓN DE CONFLICTO
-        conflict_query = """
-        SELECT COUNT(*) 
-        FROM CITA 
-        WHERE IDEstilista = ? 
-          AND Fecha = ? 
-          AND Hora = ?
-          AND Estado IN ('Pendiente', 'Realizada') 
-        """
-        cursor.execute(conflict_query, id_estilista, fecha, hora)
-
-        if cursor.fetchone()[0] > 0:
+        # 1. VERIFICACIÓN DE CONFLICTO (reserva atómica del intervalo en el índice en memoria)
+        duracion = duracion_servicio(id_servicio)
+        reservado = indice.reservar(int(id_estilista), fecha, hora, duracion)
+        if not reservado:
             # Si hay conflicto, devolvemos el ID del cliente a la sesión
             session['id_cliente_seleccionado'] = id_cliente
-            return redirect(url_for('agenda_recepcion', error="El estilista ya tiene una cita agendada a esa hora."))
+            return redirect(url_for('agenda_recepcion', error="El estilista ya tiene una cita que se cruza con ese horario."))
 
-        # 2. REGISTRAR CITA
-        insert_query = """
-        INSERT INTO CITA (IDCliente, IDEstilista, IDServicio, Fecha, Hora, Estado)
-        VALUES (?, ?, ?, ?, ?, 'Pendiente')
-        """
-        cursor.execute(insert_query, id_cliente, id_estilista, id_servicio, fecha, hora)
-        conn.commit()
+        # 2. REGISTRAR CITA (el INSERT devuelve el IDCita)
+        id_cita = ejecutar_escritura(conn, lambda cursor: insertar_cita(
+            cursor, id_cliente, id_estilista, id_servicio, fecha, hora))
+        reservado = False  # confirmada: el intervalo ya es de la cita, pase lo que pase después
+        marcar_escritura('CITA')
+        publicar_nueva_cita(conn.cursor(), id_cita, id_cliente, id_servicio, id_estilista, fecha, hora)
+        programar_notificaciones_cita(id_cita, fecha, hora)
 
         # Como fue exitoso, no devolvemos el ID a la sesión (se "consume" la selección)
         return redirect(url_for('agenda_recepcion', success="Cita agendada con éxito para el cliente."))
 
     except Exception as e:
-        # En caso de error, devolvemos el ID del cliente a la sesión
+        # En caso de error, liberamos el intervalo y devolvemos el ID del cliente a la sesión
+        if reservado:
+            indice.liberar(int(id_estilista), fecha, hora, duracion)
         session['id_cliente_seleccionado'] = id_cliente
         return redirect(url_for('agenda_recepcion', error=f"Error al agendar: {e}"))
 
 
+def agendar_serie(conn, id_cliente, id_estilista, id_servicio, fechas, hora):
+    """
+    Agenda la misma cita en cada fecha de la serie:
+
+    1. Una sola consulta trae las citas del estilista en todas las fechas de la serie
+       (y los días vecinos, para las alternativas) y se cargan en el índice de
+       disponibilidad, en lugar de una consulta por fecha.
+    2. Cada fecha se reserva en memoria; las que chocan o caen fuera de la jornada
+       quedan fuera, con el horario libre más cercano como alternativa.
+    3. Las que sí se reservaron se insertan todas en una sola transacción.
+
+    Devuelve el reporte {'agendadas': [...], 'choques': [...]} para la recepción.
+    """
+    indice = obtener_disponibilidad()
+    duracion = duracion_servicio(id_servicio)
+    hora = normalizar_hora(hora)
+    vecinas = series.fechas_vecinas(fechas)
+    indice.precargar(id_estilista, series.cargar_ocupadas(conn.cursor(), id_estilista, vecinas, duracion_servicio))
+
+    reservadas, choques = [], []
+    for fecha in fechas:
+        try:
+            if indice.reservar(id_estilista, fecha, hora, duracion):
+                reservadas.append(fecha)
+            else:
+                choques.append((fecha, "El estilista ya tiene una cita que se cruza con ese horario."))
+        except ValueError as e:
+            choques.append((fecha, str(e)))
+
+    try:
+        ids = ejecutar_escritura(conn, lambda cursor: [
+            insertar_cita(cursor, id_cliente, id_estilista, id_servicio, fecha, hora) for fecha in reservadas]
+        ) if reservadas else []
+    except Exception:
+        for fecha in reservadas:
+            indice.liberar(id_estilista, fecha, hora, duracion)
+        raise
+    if ids:
+        marcar_escritura('CITA')
+        for id_cita, fecha in zip(ids, reservadas):
+            publicar_nueva_cita(conn.cursor(), id_cita, id_cliente, id_servicio, id_estilista, fecha, hora)
+            programar_notificaciones_cita(id_cita, fecha, hora)
+
+    # Alternativas: huecos del índice (ya cargado en el paso 1) alrededor de cada choque
+    ahora = datetime.now()
+    reporte = {'agendadas': [{'id_cita': int(id_cita), 'fecha': fecha.isoformat(), 'hora_ampm': hora_ampm(minutos(hora))}
+                             for id_cita, fecha in zip(ids, reservadas)],
+               'choques': []}
+    for fecha, motivo in choques:
+        libres = [(vecina.isoformat(), libre) for vecina in vecinas
+                  if abs((vecina - fecha).days) <= series.DIAS_ALTERNATIVA
+                  for libre in indice.horas_libres(id_estilista, vecina, duracion, app.config['PASO_AGENDA'])
+                  if datetime.fromisoformat(f"{vecina.isoformat()} {libre}") > ahora]
+        alternativa = series.mas_cercana(fecha, hora, libres)
+        reporte['choques'].append({
+            'fecha': fecha.isoformat(), 'motivo': motivo,
+            'alternativa': alternativa and {'fecha': alternativa[0], 'hora_24': alternativa[1],
+                                            'hora_ampm': hora_ampm(minutos(alternativa[1]))}})
+    return reporte
+
+
+@app.route('/agendar_serie_recepcion', methods=['POST'])
+@idempotente
+def agendar_serie_recepcion():
+    """Agenda una serie recurrente (cada N semanas, hasta una fecha o N veces) para el cliente seleccionado."""
+    if session.get('rol') != 'Recepcionista':
+        return redirect(url_for('index'))
+
+    id_cliente = session.pop('id_cliente_seleccionado', None)
+    if not id_cliente:
+        return redirect(url_for('agenda_recepcion', error="Debe seleccionar un cliente primero."))
+
+    try:
+        id_servicio = int(request.form.get('id_servicio'))
+        id_estilista = int(request.form.get('id_estilista'))
+        hora = normalizar_hora(request.form.get('hora'))
+        repeticiones = request.form.get('repeticiones')
+        fechas = series.fechas_serie(request.form.get('fecha'), int(request.form.get('cada_semanas')),
+                                     hasta=request.form.get('hasta') or None,
+                                     repeticiones=int(repeticiones) if repeticiones else None)
+    except (TypeError, ValueError) as e:
+        session['id_cliente_seleccionado'] = id_cliente
+        return redirect(url_for('agenda_recepcion', error=f"Datos de la serie no válidos: {e}"))
+
+    conn = obtener_conexion()
+    if conn is None:
+        session['id_cliente_seleccionado'] = id_cliente
+        return redirect(url_for('agenda_recepcion', error="Error de conexión con la BD."))
+
+    try:
+        reporte = agendar_serie(conn, id_cliente, id_estilista, id_servicio, fechas, hora)
+    except Exception as e:
+        session['id_cliente_seleccionado'] = id_cliente
+        return redirect(url_for('agenda_recepcion', error=f"Error al agendar la serie: {e}"))
+
+    session['reporte_serie_ref'] = app.session_interface.guardar_valor(reporte, app.config['SESSION_VALOR_TTL'])
+    agendadas, choques = len(reporte['agendadas']), len(reporte['choques'])
+    mensaje = f"Serie agendada: {agendadas} de {agendadas + choques} citas."
+    if choques:
+        # El cliente sigue seleccionado para agendar a mano las alternativas
+        session['id_cliente_seleccionado'] = id_cliente
+        return redirect(url_for('agenda_recepcion', error=f"{mensaje} {choques} fechas chocaron; revisa las alternativas."))
+    return redirect(url_for('agenda_recepcion', success=mensaje))
+
+
 # -------------------------------------------------------------------
 # --- 6. RUTAS DE INTERFAZ POR ROL (OTRAS) ---
 # -------------------------------------------------------------------
 
 @app.route('/admin')
-def dashboard_admin():
-    """Ruta para la Administradora/Dueña."""
+def dashboard_admin(reporte_importacion=None):
+    """
+    Ruta para la Administradora/Dueña: indicadores leídos de RESUMEN_DIARIO. Con varias
+    sucursales se consultan todas a la vez y se muestran por sucursal y sumados.
+    """
     if session.get('rol') in ['Dueña', 'Administradora']:
-        return render_template('administradora.html')
+        resumen = None
+        error = None
+        por_sucursal = []
+        if len(SUCURSALES) == 1:
+            conn = obtener_conexion()
+            if conn:
+                try:
+                    resumen = metricas.resumen_dashboard(conn.cursor())
+                except Exception as e:
+                    print(f"Error al cargar los indicadores del dashboard: {e}")
+                    error = f"No se pudieron cargar los indicadores: {e}"
+            else:
+                error = "Error de conexión con la BD."
+        else:
+            resultados = obtener_consulta_paralela().ejecutar(
+                resumen_de_sucursal, SUCURSALES.values(), timeout=app.config['SUCURSAL_TIMEOUT'])
+            for sucursal in SUCURSALES.values():
+                resumen_sucursal, error_sucursal = resultados[sucursal.id]
+                if error_sucursal:
+                    print(f"Error al cargar los indicadores de la sucursal {sucursal.nombre}: {error_sucursal}")
+                por_sucursal.append((sucursal, resumen_sucursal, error_sucursal))
+            resumen = metricas.sumar_resumenes([fila[1] for fila in por_sucursal if fila[1] is not None])
+            if any(fila[2] for fila in por_sucursal):
+                error = "Algunas sucursales no respondieron: los totales no las incluyen."
+        return render_template('administradora.html',
+                               resumen=resumen,
+                               por_sucursal=por_sucursal,
+                               meta_ingresos=app.config['META_INGRESOS_MES'],
+                               inicio_mes=date.today().replace(day=1).strftime('%Y-%m-%d'),
+                               fecha_hoy=date.today().strftime('%Y-%m-%d'),
+                               reporte_importacion=reporte_importacion,
+                               error=error or request.args.get('error'),
+                               success=request.args.get('success'))
     return redirect(url_for('index'))
 
 
+def resumen_de_sucursal(sucursal):
+    """resumen_dashboard de una sucursal, con una conexión de su propio pool (corre en ConsultaParalela)."""
+    with en_sucursal(sucursal.id):
+        conn = obtener_conexion()
+        if conn is None:
+            raise RuntimeError("Error de conexión con la BD.")
+        return metricas.resumen_dashboard(conn.cursor())
+
+
+def ejecutar_importacion(conn, tipo, filas, tamano_lote=1000):
+    """Corre la carga masiva y refresca las cachés/índices que dependen de las tablas tocadas."""
+    # Con CREDENCIAL las claves de los clientes importados van con hash, como en el registro
+    metodo_hash = app.config['CREDENCIAL_METODO'] if tabla_disponible(conn, 'CREDENCIAL') else None
+    importador = importar.Importador(conn, obtener_pool().backend.nombre, tamano_lote=tamano_lote,
+                                     generar_contrasena=generar_contrasena, metodo_hash=metodo_hash)
+    reporte = importador.importar(tipo, filas)
+
+    if reporte.insertadas:
+        marcar_escritura({'clientes': 'CLIENTE', 'servicios': 'SERVICIO', 'citas': 'CITA'}[tipo])
+        if tipo == 'servicios':
+            invalidar_catalogos('servicios', 'duraciones')
+        elif tipo == 'clientes':
+            obtener_indice_clientes().marcar_vencido()
+            obtener_cache_negativa().olvidar()
+        elif tipo == 'citas':
+            obtener_disponibilidad().invalidar()
+        if tipo in ('clientes', 'citas'):
+            try:
+                metricas.reconstruir(conn.cursor(), obtener_pool().backend.nombre)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"Error al reconstruir RESUMEN_DIARIO tras la importación: {e}")
+    return reporte
+
+
+@app.route('/admin/importar', methods=['POST'])
+def importar_archivo():
+    """Carga masiva desde un archivo CSV o JSONL subido por la Administradora."""
+    if session.get('rol') not in ['Dueña', 'Administradora']:
+        return redirect(url_for('index'))
+
+    tipo = request.form.get('tipo')
+    archivo = request.files.get('archivo')
+    if tipo not in ('clientes', 'servicios', 'citas') or archivo is None or not archivo.filename:
+        return redirect(url_for('dashboard_admin', error="Selecciona el tipo de datos y un archivo."))
+    formato = 'jsonl' if archivo.filename.lower().endswith(('.jsonl', '.json')) else 'csv'
+
+    conn = obtener_conexion()
+    if conn is None:
+        return redirect(url_for('dashboard_admin', error="Error de conexión con la BD."))
+
+    try:
+        reporte = ejecutar_importacion(conn, tipo, importar.leer_filas(importar.abrir_subida(archivo), formato))
+    except Exception as e:
+        return redirect(url_for('dashboard_admin', error=f"Error al importar: {e}"))
+    return dashboard_admin(reporte_importacion=reporte)
+
+
+@app.cli.command('importar')
+@click.argument('tipo', type=click.Choice(['clientes', 'servicios', 'citas']))
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--formato', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Por defecto se deduce de la extensión del archivo.')
+@click.option('--lote', default=1000, show_default=True, help='Filas por transacción.')
+@click.option('--errores', type=click.File('w', encoding='utf-8'), default=None,
+              help='Archivo CSV donde escribir el reporte de errores por fila.')
+def importar_cmd(tipo, archivo, formato, lote, errores):
+    """Importa clientes, servicios o citas históricas desde CSV o JSONL."""
+    conn = obtener_conexion()
+    if conn is None:
+        raise SystemExit("No se pudo conectar con la BD.")
+    formato = formato or ('jsonl' if archivo.lower().endswith(('.jsonl', '.json')) else 'csv')
+    with open(archivo, encoding='utf-8-sig', newline='') as entrada:
+        reporte = ejecutar_importacion(conn, tipo, importar.leer_filas(entrada, formato), tamano_lote=lote)
+    print(reporte.resumen())
+    if errores is not None:
+        escritor = csv.writer(errores)
+        escritor.writerow(['linea', 'error'])
+        escritor.writerows(reporte.errores)
+    else:
+        for linea, mensaje in reporte.errores[:20]:
+            print(f"  línea {linea}: {mensaje}")
+
+
+@app.route('/admin/exportar')
+def exportar_reporte():
+    """
+    Descarga un reporte en streaming (CSV o JSONL) sin armar todo el resultado en memoria.
+    Parámetros: reporte ('citas' o 'ingresos'), desde, hasta (YYYY-MM-DD) y formato ('csv' o 'jsonl').
+    """
+    if session.get('rol') not in ['Dueña', 'Administradora']:
+        return redirect(url_for('index'))
+
+    reporte = request.args.get('reporte', 'citas')
+    formato = request.args.get('formato', 'csv')
+    try:
+        desde = date.fromisoformat(request.args.get('desde') or date.today().replace(day=1).isoformat())
+        hasta = date.fromisoformat(request.args.get('hasta') or date.today().isoformat())
+    except ValueError:
+        return redirect(url_for('dashboard_admin', error="Fechas inválidas para el reporte."))
+    if reporte not in exportar.REPORTES or formato not in exportar.FORMATOS:
+        return redirect(url_for('dashboard_admin', error="Reporte o formato no válido."))
+
+    conn = obtener_conexion()
+    if conn is None:
+        return redirect(url_for('dashboard_admin', error="Error de conexión con la BD."))
+
+    nombre_archivo = f"{reporte}_{desde.isoformat()}_{hasta.isoformat()}.{formato}"
+    # stream_with_context mantiene la conexión de 'g' hasta terminar de enviar
+    contenido = exportar.generar_reporte(conn.cursor(), reporte, desde, hasta, formato)
+    return Response(stream_with_context(contenido),
+                    mimetype=exportar.FORMATOS[formato],
+                    headers={'Content-Disposition': f'attachment; filename="{nombre_archivo}"'})
+
+
+@app.cli.command('exportar')
+@click.argument('reporte', type=click.Choice(sorted(exportar.REPORTES)))
+@click.option('--desde', required=True, help='Fecha inicial (YYYY-MM-DD).')
+@click.option('--hasta', required=True, help='Fecha final (YYYY-MM-DD).')
+@click.option('--formato', type=click.Choice(sorted(exportar.FORMATOS)), default='csv')
+@click.option('--salida', type=click.File('w', encoding='utf-8'), default='-',
+              help='Archivo de salida (por defecto la salida estándar).')
+def exportar_cmd(reporte, desde, hasta, formato, salida):
+    """Exporta citas o ingresos de un rango de fechas en CSV o JSONL."""
+    conn = obtener_conexion()
+    if conn is None:
+        raise SystemExit("No se pudo conectar con la BD.")
+    for bloque in exportar.generar_reporte(conn.cursor(), reporte, date.fromisoformat(desde),
+                                           date.fromisoformat(hasta), formato):
+        salida.write(bloque)
+
+
+@app.route('/admin/catalogos')
+def estado_catalogos():
+    """Contadores de la caché de catálogos (hits, misses, recargas) en JSON."""
+    if session.get('rol') not in ['Dueña', 'Administradora']:
+        return redirect(url_for('index'))
+    return jsonify(obtener_catalogos().metricas())
+
+
+@app.route('/metrics')
+def metricas_prometheus():
+    """Histogramas de SQL por endpoint más el estado del pool y de la caché, en formato de texto de Prometheus."""
+    token = app.config['METRICS_TOKEN']
+    autorizado_por_token = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not autorizado_por_token and session.get('rol') not in ['Dueña', 'Administradora']:
+        return redirect(url_for('index'))
+
+    extras = []
+    for sucursal in SUCURSALES.values():
+        # Un pool por sucursal; con una sola, los nombres de siempre
+        prefijo = 'rossy_pool' if len(SUCURSALES) == 1 else f'rossy_sucursal_{sucursal.id}_pool'
+        pool = app.extensions.get('por_sucursal', {}).get(sucursal.id, {}).get('pool_conexiones')
+        if pool is None:
+            continue  # sucursal sin solicitudes todavía en este proceso
+        for clave, valor in pool.metricas().items():
+            if isinstance(valor, int):
+                tipo = 'gauge' if clave in ('en_uso', 'libres', 'tamano_max') else 'counter'
+                sufijo = '' if tipo == 'gauge' else '_total'
+                extras.append((f'{prefijo}_{clave}{sufijo}', tipo,
+                               f'Pool de conexiones ({sucursal.nombre}): {clave}.', valor))
+    for clave, valor in obtener_catalogos().metricas().items():
+        if isinstance(valor, int):
+            extras.append((f'rossy_catalogos_{clave}_total', 'counter', f'Caché de catálogos: {clave}.', valor))
+    for clave, valor in obtener_cache_fragmentos().metricas().items():
+        tipo, sufijo = ('gauge', '') if clave == 'entradas' else ('counter', '_total')
+        extras.append((f'rossy_fragmentos_{clave}{sufijo}', tipo, f'Caché de fragmentos: {clave}.', valor))
+    # Solo en modo ASGI (asgi.py): ocupación y rechazos por carril
+    for nombre, carril in app.extensions.get('carriles_asgi', {}).items():
+        datos = carril.metricas()
+        extras.append((f'rossy_asgi_{nombre}_admitidas', 'gauge', f'Solicitudes en curso o en espera ({nombre}).',
+                       datos['admitidas']))
+        extras.append((f'rossy_asgi_{nombre}_rechazadas_total', 'counter', f'Respuestas 503 por saturación ({nombre}).',
+                       datos['rechazadas']))
+        extras.append((f'rossy_asgi_{nombre}_vencidas_total', 'counter', f'Respuestas 504 por timeout ({nombre}).',
+                       datos['vencidas']))
+    extras.append(('rossy_sse_suscriptores', 'gauge', 'Conexiones SSE abiertas en este proceso.',
+                   obtener_bus_eventos().metricas()['suscriptores']))
+    for clave, valor in obtener_almacen_idempotencia().metricas().items():
+        tipo, sufijo = ('gauge', '') if clave == 'entradas' else ('counter', '_total')
+        extras.append((f'rossy_idempotencia_{clave}{sufijo}', tipo, f'Envíos con clave de idempotencia: {clave}.', valor))
+    emparejador = extensiones_sucursal().get('lista_espera')
+    if emparejador is not None:
+        for clave, valor in emparejador[0].metricas().items():
+            tipo, sufijo = ('gauge', '') if clave in ('activas', 'claves') else ('counter', '_total')
+            extras.append((f'rossy_espera_{clave}{sufijo}', tipo, f'Lista de espera: {clave}.', valor))
+    cola = app.extensions.get('cola_trabajos')
+    if cola is not None:
+        for clave, valor in cola.metricas().items():
+            tipo, sufijo = ('gauge', '') if clave in ('pendiente', 'en_curso', 'hecho', 'fallido') else ('counter', '_total')
+            extras.append((f'rossy_trabajos_{clave}{sufijo}', tipo, f'Cola de trabajos: {clave}.', valor))
+    for clave, valor in obtener_cache_negativa().metricas().items():
+        tipo, sufijo = ('gauge', '') if clave == 'entradas' else ('counter', '_total')
+        extras.append((f'rossy_login_negativos_{clave}{sufijo}', tipo, f'Caché negativa del login: {clave}.', valor))
+    for nombre, limitador in zip(('ip', 'cuenta'), obtener_limitadores_login()):
+        extras.append((f'rossy_login_bloqueos_{nombre}_total', 'counter',
+                       f'Intentos de login rechazados por límite de {nombre}.', limitador.metricas()['bloqueos']))
+    escritor = obtener_escritor()
+    if escritor is not None:
+        for clave, valor in escritor.metricas().items():
+            tipo, sufijo = ('gauge', '') if clave in ('en_cola', 'lote_max') else ('counter', '_total')
+            extras.append((f'rossy_escritura_{clave}{sufijo}', tipo, f'Escritor con commit agrupado: {clave}.', valor))
+    return Response(instrumentacion.METRICAS.exportar(extras), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/catalogos/invalidar', methods=['POST'])
+def invalidar_catalogos_admin():
+    """Fuerza la recarga de los catálogos (por ejemplo tras editar SERVICIO directamente en SQL Server)."""
+    if session.get('rol') not in ['Dueña', 'Administradora']:
+        return redirect(url_for('index'))
+    invalidar_catalogos()
+    return redirect(url_for('dashboard_admin'))
+
+
 @app.route('/estilista')
 def vista_estilista():
     """Ruta para el Estilista: Muestra su agenda del día."""
@@ -600,9 +2037,162 @@ def vista_estilista():
     return redirect(url_for('index'))
 
 
+def obtener_versiones_agenda():
+    """Registro de ETag / Last-Modified de las vistas de agenda, uno por proceso."""
+    versiones = extensiones_sucursal().get('versiones_agenda')
+    if versiones is None:
+        versiones = extensiones_sucursal().setdefault('versiones_agenda', agenda.RegistroVersiones())
+    return versiones
+
+
+@app.route('/agenda')
+def agenda_rango():
+    """
+    Agenda de la semana o del mes (query args: vista=semana|mes, fecha, id_estilista).
+    Recepción ve a todas las estilistas (o a una); cada Estilista solo la suya.
+    Una sola consulta por rango; si el ETag no cambió se responde 304 sin renderizar.
+    """
+    rol = session.get('rol')
+    if rol not in ['Recepcionista', 'Estilista']:
+        return redirect(url_for('index'))
+
+    vista = request.args.get('vista', 'semana')
+    if vista not in agenda.VISTAS:
+        vista = 'semana'
+    try:
+        fecha = date.fromisoformat(request.args.get('fecha', ''))
+    except ValueError:
+        fecha = date.today()
+
+    estilistas = obtener_estilistas()
+    if rol == 'Estilista':
+        try:
+            id_estilista = int(session.get('id_usuario'))
+        except (ValueError, TypeError):
+            return redirect(url_for('vista_estilista', error="El ID de tu sesión no es válido."))
+        estilistas = [e for e in estilistas if e[0] == id_estilista] or [(id_estilista, session.get('nombre'))]
+    else:
+        id_estilista = request.args.get('id_estilista', type=int)
+        if id_estilista is not None:
+            estilistas = [e for e in estilistas if e[0] == id_estilista]
+
+    desde, hasta = agenda.rango_vista(vista, fecha)
+    conn = obtener_conexion()
+    if conn is None:
+        return redirect(url_for(ROLE_ENDPOINT_MAP[rol], error="No se pudo conectar con la BD."))
+    try:
+        filas = agenda.consultar_rango(conn.cursor(), desde, hasta, id_estilista)
+    except Exception as e:
+        print(f"Error al cargar la agenda por rango: {e}")
+        return redirect(url_for(ROLE_ENDPOINT_MAP[rol], error=f"Error en la BD al cargar la agenda: {e}"))
+
+    clave = (rol, id_estilista, vista, desde.isoformat())
+    hoy = date.today()
+    etag = agenda.calcular_etag(clave, filas, estilistas, hoy)
+    ultima_modificacion = obtener_versiones_agenda().ultima_modificacion(clave, etag)
+
+    # La decisión se toma solo con el ETag (Last-Modified tiene resolución de segundos)
+    if request.if_none_match.contains(etag):
+        respuesta = Response(status=304)
+    else:
+        grilla = agenda.GrillaAgenda(estilistas, desde, hasta, app.config['HOURS']).agregar(filas)
+        respuesta = Response(render_template('agenda.html',
+                                             grilla=grilla,
+                                             vista=vista,
+                                             fecha=fecha,
+                                             desde=desde,
+                                             hasta=hasta,
+                                             anterior=agenda.desplazar(vista, fecha, -1),
+                                             siguiente=agenda.desplazar(vista, fecha, 1),
+                                             id_estilista=id_estilista,
+                                             todas_estilistas=obtener_estilistas() if rol == 'Recepcionista' else [],
+                                             hoy=hoy))
+    respuesta.set_etag(etag)
+    respuesta.last_modified = ultima_modificacion
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+
+def aplicar_cambios_estado(conn, cambios, id_estilista=None):
+    """
+    Aplica [(id_cita, estado)] en una transacción (un SELECT, un UPDATE y el ajuste de
+    RESUMEN_DIARIO) y, tras el commit, libera los horarios cancelados y avisa a las
+    agendas abiertas. Con 'id_estilista' solo se aceptan sus citas. Devuelve los
+    resultados por cita; lanza estados.ConflictoEstado si hay que reintentar.
+    """
+    def trabajo(cursor):
+        resultados, cambiadas = estados.aplicar_cambios(cursor, cambios, id_estilista)
+        actualizar_resumen(metricas.registrar_cambios_estado, cursor,
+                           [(c.fecha, c.estado_anterior, c.estado, c.precio) for c in cambiadas])
+        return resultados, cambiadas
+
+    resultados, cambiadas = ejecutar_escritura(conn, trabajo)
+    if cambiadas:
+        marcar_escritura('CITA')
+    for cita in cambiadas:
+        # Una cita cancelada deja su horario libre para otras reservas
+        if cita.estado == 'Cancelada':
+            obtener_disponibilidad().liberar(cita.id_estilista, cita.fecha, cita.hora,
+                                             duracion_servicio(cita.id_servicio))
+        if cita.estado in ('Cancelada', 'Realizada'):
+            cancelar_recordatorio(cita.id_cita)
+        publicar_evento_agenda('estado_cambiado', cita.fecha, cita.id_estilista, id_cita=cita.id_cita,
+                               estado_anterior=cita.estado_anterior, estado=cita.estado)
+    # Los horarios cancelados se ofrecen a la lista de espera (ya confirmada la cancelación)
+    for cita in cambiadas:
+        if cita.estado == 'Cancelada':
+            try:
+                rellenar_horario(conn, cita.id_estilista, cita.fecha, cita.hora, duracion_servicio(cita.id_servicio))
+            except Exception as e:
+                print(f"Error al rellenar desde la lista de espera la cita {cita.id_cita}: {e}")
+    return resultados
+
+
+def responder_cambios_estado(id_estilista=None):
+    """Cuerpo común de las APIs de cambio de estado en lote: {"cambios": [{"id_cita": 1, "estado": "Realizada"}]}."""
+    datos = request.get_json(silent=True)
+    if not isinstance(datos, dict):
+        return jsonify(error='El cuerpo debe ser un objeto JSON: {"cambios": [...]}.'), 400
+    try:
+        cambios = estados.leer_cambios(datos.get('cambios'))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    conn = obtener_conexion()
+    if conn is None:
+        return jsonify(error="Error de conexión con la BD."), 503
+    try:
+        resultados = aplicar_cambios_estado(conn, cambios, id_estilista)
+    except estados.ConflictoEstado as e:
+        return jsonify(error=str(e)), 409
+    except Exception as e:
+        return jsonify(error=f"Error en la BD al actualizar citas: {e}"), 500
+    return jsonify(actualizadas=sum(1 for r in resultados if r['ok'] and r['estado_anterior'] != r['estado']),
+                   resultados=resultados)
+
+
+@app.route('/api/estilista/citas/estado', methods=['POST'])
+def api_estado_citas_estilista():
+    """Cambia el estado de varias citas del estilista en sesión (p. ej. al cierre del día)."""
+    if session.get('rol') != 'Estilista':
+        return jsonify(error="Sesión no válida."), 401
+    try:
+        id_estilista = int(session.get('id_usuario'))
+    except (ValueError, TypeError):
+        return jsonify(error="ID de estilista no válido."), 401
+    return responder_cambios_estado(id_estilista)
+
+
+@app.route('/api/recepcion/citas/estado', methods=['POST'])
+def api_estado_citas_recepcion():
+    """Cambia el estado de varias citas de cualquier estilista."""
+    if session.get('rol') not in ['Recepcionista', 'Administradora', 'Dueña']:
+        return jsonify(error="Sesión no válida."), 401
+    return responder_cambios_estado()
+
+
 @app.route('/actualizar_cita_estilista', methods=['POST'])
 def actualizar_cita_estilista():
-    """Permite al estilista cambiar el estado de una cita (Realizada/Cancelada)."""
+    """Permite al estilista cambiar el estado de una cita (En Proceso/Realizada/Cancelada)."""
     if session.get('rol') != 'Estilista':
         return redirect(url_for('index'))
 
@@ -615,7 +2205,7 @@ def actualizar_cita_estilista():
     except (ValueError, TypeError):
         return redirect(url_for('vista_estilista', error="ID de estilista no válido."))
 
-    if not all([id_cita, nuevo_estado]) or nuevo_estado not in ['Realizada', 'Cancelada']:
+    if not all([id_cita, nuevo_estado]) or nuevo_estado not in ['En Proceso', 'Realizada', 'Cancelada']:
         return redirect(url_for('vista_estilista', error="Datos inválidos para actualizar la cita."))
 
     conn = obtener_conexion()
@@ -623,37 +2213,24 @@ def actualizar_cita_estilista():
         return redirect(url_for('vista_estilista', error="Error de conexión con la BD."))
 
     try:
-        cursor = conn.cursor()
-
-        # 1. VERIFICAR QUE LA CITA PERTENEZCA AL ESTILISTA (Seguridad)
-        check_query = "SELECT IDEstilista FROM CITA WHERE IDCita = ?"
-        cursor.execute(check_query, id_cita)
-        cita_data = cursor.fetchone()
-
-        if cita_data is None:
-            return redirect(url_for('vista_estilista', error="Cita no encontrada."))
-
-        id_estilista_cita = cita_data[0]
-
-        if id_estilista_cita != id_estilista_sesion:
-            return redirect(url_for('vista_estilista', error="Acceso denegado. No puedes modificar esta cita."))
-
-        # 2. ACTUALIZAR EL ESTADO
-        update_query = "UPDATE CITA SET Estado = ? WHERE IDCita = ?"
-        cursor.execute(update_query, nuevo_estado, id_cita)
-        conn.commit()
-
-        mensaje = f"Cita {id_cita} actualizada a '{nuevo_estado}' con éxito."
-        return redirect(url_for('vista_estilista', success=mensaje))
-
+        # Mismo camino que el lote: verifica que la cita sea del estilista y la transición
+        resultado, = aplicar_cambios_estado(conn, estados.leer_cambios([{'id_cita': id_cita, 'estado': nuevo_estado}]),
+                                            id_estilista_sesion)
+    except (ValueError, estados.ConflictoEstado) as e:
+        return redirect(url_for('vista_estilista', error=str(e)))
     except Exception as e:
         return redirect(url_for('vista_estilista', error=f"Error en la BD al actualizar cita: {e}"))
 
+    if not resultado['ok']:
+        return redirect(url_for('vista_estilista', error=resultado['error']))
+    mensaje = f"Cita {id_cita} actualizada a '{nuevo_estado}' con éxito."
+    return redirect(url_for('vista_estilista', success=mensaje))
+
 
 @app.route('/cliente')
 def perfil_cliente():
     """Ruta para el Cliente: Muestra sus datos, servicios y estilistas disponibles.
-       También carga el historial de citas (citas_cliente)."""
+       También carga sus próximas citas y la primera página del historial."""
     if session.get('rol') == 'Cliente':
         # 1. Obtener la fecha de hoy para el input date
         fecha_hoy = date.today().strftime('%Y-%m-%d')
@@ -663,94 +2240,107 @@ def perfil_cliente():
 
         servicios = []
         estilistas = []
-        citas_cliente = []  # Se inicializa para pasarla al template
+        citas_proximas = []  # Se inicializan para pasarlas al template
+        historial = []
+        cursor_historial = None
+        lista_espera = []
         conn = obtener_conexion()
         id_cliente = session.get('id_usuario')
 
         if conn and id_cliente:
             try:
-                cursor = conn.cursor()
+                # A. Próximas citas + primera página del historial (+ lista de espera), en un solo lote
+                citas_proximas, historial, cursor_historial, lista_espera = paginas.pagina_cliente(
+                    conn.cursor(), obtener_pool().backend.nombre, id_cliente,
+                    por_pagina=app.config['HISTORIAL_POR_PAGINA'], max_proximas=app.config['PROXIMAS_CITAS_MAX'],
+                    con_espera=tabla_disponible(conn, 'LISTA_ESPERA'))
 
-                # A. Consulta Citas del Cliente (HISTORIAL)
-                query_citas = """
-                SELECT C.Fecha, C.Hora, C.Estado, S.NombreServicio, E.Nombre AS Estilista
-                FROM CITA C
-                JOIN SERVICIO S ON C.IDServicio = S.IDServicio
-                JOIN ESTILISTA E ON C.IDEstilista = E.IDEstilista
-                WHERE C.IDCliente = ?
-                ORDER BY C.Fecha DESC, C.Hora DESC
-                """
-                cursor.execute(query_citas, id_cliente)
-                citas_cliente = row_to_list(cursor.fetchall())
-                # NOTA: citas_cliente ya contiene el historial que solicitaste.
-
-                # B. Consulta Servicios
-                query_servicios = "SELECT IDServicio, NombreServicio, Precio FROM SERVICIO ORDER BY NombreServicio"
-                cursor.execute(query_servicios)
-                servicios = row_to_list(cursor.fetchall())
-
-                # C. Consulta Estilistas (Solo los activos)
-                # CORRECCIÓN: Se revierte la consulta para solo obtener 2 valores
-                # (IDEstilista, Nombre) para que coincida con el bucle Jinja de 2 variables.
-                query_estilistas = "SELECT IDEstilista, Nombre FROM ESTILISTA WHERE Estado = 'Activo' ORDER BY Nombre"
-                cursor.execute(query_estilistas)
-                estilistas = row_to_list(cursor.fetchall())
+                # B. Servicios (IDServicio, NombreServicio, Precio) desde la caché de catálogos
+                servicios = obtener_servicios()
+
+                # C. Estilistas activos (IDEstilista, Nombre) desde la caché de catálogos
+                estilistas = obtener_estilistas()
 
             except Exception as e:
                 print(f"Error al cargar datos del cliente: {e}")
                 return render_template('cliente.html',
                                        error=f"Error al cargar datos: {e}",
-                                       servicios=[], estilistas=[], citas_cliente=[], fecha_hoy=fecha_hoy)
+                                       servicios=[], estilistas=[], citas_proximas=[], historial=[],
+                                       fecha_hoy=fecha_hoy)
 
         return render_template('cliente.html',
                                servicios=servicios,
                                estilistas=estilistas,
-                               citas_cliente=citas_cliente,
+                               citas_proximas=citas_proximas,
+                               historial=historial,
+                               cursor_historial=cursor_historial,
+                               lista_espera=lista_espera,
                                fecha_hoy=fecha_hoy,
                                horas=horas_disponibles,
+                               hora_cierre=(normalizar_hora(app.config['HORARIO_CIERRE']),
+                                            hora_ampm(minutos(app.config['HORARIO_CIERRE']))),
                                error=request.args.get('error'),
                                success=request.args.get('success'))
 
     return redirect(url_for('index'))
 
 
-@app.route('/logout')
-def logout():
-    """Cierra la sesión y redirige al index/login."""
-    session.clear()
-    return redirect(url_for('index'))
+@app.route('/api/citas_cliente')
+def api_historial_cliente():
+    """Siguiente página del historial del cliente ('Ver más'). Parámetro: despues (cursor de la página anterior)."""
+    if session.get('rol') != 'Cliente':
+        return jsonify({'error': 'No autorizado'}), 403
+    try:
+        despues_de = paginas.decodificar_cursor(request.args.get('despues', ''))
+    except ValueError:
+        return jsonify({'error': 'Cursor inválido'}), 400
 
+    conn = obtener_conexion()
+    if conn is None:
+        return jsonify({'error': 'No se pudo conectar con la BD'}), 503
+    try:
+        filas, siguiente = paginas.pagina_historial(conn.cursor(), obtener_pool().backend.nombre,
+                                                    session.get('id_usuario'), despues_de,
+                                                    app.config['HISTORIAL_POR_PAGINA'])
+    except Exception as e:
+        print(f"Error al cargar el historial del cliente: {e}")
+        return jsonify({'error': 'Error al consultar la BD'}), 500
 
-# Función de inicialización que crea la lista de horas con intervalos de 1:30
-def initialize_hours():
-    """
-    Genera la lista de horas disponibles en intervalos de 1 hora y 30 minutos (1:30).
-    Salón abierto de 9:00 AM a 10:00 PM (22:00). Última cita inicia a las 19:30.
-    """
-    HOURS = []
-    # Usaremos datetime.strptime para crear un objeto datetime inicial a las 9:00 AM
-    start_time = datetime.strptime('09:00', '%H:%M')
-    # Definimos la hora límite: el último slot es 19:30 que termina a las 21:00.
-    end_time_limit = datetime.strptime('21:00', '%H:%M')
-    # Definimos el intervalo de 90 minutos (1:30)
-    interval = timedelta(minutes=90)
+    citas = [{'fecha': str(fecha), 'hora': hora.strftime('%I:%M %p').lstrip('0'), 'estado': estado,
+              'servicio': servicio, 'estilista': estilista}
+             for fecha, hora, estado, servicio, estilista, _ in filas]
+    return jsonify({'citas': citas, 'siguiente': siguiente})
 
-    current_time = start_time
-    # La condición de parada asegura que el último slot generado sea 19:30.
-    while current_time < end_time_limit:
-        # Asegura el formato de 24 horas para la BD (ej. 09:00:00)
-        hora_24 = current_time.strftime('%H:%M:%S')
-        # Formato AM/PM para mostrar en el select (ej. 9:00 a.m.)
-        hora_ampm = current_time.strftime('%I:%M %p').lstrip('0').replace('AM', 'a.m.').replace('PM', 'p.m.')
-        HOURS.append((hora_24, hora_ampm))
 
-        current_time += interval
+@app.route('/sucursal', methods=['POST'])
+def cambiar_sucursal():
+    """Recepción y Administración cambian de sucursal sin cerrar sesión (sus cuentas no son de una BD)."""
+    rol = session.get('rol')
+    if rol not in ['Recepcionista', 'Administradora', 'Dueña']:
+        return redirect(url_for('index'))
+    endpoint = ROLE_ENDPOINT_MAP[rol]
+    g.sucursal = sucursal_formulario()
+    if g.sucursal is None:
+        return redirect(url_for(endpoint, error="Sucursal no válida."))
+    session['id_sucursal'] = g.sucursal
+    # La clienta seleccionada y las búsquedas son de la BD de la sucursal anterior
+    for clave in ('id_cliente_seleccionado', 'nombre_cliente_seleccionado', 'clientes_encontrados_ref',
+                  'reporte_serie_ref'):
+        session.pop(clave, None)
+    return redirect(url_for(endpoint, success=f"Trabajando en la sucursal {SUCURSALES[g.sucursal].nombre}."))
+
 
-    return HOURS
+@app.route('/logout')
+def logout():
+    """Cierra la sesión y redirige al index/login."""
+    session.clear()
+    return redirect(url_for('index'))
 
 
-# Inicializar la lista de horas para que esté disponible en app.config.get('HOURS')
-app.config['HOURS'] = initialize_hours()
+# Horas de inicio ofrecidas en los formularios (cada PASO_AGENDA minutos dentro del horario del salón).
+# Qué horas caben realmente para un servicio y un estilista lo resuelve el índice de disponibilidad.
+app.config['HOURS'] = horarios.grilla_horas(app.config['HORARIO_APERTURA'], app.config['HORARIO_CIERRE'],
+                                            app.config['PASO_AGENDA'])
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,323 @@
+# Modo de servicio ASGI opcional: la app Flask (WSGI) corre en carriles con ejecutores acotados
+"""
+Uso (requiere un servidor ASGI, por ejemplo uvicorn o hypercorn):
+
+    uvicorn asgi:aplicacion --workers 2
+    hypercorn asgi:aplicacion
+
+El código de la app no cambia (sigue siendo síncrono y usando el pool de
+conexiones). Lo que cambia es cómo se admite cada solicitud:
+
+- Cada ruta cae en un carril ('lectura', 'flujo' o 'general'). Cada carril
+  tiene su propio ThreadPoolExecutor con 'hilos' fijos y una espera máxima de
+  'max_espera' solicitudes. Así, una ráfaga de lecturas a la hora de apertura
+  no deja sin hilos a las reservas, y viceversa.
+- Backpressure: si el carril ya tiene hilos + max_espera solicitudes admitidas,
+  se responde 503 con Retry-After de inmediato, sin encolar nada más.
+- Timeout por solicitud: si la respuesta no empieza en 'timeout' segundos se
+  responde 504. Si la solicitud seguía en espera se descarta; si ya corría, su
+  hilo sigue ocupado hasta terminar (una llamada a la BD no se puede abortar
+  desde afuera; para eso está ROSSY_DB_QUERY_TIMEOUT) y cuenta para el límite.
+"""
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Rutas de solo lectura que más se cargan al abrir el salón
+RUTAS_LECTURA = ('/cliente', '/recepcion', '/estilista', '/agenda',
+                 '/api/horarios_libres', '/api/clientes', '/api/citas_cliente')
+# Respuestas largas en streaming (SSE y exportaciones): sin timeout más allá del primer byte
+PREFIJOS_FLUJO = ('/eventos/', '/admin/exportar')
+
+MAX_CUERPO_EN_MEMORIA = 1024 * 1024  # las subidas más grandes van a un archivo temporal
+CHUNKS_EN_VUELO = 16  # chunks que el hilo WSGI puede adelantar al cliente
+
+
+class CarrilSaturado(Exception):
+    """El carril ya admitió todas las solicitudes que puede atender o encolar."""
+
+
+class Carril:
+    """Ejecutor acotado con control de admisión. Solo se usa desde el event loop."""
+
+    def __init__(self, nombre, hilos, max_espera, timeout):
+        self.nombre = nombre
+        self.hilos = hilos
+        self.max_espera = max_espera
+        self.timeout = timeout
+        self.ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix=f'rossy-{nombre}')
+        self.admitidas = 0
+        self.rechazadas = 0
+        self.vencidas = 0
+
+    def enviar(self, loop, funcion, *args):
+        if self.admitidas >= self.hilos + self.max_espera:
+            self.rechazadas += 1
+            raise CarrilSaturado(self.nombre)
+        self.admitidas += 1
+        futuro = self.ejecutor.submit(funcion, *args)
+        # Se libera el cupo cuando el hilo termina de verdad (o si se canceló antes de empezar)
+        futuro.add_done_callback(lambda _: self._avisar_fin(loop))
+        return futuro
+
+    def _avisar_fin(self, loop):
+        # Corre en el hilo del ejecutor: tras el shutdown del servidor el loop ya puede estar cerrado
+        if loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._liberar)
+        except RuntimeError:
+            pass  # el loop se cerró entre la comprobación y la llamada
+
+    def _liberar(self):
+        self.admitidas -= 1
+
+    def metricas(self):
+        return {'admitidas': self.admitidas, 'hilos': self.hilos, 'max_espera': self.max_espera,
+                'rechazadas': self.rechazadas, 'vencidas': self.vencidas}
+
+
+# -------------------------------------------------------------------
+# --- TRADUCCIÓN ASGI -> WSGI ---
+# -------------------------------------------------------------------
+
+def construir_environ(scope, cuerpo, multiproceso=False):
+    """
+    Environ WSGI (PEP 3333) a partir del scope HTTP de ASGI. 'multiproceso' indica
+    si el servidor corre varios workers con esta misma app (wsgi.multiprocess).
+    """
+    servidor = scope.get('server') or ('localhost', 80)
+    cliente = scope.get('client') or ('', 0)
+    ruta = scope.get('root_path', '')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': ruta.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'][len(ruta):].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': servidor[0],
+        'SERVER_PORT': str(servidor[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': cliente[0],
+        'REMOTE_PORT': str(cliente[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': cuerpo,
+        'wsgi.input_terminated': True,  # el cuerpo ya se leyó completo (aunque viniera chunked)
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': multiproceso,
+        'wsgi.run_once': False,
+    }
+    for nombre, valor in scope.get('headers', []):
+        nombre = nombre.decode('latin-1').upper().replace('-', '_')
+        valor = valor.decode('latin-1')
+        if nombre in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[nombre] = valor
+            continue
+        clave = f'HTTP_{nombre}'
+        if clave in environ:
+            # Cookie repetida (HTTP/2 la parte en varios headers): se une como un solo Cookie, con '; '
+            valor = f"{environ[clave]}{'; ' if clave == 'HTTP_COOKIE' else ','}{valor}"
+        environ[clave] = valor
+    return environ
+
+
+def _ejecutar_wsgi(app_wsgi, environ, entregar, cancelado):
+    """
+    Corre en un hilo del carril: llama a la app WSGI y va pasando al event loop
+    ('inicio', (status, headers)), luego ('cuerpo', bytes)... y al final ('fin', None).
+    Se detiene entre chunks si el cliente se desconectó o venció el timeout.
+    """
+    inicio = {}
+
+    def start_response(status, headers, exc_info=None):
+        inicio['valor'] = (int(status.split(' ', 1)[0]),
+                           [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers])
+        return lambda datos: entregar(('cuerpo', datos))
+
+    try:
+        resultado = app_wsgi(environ, start_response)
+        try:
+            enviado = False
+            for chunk in resultado:
+                if cancelado.is_set():
+                    return
+                if not enviado:
+                    entregar(('inicio', inicio['valor']))
+                    enviado = True
+                if chunk:
+                    entregar(('cuerpo', chunk))
+            if not enviado:
+                entregar(('inicio', inicio['valor']))
+        finally:
+            if hasattr(resultado, 'close'):
+                resultado.close()
+    except Exception as e:
+        entregar(('error', e))
+        return
+    entregar(('fin', None))
+
+
+class AplicacionASGI:
+    """Callable ASGI 3 que sirve una app WSGI repartiendo las rutas en carriles."""
+
+    def __init__(self, app_wsgi, carriles, multiproceso=False):
+        self.app_wsgi = app_wsgi
+        self.carriles = carriles  # {'lectura': Carril, 'flujo': Carril, 'general': Carril}
+        self.multiproceso = multiproceso
+
+    def carril_para(self, ruta):
+        if ruta.startswith(PREFIJOS_FLUJO):
+            return self.carriles['flujo']
+        if ruta in RUTAS_LECTURA:
+            return self.carriles['lectura']
+        return self.carriles['general']
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        # websockets no se usan
+
+    async def _lifespan(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensaje['type'] == 'lifespan.shutdown':
+                for carril in self.carriles.values():
+                    carril.ejecutor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _leer_cuerpo(receive):
+        cuerpo = io.BytesIO()
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'http.disconnect':
+                return None
+            cuerpo.write(mensaje.get('body', b''))
+            if cuerpo.tell() > MAX_CUERPO_EN_MEMORIA and isinstance(cuerpo, io.BytesIO):
+                # Subidas grandes (importación): se pasan a disco para no retenerlas en RAM
+                archivo = tempfile.SpooledTemporaryFile(max_size=MAX_CUERPO_EN_MEMORIA)
+                archivo.write(cuerpo.getvalue())
+                cuerpo = archivo
+            if not mensaje.get('more_body', False):
+                cuerpo.seek(0)
+                return cuerpo
+
+    @staticmethod
+    async def _responder(send, status, texto, headers=()):
+        cuerpo = texto.encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                                (b'content-length', str(len(cuerpo)).encode())] + list(headers)})
+        await send({'type': 'http.response.body', 'body': cuerpo})
+
+    async def _http(self, scope, receive, send):
+        cuerpo = await self._leer_cuerpo(receive)
+        if cuerpo is None:
+            return
+        loop = asyncio.get_running_loop()
+        carril = self.carril_para(scope['path'])
+
+        cola = asyncio.Queue()
+        espacio = threading.Semaphore(CHUNKS_EN_VUELO)
+        cancelado = threading.Event()
+
+        def entregar(mensaje):
+            # El hilo espera si el cliente va lento (a lo sumo CHUNKS_EN_VUELO chunks adelantados)
+            while not espacio.acquire(timeout=1):
+                if cancelado.is_set():
+                    return
+            loop.call_soon_threadsafe(cola.put_nowait, mensaje)
+
+        try:
+            environ = construir_environ(scope, cuerpo, self.multiproceso)
+            futuro = carril.enviar(loop, _ejecutar_wsgi, self.app_wsgi, environ, entregar, cancelado)
+        except CarrilSaturado:
+            await self._responder(send, 503, "El salón está recibiendo muchas solicitudes; intenta en unos segundos.",
+                                  [(b'retry-after', b'5')])
+            return
+
+        desconexion = asyncio.ensure_future(self._esperar_desconexion(receive))
+        try:
+            try:
+                tipo, valor = await asyncio.wait_for(cola.get(), carril.timeout)
+            except asyncio.TimeoutError:
+                cancelado.set()
+                futuro.cancel()  # si aún no empezó, no llega a ocupar un hilo
+                carril.vencidas += 1
+                await self._responder(send, 504, "La solicitud tardó demasiado; intenta de nuevo.")
+                return
+            espacio.release()
+            if tipo == 'error':
+                print(f"Error en la app WSGI ({scope['path']}): {valor}")
+                await self._responder(send, 500, "Error interno del servidor.")
+                return
+            status, headers = valor
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+
+            while True:
+                siguiente = asyncio.ensure_future(cola.get())
+                hecho, _ = await asyncio.wait({siguiente, desconexion}, return_when=asyncio.FIRST_COMPLETED)
+                if siguiente not in hecho:
+                    siguiente.cancel()
+                    return  # el cliente se fue (p. ej. cerró la pestaña con el SSE abierto)
+                tipo, valor = siguiente.result()
+                espacio.release()
+                if tipo == 'cuerpo':
+                    await send({'type': 'http.response.body', 'body': valor, 'more_body': True})
+                else:
+                    # 'fin' o 'error' a mitad del cuerpo: solo queda cerrar la respuesta
+                    await send({'type': 'http.response.body', 'body': b''})
+                    return
+        finally:
+            cancelado.set()
+            desconexion.cancel()
+
+    @staticmethod
+    async def _esperar_desconexion(receive):
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'http.disconnect':
+                return
+
+
+def crear_aplicacion(app_flask):
+    """Arma los carriles a partir de la configuración de la app (variables ROSSY_ASGI_*)."""
+    config = app_flask.config
+    hilos_lectura = int(os.environ.get('ROSSY_ASGI_HILOS_LECTURA', config['DB_POOL_SIZE']))
+    hilos_general = int(os.environ.get('ROSSY_ASGI_HILOS_GENERAL', max(config['DB_POOL_SIZE'] // 2, 2)))
+    carriles = {
+        'lectura': Carril('lectura', hilos_lectura,
+                          max_espera=int(os.environ.get('ROSSY_ASGI_ESPERA_LECTURA', hilos_lectura * 4)),
+                          timeout=float(os.environ.get('ROSSY_ASGI_TIMEOUT_LECTURA', 10))),
+        'general': Carril('general', hilos_general,
+                          max_espera=int(os.environ.get('ROSSY_ASGI_ESPERA_GENERAL', hilos_general * 4)),
+                          timeout=float(os.environ.get('ROSSY_ASGI_TIMEOUT_GENERAL', 30))),
+        # Un hilo por conexión SSE abierta: el tope real lo pone EVENTOS_MAX_SUSCRIPTORES
+        'flujo': Carril('flujo', config['EVENTOS_MAX_SUSCRIPTORES'] + 4, max_espera=0,
+                        timeout=float(os.environ.get('ROSSY_ASGI_TIMEOUT_GENERAL', 30))),
+    }
+    # El servidor ASGI no le dice a la app cuántos workers levantó: se declara aparte
+    # (WEB_CONCURRENCY es la variable que leen uvicorn y gunicorn para --workers)
+    multiproceso = os.environ.get('ROSSY_ASGI_MULTIPROCESO',
+                                  '1' if int(os.environ.get('WEB_CONCURRENCY', 1)) > 1 else '0') == '1'
+    aplicacion_asgi = AplicacionASGI(app_flask, carriles, multiproceso)
+    app_flask.extensions['carriles_asgi'] = carriles
+    return aplicacion_asgi
+
+
+def _crear_desde_app():
+    from app import app
+    return crear_aplicacion(app)
+
+
+aplicacion = _crear_desde_app()
@@ -0,0 +1,374 @@
+# Banco de pruebas de carga para las rutas de reservas y agendas.
+#
+# Uso:
+#   python benchmark.py --clientes 2000 --estilistas 10 --citas 20000 \
+#       --trabajadores 16 --duracion 20 --salida resultado.json
+#
+# Crea una BD SQLite nueva con el esquema de rossy_salon (CLIENTE, ESTILISTA,
+# SERVICIO, CITA), la llena con datos aleatorios reproducibles (--semilla) y
+# golpea las rutas con N trabajadores concurrentes, ya sea con el test client
+# de Flask (por defecto) o contra un servidor WSGI local (--modo wsgi).
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import date, timedelta
+
+import conexiones
+import disponibilidad
+import estados
+import metricas
+import migraciones
+
+NOMBRES = ['Ana', 'María', 'José', 'Lucía', 'Sofía', 'Carmen', 'Valeria', 'Camila', 'Diego', 'Andrés',
+           'Fernanda', 'Gabriela', 'Isabel', 'Jimena', 'Renata', 'Paola', 'Natalia', 'Ximena']
+APELLIDOS = ['López', 'García', 'Martínez', 'Hernández', 'Pérez', 'Sánchez', 'Ramírez', 'Peña',
+             'Núñez', 'Torres', 'Flores', 'Rivera', 'Gómez', 'Díaz', 'Cruz', 'Morales']
+SERVICIOS = [('Corte de Cabello', 250), ('Tinte', 650), ('Manicure', 180), ('Pedicure', 220),
+             ('Peinado', 400), ('Tratamiento Capilar', 550), ('Maquillaje', 500), ('Depilación', 300)]
+MEZCLA_ROLES = ['cliente', 'recepcion', 'estilista', 'cliente', 'cliente',
+                'recepcion', 'cliente', 'cliente', 'recepcion', 'cliente']
+HORAS = ['09:00:00', '10:30:00', '12:00:00', '13:30:00', '15:00:00', '16:30:00', '18:00:00', '19:30:00']
+
+
+# -------------------------------------------------------------------
+# --- SIEMBRA DE DATOS ---
+# -------------------------------------------------------------------
+
+def sembrar(ruta, clientes, estilistas, citas, semilla=42):
+    """Crea la BD desde cero con volúmenes configurables. Devuelve los volúmenes realmente sembrados."""
+    aleatorio = random.Random(semilla)
+    for sufijo in ('', '-wal', '-shm', '-trabajos', '-trabajos-wal', '-trabajos-shm'):
+        if os.path.exists(ruta + sufijo):
+            os.remove(ruta + sufijo)
+
+    conn = sqlite3.connect(ruta)
+    conn.execute("PRAGMA journal_mode = WAL")
+    # El mismo esquema e índices que 'flask migrar' crea en producción
+    migraciones.aplicar(conexiones.ConexionSQLite(conn), 'sqlite', aviso=lambda mensaje: None)
+    conn.executemany("INSERT INTO SERVICIO (NombreServicio, Precio) VALUES (?, ?)", SERVICIOS)
+    conn.executemany(
+        "INSERT INTO ESTILISTA (Nombre, Especialidad, Telefono, Correo, Estado) VALUES (?, ?, ?, ?, 'Activo')",
+        [(f"{aleatorio.choice(NOMBRES)} {aleatorio.choice(APELLIDOS)}", 'General', f"77{i:08d}",
+          f"estilista{i}@rossy.test") for i in range(1, estilistas + 1)])
+    hoy = date.today()
+    conn.executemany(
+        "INSERT INTO CLIENTE (Nombre, Telefono, Correo, FechaRegistro, contraseña) VALUES (?, ?, ?, ?, ?)",
+        [(f"{aleatorio.choice(NOMBRES)} {aleatorio.choice(APELLIDOS)} {i}", f"55{i:08d}", f"cliente{i}@rossy.test",
+          (hoy - timedelta(days=aleatorio.randint(0, 720))).isoformat(), f"clave{i}")
+         for i in range(1, clientes + 1)])
+
+    # Citas sin choques: se reparten en slots libres de los últimos 60 días y los próximos 30
+    ocupados = set()
+    filas = []
+    intentos = 0
+    while len(filas) < citas and intentos < citas * 20:
+        intentos += 1
+        dia = hoy + timedelta(days=aleatorio.randint(-60, 30))
+        slot = (aleatorio.randint(1, estilistas), dia.isoformat(), aleatorio.choice(HORAS))
+        if slot in ocupados:
+            continue
+        ocupados.add(slot)
+        estado = aleatorio.choice(['Realizada', 'Realizada', 'Cancelada']) if dia < hoy else 'Pendiente'
+        filas.append((aleatorio.randint(1, clientes), slot[0], aleatorio.randint(1, len(SERVICIOS)),
+                      slot[1], slot[2], estado))
+    conn.executemany("INSERT INTO CITA (IDCliente, IDEstilista, IDServicio, Fecha, Hora, Estado) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", filas)
+    conn.commit()
+
+    # Tabla de resúmenes del dashboard, ya calculada
+    cursor = conexiones.CursorSQLite(conn.cursor())
+    metricas.reconstruir(cursor, 'sqlite')
+    conn.commit()
+    conn.close()
+    return {'clientes': clientes, 'estilistas': estilistas, 'citas': len(filas)}
+
+
+# -------------------------------------------------------------------
+# --- CONTEO DE CONSULTAS POR SOLICITUD ---
+# -------------------------------------------------------------------
+
+_hilo = threading.local()
+
+
+def _contar_consulta(sql):
+    # Solo sentencias de datos (se ignoran BEGIN/COMMIT/ROLLBACK y PRAGMA)
+    if sql.lstrip()[:6].upper() in ('SELECT', 'INSERT', 'UPDATE', 'DELETE'):
+        _hilo.consultas = getattr(_hilo, 'consultas', 0) + 1
+
+
+class BackendSQLiteContador(conexiones.BackendSQLite):
+    """Backend SQLite que cuenta las sentencias ejecutadas por el hilo actual."""
+
+    def conectar(self):
+        conn = super().conectar()
+        conn.set_trace_callback(_contar_consulta)
+        return conn
+
+
+def configurar_app(ruta, tamano_pool):
+    """Apunta la app al archivo sembrado y deja las cachés vacías."""
+    from app import app
+    from sesiones import crear_interfaz_sesion
+
+    # Todos los trabajadores entran desde 127.0.0.1: con los límites de producción, a partir
+    # del intento 21 el login respondería 429 y el resto de la carga correría sin sesión
+    app.config.update(DB_BACKEND='sqlite', SQLITE_PATH=ruta, TESTING=False,
+                      LOGIN_INTENTOS_IP=(10 ** 6, 1), LOGIN_FALLOS_CUENTA=(10 ** 6, 1))
+    app.extensions.pop('login_limitadores', None)
+    # Los trabajos se encolan (eso sí se mide) en un archivo propio, pero nadie los procesa:
+    # ni hilos compitiendo por la CPU ni correos de confirmación mezclados con la salida
+    app.config.update(TRABAJOS_HILOS=0, TRABAJOS_SQLITE_PATH=ruta + '-trabajos')
+    for clave in ('cola_trabajos', 'trabajadores', 'enviador'):
+        app.extensions.pop(clave, None)
+    app.session_interface = crear_interfaz_sesion({'SESSION_BACKEND': 'memoria'})
+    # Pool, índices y cachés son por sucursal: el benchmark usa solo la principal
+    app.extensions.pop('por_sucursal', None)
+    extensiones = app.extensions.setdefault('por_sucursal', {}).setdefault(app.config['SUCURSAL_PRINCIPAL'], {})
+    extensiones['pool_conexiones'] = conexiones.PoolConexiones(
+        BackendSQLiteContador(ruta), tamano_max=tamano_pool)
+    return app
+
+
+# -------------------------------------------------------------------
+# --- CLIENTES HTTP (TEST CLIENT O WSGI LOCAL) ---
+# -------------------------------------------------------------------
+
+class ClienteTest:
+    """Usa el test client de Flask: la solicitud corre en este mismo hilo (permite contar consultas)."""
+
+    def __init__(self, app):
+        self._cliente = app.test_client()
+
+    def enviar(self, metodo, ruta, datos=None):
+        _hilo.consultas = 0
+        respuesta = self._cliente.open(ruta, method=metodo, data=datos)
+        return respuesta.status_code, _hilo.consultas
+
+
+class ClienteWSGI:
+    """Habla HTTP real con el servidor local; no puede contar consultas (se reporta null)."""
+
+    def __init__(self, base):
+        self.base = base
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _SinRedirecciones())
+
+    def enviar(self, metodo, ruta, datos=None):
+        cuerpo = urllib.parse.urlencode(datos).encode() if datos else None
+        solicitud = urllib.request.Request(self.base + ruta, data=cuerpo, method=metodo)
+        try:
+            with self._opener.open(solicitud, timeout=30) as respuesta:
+                respuesta.read()
+                return respuesta.status, None
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+
+class _SinRedirecciones(urllib.request.HTTPRedirectHandler):
+    """Las redirecciones se miden como respuestas (igual que el test client sin follow_redirects)."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def iniciar_servidor_wsgi(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class _SinLog(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass  # miles de líneas de log distorsionarían la medición
+
+    servidor = make_server('127.0.0.1', 0, app, threaded=True, request_handler=_SinLog)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_port}"
+
+
+# -------------------------------------------------------------------
+# --- ESCENARIOS ---
+# -------------------------------------------------------------------
+
+def trabajador(indice, crear_cliente, sembrado, fin, semilla, resultados):
+    aleatorio = random.Random(semilla + indice)
+    cliente = crear_cliente()
+    registros = []
+
+    def medir(nombre, metodo, ruta, datos=None):
+        inicio = time.perf_counter()
+        try:
+            estado, consultas = cliente.enviar(metodo, ruta, datos)
+        except Exception:
+            estado, consultas = 599, None
+        registros.append((nombre, (time.perf_counter() - inicio) * 1000, estado, consultas))
+        return estado
+
+    # Mezcla por trabajador: 6 de cada 10 son clientes, 3 recepcionistas y 1 estilista
+    # (los tres primeros trabajadores cubren los tres roles aunque N sea pequeño)
+    rol = MEZCLA_ROLES[indice % len(MEZCLA_ROLES)]
+    if rol == 'cliente':
+        n = aleatorio.randint(1, sembrado['clientes'])
+        estado = medir('/login', 'POST', '/login', {'correo': f"cliente{n}@rossy.test", 'password': f"clave{n}"})
+    elif rol == 'recepcion':
+        estado = medir('/login', 'POST', '/login', {'correo': 'recepcion@rossysalon.com', 'password': '123'})
+    else:
+        n = aleatorio.randint(1, sembrado['estilistas'])
+        estado = medir('/login', 'POST', '/login', {'correo': f"estilista{n}@rossy.test", 'password': f"77{n:08d}"})
+    if estado != 302:
+        # Sin sesión, las rutas protegidas solo redirigen al login: medirlas falsearía el resultado
+        resultados[indice] = registros
+        return
+
+    while time.monotonic() < fin:
+        if rol == 'cliente':
+            medir('/cliente', 'GET', '/cliente')
+            dia = date.today() + timedelta(days=aleatorio.randint(1, 14))
+            medir('/agendar_cita', 'POST', '/agendar_cita', {
+                'id_servicio': aleatorio.randint(1, len(SERVICIOS)),
+                'id_estilista': aleatorio.randint(1, sembrado['estilistas']),
+                'fecha': dia.isoformat(), 'hora': aleatorio.choice(HORAS)})
+        elif rol == 'recepcion':
+            medir('/recepcion', 'GET', '/recepcion')
+            termino = aleatorio.choice(NOMBRES + APELLIDOS)[:aleatorio.randint(2, 5)]
+            medir('/buscar', 'POST', '/buscar', {'termino_busqueda': termino})
+        else:
+            medir('/estilista', 'GET', '/estilista')
+    resultados[indice] = registros
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not valores:
+        return None
+    posicion = max(0, min(len(valores) - 1, int(round(p / 100 * len(valores) + 0.5)) - 1))
+    return round(valores[posicion], 2)
+
+
+def contar_choques(ruta, duracion_defecto):
+    """
+    Citas activas que empiezan antes de que termine otra del mismo estilista y día
+    (según SERVICIO.DuracionMin o 'duracion_defecto'): debe ser 0.
+    """
+    conn = sqlite3.connect(ruta)
+    marcas = ', '.join('?' * len(estados.ESTADOS_ACTIVOS))
+    filas = conn.execute(f"""
+        SELECT c.IDEstilista, c.Fecha, c.Hora, COALESCE(s.DuracionMin, ?)
+        FROM CITA c LEFT JOIN SERVICIO s ON s.IDServicio = c.IDServicio
+        WHERE c.Estado IN ({marcas})
+        ORDER BY c.IDEstilista, c.Fecha, c.Hora
+    """, (duracion_defecto, *estados.ESTADOS_ACTIVOS)).fetchall()
+    conn.close()
+
+    choques = 0
+    dia_anterior, fin_maximo = None, 0
+    for id_estilista, fecha, hora, duracion in filas:
+        inicio = disponibilidad.minutos(hora)
+        if (id_estilista, fecha) != dia_anterior:
+            dia_anterior, fin_maximo = (id_estilista, fecha), 0
+        elif inicio < fin_maximo:
+            choques += 1
+        fin_maximo = max(fin_maximo, inicio + int(duracion))
+    return choques
+
+
+def ejecutar(args):
+    ruta = args.bd or os.path.join(tempfile.mkdtemp(prefix='rossy_bench_'), 'bench.db')
+    sembrado = sembrar(ruta, args.clientes, args.estilistas, args.citas, args.semilla)
+    app = configurar_app(ruta, args.pool)
+
+    servidor = None
+    if args.modo == 'wsgi':
+        servidor, base = iniciar_servidor_wsgi(app)
+        crear_cliente = lambda: ClienteWSGI(base)  # noqa: E731
+    else:
+        crear_cliente = lambda: ClienteTest(app)  # noqa: E731
+
+    resultados = {}
+    inicio = time.monotonic()
+    fin = inicio + args.duracion
+    hilos = [threading.Thread(target=trabajador,
+                              args=(i, crear_cliente, sembrado, fin, args.semilla, resultados))
+             for i in range(args.trabajadores)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    transcurrido = time.monotonic() - inicio
+    if servidor is not None:
+        servidor.shutdown()
+
+    sin_sesion = [registros[0][2] for registros in resultados.values() if registros[0][2] != 302]
+    if sin_sesion:
+        raise RuntimeError(f"{len(sin_sesion)} de {args.trabajadores} trabajadores no pudieron iniciar sesión "
+                           f"(estados {sorted(set(sin_sesion))}); el resultado no sería válido.")
+
+    por_ruta = defaultdict(list)
+    for registros in resultados.values():
+        for registro in registros:
+            por_ruta[registro[0]].append(registro)
+
+    rutas = {}
+    total = 0
+    for nombre, registros in sorted(por_ruta.items()):
+        tiempos = sorted(r[1] for r in registros)
+        consultas = [r[3] for r in registros if r[3] is not None]
+        total += len(registros)
+        rutas[nombre] = {
+            'solicitudes': len(registros),
+            'errores': sum(1 for r in registros if r[2] >= 500),
+            'rechazos_4xx': sum(1 for r in registros if 400 <= r[2] < 500),
+            'p50_ms': percentil(tiempos, 50),
+            'p95_ms': percentil(tiempos, 95),
+            'p99_ms': percentil(tiempos, 99),
+            'media_ms': round(statistics.fmean(tiempos), 2),
+            'consultas_por_solicitud': round(statistics.fmean(consultas), 2) if consultas else None,
+        }
+
+    return {
+        'configuracion': {'modo': args.modo, 'trabajadores': args.trabajadores, 'duracion_s': args.duracion,
+                          'pool': args.pool, 'semilla': args.semilla, **sembrado},
+        'duracion_real_s': round(transcurrido, 2),
+        'solicitudes': total,
+        'solicitudes_por_segundo': round(total / transcurrido, 2),
+        'citas_encimadas': contar_choques(ruta, app.config['DURACION_SERVICIO_DEFECTO']),
+        'pool': app.extensions['por_sucursal'][app.config['SUCURSAL_PRINCIPAL']]['pool_conexiones'].metricas(),
+        'rutas': rutas,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de Rossy Salon sobre SQLite.")
+    parser.add_argument('--clientes', type=int, default=1000)
+    parser.add_argument('--estilistas', type=int, default=10)
+    parser.add_argument('--citas', type=int, default=5000)
+    parser.add_argument('--trabajadores', type=int, default=8)
+    parser.add_argument('--duracion', type=float, default=10.0, help='Segundos de carga.')
+    parser.add_argument('--pool', type=int, default=10, help='Tamaño del pool de conexiones.')
+    parser.add_argument('--modo', choices=['test', 'wsgi'], default='test')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--bd', help='Ruta del archivo SQLite a crear (por defecto uno temporal).')
+    parser.add_argument('--salida', help='Archivo JSON donde guardar el resultado.')
+    args = parser.parse_args(argv)
+
+    try:
+        resultado = ejecutar(args)
+    except RuntimeError as e:
+        raise SystemExit(f"Error: {e}")
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            archivo.write(texto)
+    print(texto)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+# Índice en memoria para buscar clientes por nombre o teléfono sin LIKE '%termino%'
+import bisect
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+
+def normalizar_texto(texto):
+    """Minúsculas y sin acentos: 'José Peña' -> 'jose pena'."""
+    texto = unicodedata.normalize('NFKD', str(texto or '').lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'[a-z0-9]+', texto))
+
+
+def solo_digitos(texto):
+    return re.sub(r'\D', '', str(texto or ''))
+
+
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceClientes:
+    """
+    Índice de clientes con:
+      - prefijos de cada palabra del nombre normalizado (lista ordenada + bisect),
+      - prefijos del teléfono (solo dígitos),
+      - trigramas de nombre y teléfono para coincidencias en medio de la palabra.
+    Se carga completo la primera vez con 'cargador' (filas IDCliente, Nombre, Telefono,
+    Correo, FechaRegistro), se actualiza con agregar() al registrar clientes y se
+    reconstruye cada 'recargar_cada' segundos para recoger altas de otros procesos.
+    """
+
+    def __init__(self, cargador, recargar_cada=600.0):
+        self._cargador = cargador
+        self.recargar_cada = recargar_cada
+        self._lock = threading.Lock()
+        self._lock_carga = threading.Lock()
+        self._cargado_en = None
+        self._recientes = []  # altas hechas mientras se reconstruye el índice
+        self._vaciar()
+
+    def _vaciar(self):
+        self._clientes = {}  # id -> fila original (lista)
+        self._nombres = {}  # id -> nombre normalizado
+        self._telefonos = {}  # id -> solo dígitos
+        self._palabras = []  # lista ordenada de (palabra, id)
+        self._prefijos_tel = []  # lista ordenada de (telefono, id)
+        self._gramas = defaultdict(set)  # trigrama -> ids (nombre y teléfono)
+
+    # --- Construcción e incrementos ---
+
+    def _asegurar_cargado(self):
+        vencido = self._cargado_en is None or time.monotonic() - self._cargado_en > self.recargar_cada
+        if not vencido:
+            return
+        # Solo un hilo reconstruye; si ya hay datos, el resto busca sobre los actuales
+        if not self._lock_carga.acquire(blocking=self._cargado_en is None):
+            return
+        try:
+            if self._cargado_en is not None and time.monotonic() - self._cargado_en <= self.recargar_cada:
+                return
+            with self._lock:
+                self._recientes = []
+            filas = list(self._cargador())
+            with self._lock:
+                self._vaciar()
+                for fila in filas + self._recientes:
+                    self._agregar_sin_lock(fila, ordenado=False)
+                # En la carga masiva se ordena una sola vez al final
+                self._palabras.sort()
+                self._prefijos_tel.sort()
+                self._recientes = []
+                self._cargado_en = time.monotonic()
+        finally:
+            self._lock_carga.release()
+
+    def _agregar_sin_lock(self, fila, ordenado=True):
+        id_cliente = fila[0]
+        if id_cliente in self._clientes:
+            return
+        nombre = normalizar_texto(fila[1])
+        telefono = solo_digitos(fila[2])
+        self._clientes[id_cliente] = list(fila)
+        self._nombres[id_cliente] = nombre
+        self._telefonos[id_cliente] = telefono
+        insertar = bisect.insort if ordenado else list.append
+        for palabra in set(nombre.split()):
+            insertar(self._palabras, (palabra, id_cliente))
+            for grama in trigramas(palabra):
+                self._gramas[grama].add(id_cliente)
+        if telefono:
+            insertar(self._prefijos_tel, (telefono, id_cliente))
+            for grama in trigramas(telefono):
+                self._gramas[grama].add(id_cliente)
+
+    def agregar(self, id_cliente, nombre, telefono, correo, fecha_registro):
+        """Alta incremental (llamar después del commit en register / registrar_cliente_recepcion)."""
+        fila = [id_cliente, nombre, telefono, correo, fecha_registro]
+        with self._lock:
+            self._recientes.append(fila)
+            if self._cargado_en is not None:
+                self._agregar_sin_lock(fila)
+
+    def marcar_vencido(self):
+        """Fuerza una reconstrucción en la próxima búsqueda (por ejemplo tras una carga masiva)."""
+        with self._lock:
+            if self._cargado_en is not None:
+                self._cargado_en = time.monotonic() - self.recargar_cada - 1
+
+    # --- Búsqueda ---
+
+    @staticmethod
+    def _por_prefijo(lista, prefijo):
+        posicion = bisect.bisect_left(lista, (prefijo,))
+        while posicion < len(lista) and lista[posicion][0].startswith(prefijo):
+            yield lista[posicion]
+            posicion += 1
+
+    def _por_subcadena(self, fragmento, textos):
+        """Ids cuyo texto contiene 'fragmento' (candidatos por trigramas, luego verificados)."""
+        gramas = trigramas(fragmento)
+        if not gramas:
+            return set()
+        candidatos = set.intersection(*(self._gramas.get(g, set()) for g in gramas))
+        return {i for i in candidatos if fragmento in textos[i]}
+
+    def buscar(self, termino, limite=20, desplazamiento=0):
+        """
+        Devuelve (total, filas) ordenadas por relevancia. Todas las palabras del término
+        deben aparecer en el nombre (como en el LIKE anterior, pero sin acentos);
+        un término con 3 o más dígitos también busca en el teléfono.
+        """
+        self._asegurar_cargado()
+        palabras = normalizar_texto(termino).split()
+        digitos = solo_digitos(termino)
+
+        with self._lock:
+            puntajes = {}
+
+            # 1. Nombre: cada palabra debe coincidir (prefijo exacto > prefijo > en medio)
+            if palabras:
+                for n, palabra in enumerate(palabras):
+                    puntos = defaultdict(float)
+                    for valor, id_cliente in self._por_prefijo(self._palabras, palabra):
+                        puntos[id_cliente] = max(puntos[id_cliente], 3.0 if valor == palabra else 2.0)
+                    if len(palabra) >= 3:
+                        for id_cliente in self._por_subcadena(palabra, self._nombres):
+                            puntos[id_cliente] = max(puntos[id_cliente], 1.0)
+                    if n == 0:
+                        puntajes = dict(puntos)
+                    else:
+                        puntajes = {i: p + puntos[i] for i, p in puntajes.items() if i in puntos}
+
+            # 2. Teléfono
+            if len(digitos) >= 3:
+                for _, id_cliente in self._por_prefijo(self._prefijos_tel, digitos):
+                    puntajes[id_cliente] = puntajes.get(id_cliente, 0) + 3.0
+                for id_cliente in self._por_subcadena(digitos, self._telefonos):
+                    puntajes.setdefault(id_cliente, 1.0)
+
+            orden = sorted(puntajes, key=lambda i: (-puntajes[i], self._nombres[i], i))
+            pagina = [list(self._clientes[i]) for i in orden[desplazamiento:desplazamiento + limite]]
+        return len(orden), pagina
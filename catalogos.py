@@ -0,0 +1,84 @@
+# Caché en memoria de los catálogos que casi no cambian (SERVICIO, ESTILISTA activos)
+import threading
+import time
+
+
+class CacheCatalogos:
+    """
+    Caché por proceso con TTL e invalidación explícita.
+
+    - Cada catálogo se registra con un 'cargador' (función sin argumentos que consulta la BD).
+    - Al vencer el TTL, un solo hilo recarga (single-flight); mientras tanto los demás
+      siguen sirviendo la copia anterior, así una expiración bajo carga no dispara
+      decenas de consultas iguales contra SQL Server.
+    - Si todavía no hay copia (primer uso o tras invalidar), los demás hilos esperan
+      la carga en curso en lugar de lanzar la suya.
+    """
+
+    def __init__(self, ttl=300.0):
+        self.ttl = ttl
+        self._cargadores = {}
+        self._valores = {}  # nombre -> (valor, instante de carga)
+        self._locks_carga = {}
+        self._generacion = 0  # cambia con cada invalidación
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'recargas': 0, 'errores': 0, 'invalidaciones': 0}
+
+    def registrar(self, nombre, cargador):
+        self._cargadores[nombre] = cargador
+        self._locks_carga[nombre] = threading.Lock()
+
+    def obtener(self, nombre):
+        """Devuelve el catálogo como tupla de tuplas (inmutable: se comparte entre solicitudes)."""
+        with self._lock:
+            entrada = self._valores.get(nombre)
+            vigente = entrada is not None and time.monotonic() - entrada[1] < self.ttl
+            self._stats['hits' if vigente else 'misses'] += 1
+        if vigente:
+            return entrada[0]
+
+        lock_carga = self._locks_carga[nombre]
+        if entrada is not None:
+            # Copia vencida: solo recarga quien consiga el lock, el resto sirve la anterior
+            if not lock_carga.acquire(blocking=False):
+                return entrada[0]
+        else:
+            lock_carga.acquire()
+
+        try:
+            # Otro hilo pudo haber recargado mientras esperábamos el lock
+            with self._lock:
+                actual = self._valores.get(nombre)
+                generacion = self._generacion
+            if actual is not None and actual is not entrada and time.monotonic() - actual[1] < self.ttl:
+                return actual[0]
+            try:
+                valor = tuple(tuple(fila) for fila in self._cargadores[nombre]())
+            except Exception:
+                with self._lock:
+                    self._stats['errores'] += 1
+                if entrada is not None:
+                    return entrada[0]  # Mejor una copia vencida que una página vacía
+                raise
+            with self._lock:
+                # Si hubo una invalidación durante la carga, no guardamos datos quizá viejos
+                if generacion == self._generacion:
+                    self._valores[nombre] = (valor, time.monotonic())
+                self._stats['recargas'] += 1
+            return valor
+        finally:
+            lock_carga.release()
+
+    def invalidar(self, *nombres):
+        """Descarta los catálogos indicados (o todos). Llamar tras escribir en esas tablas."""
+        with self._lock:
+            for nombre in nombres or list(self._valores):
+                self._valores.pop(nombre, None)
+            self._generacion += 1
+            self._stats['invalidaciones'] += 1
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._stats)
+            datos['catalogos'] = sorted(self._valores)
+        return datos
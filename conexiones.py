@@ -0,0 +1,318 @@
+# Pool de conexiones de base de datos compartido por todo el proceso
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, time as dt_time
+
+try:
+    import pyodbc
+except ImportError:  # El backend SQLite no necesita el driver ODBC instalado
+    pyodbc = None
+
+
+# -------------------------------------------------------------------
+# --- EXCEPCIONES COMUNES A TODOS LOS BACKENDS ---
+# -------------------------------------------------------------------
+
+# Tuplas usadas en los 'except' de las rutas para no depender de un driver concreto
+if pyodbc is not None:
+    IntegrityError = (pyodbc.IntegrityError, sqlite3.IntegrityError)
+    DatabaseError = (pyodbc.Error, sqlite3.Error)
+else:
+    IntegrityError = (sqlite3.IntegrityError,)
+    DatabaseError = (sqlite3.Error,)
+
+
+class PoolAgotado(Exception):
+    """Se lanza cuando no se obtiene una conexión libre antes del timeout."""
+
+
+# -------------------------------------------------------------------
+# --- BACKENDS (SQL SERVER Y SQLITE) ---
+# -------------------------------------------------------------------
+
+class BackendSQLServer:
+    """Crea conexiones pyodbc contra SQL Server con la cadena de conexión dada."""
+
+    nombre = 'sqlserver'
+
+    def __init__(self, conn_str, timeout_consulta=0):
+        self.conn_str = conn_str
+        self.timeout_consulta = timeout_consulta  # segundos por sentencia (0 = sin límite)
+
+    def conectar(self):
+        if pyodbc is None:
+            raise RuntimeError("pyodbc no está instalado: no se puede usar el backend SQL Server.")
+        conn = pyodbc.connect(self.conn_str)
+        if self.timeout_consulta:
+            conn.timeout = int(self.timeout_consulta)
+        return conn
+
+    def validar(self, conn):
+        """Consulta mínima para comprobar que la conexión sigue viva."""
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        cursor.close()
+
+
+# Adaptadores/convertidores para que SQLite devuelva date/time como pyodbc
+sqlite3.register_adapter(date, lambda valor: valor.isoformat())
+sqlite3.register_adapter(datetime, lambda valor: valor.isoformat(' '))
+sqlite3.register_adapter(dt_time, lambda valor: valor.strftime('%H:%M:%S'))
+sqlite3.register_converter('DATE', lambda valor: date.fromisoformat(valor.decode()))
+sqlite3.register_converter('TIME', lambda valor: dt_time.fromisoformat(valor.decode()))
+sqlite3.register_converter('DATETIME', lambda valor: datetime.fromisoformat(valor.decode()))
+
+
+class CursorSQLite:
+    """
+    Envoltorio de sqlite3.Cursor que acepta los parámetros al estilo pyodbc:
+    cursor.execute(query, a, b, c) o cursor.execute(query, (a, b, c)).
+    """
+
+    def __init__(self, cursor, conexion=None):
+        self._cursor = cursor
+        self._conexion = conexion
+
+    @staticmethod
+    def _normalizar(params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            return tuple(params[0])
+        return params
+
+    def execute(self, query, *params):
+        if self._conexion is not None:
+            self._conexion.iniciar_consulta()
+        try:
+            self._cursor.execute(query, self._normalizar(params))
+        finally:
+            if self._conexion is not None:
+                self._conexion.terminar_consulta()
+        return self
+
+    def executemany(self, query, filas):
+        self._cursor.executemany(query, filas)
+        return self
+
+    def nextset(self):
+        # SQLite no soporta múltiples result sets en una misma sentencia
+        return False
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+
+class ConexionSQLite:
+    """
+    Envoltorio de sqlite3.Connection que devuelve cursores compatibles con pyodbc.
+    Con timeout_consulta > 0 imita el 'timeout' de pyodbc: un progress handler
+    interrumpe el execute() que pase de ese tiempo (OperationalError 'interrupted').
+    """
+
+    def __init__(self, conn, timeout_consulta=0):
+        self._conn = conn
+        self._timeout_consulta = timeout_consulta
+        self._limite = None
+        if timeout_consulta:
+            conn.set_progress_handler(self._excedida, 10000)
+
+    def _excedida(self):
+        return 1 if self._limite is not None and time.monotonic() > self._limite else 0
+
+    def iniciar_consulta(self):
+        if self._timeout_consulta:
+            self._limite = time.monotonic() + self._timeout_consulta
+
+    def terminar_consulta(self):
+        self._limite = None
+
+    def cursor(self):
+        return CursorSQLite(self._conn.cursor(), self)
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+
+class BackendSQLite:
+    """Crea conexiones al archivo SQLite local (por ejemplo rossy_salon.db) para pruebas de carga."""
+
+    nombre = 'sqlite'
+
+    def __init__(self, ruta, timeout=30, timeout_consulta=0):
+        self.ruta = ruta
+        self.timeout = timeout
+        self.timeout_consulta = timeout_consulta
+
+    def conectar(self):
+        # check_same_thread=False: el pool entrega la conexión a un solo hilo a la vez
+        conn = sqlite3.connect(self.ruta, timeout=self.timeout,
+                               detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return ConexionSQLite(conn, self.timeout_consulta)
+
+    def validar(self, conn):
+        conn.execute("SELECT 1").fetchone()
+
+
+def insertar_devolviendo_id(cursor, backend, tabla, fila, columna_id):
+    """
+    INSERT de 'fila' (dict columna -> valor) que devuelve el ID generado en el mismo
+    viaje a la BD: OUTPUT INSERTED en SQL Server, RETURNING en SQLite (3.35+).
+    Evita el SELECT posterior por correo/teléfono para recuperar el ID.
+    """
+    columnas = ', '.join(fila)
+    marcas = ', '.join('?' for _ in fila)
+    if backend == 'sqlserver':
+        cursor.execute(f"INSERT INTO {tabla} ({columnas}) OUTPUT INSERTED.{columna_id} VALUES ({marcas})",
+                       *fila.values())
+        return cursor.fetchall()[0][0]
+    if sqlite3.sqlite_version_info >= (3, 35):
+        cursor.execute(f"INSERT INTO {tabla} ({columnas}) VALUES ({marcas}) RETURNING {columna_id}", *fila.values())
+        # fetchall() y no fetchone(): la sentencia debe terminar de ejecutarse antes del commit
+        return cursor.fetchall()[0][0]
+    cursor.execute(f"INSERT INTO {tabla} ({columnas}) VALUES ({marcas})", *fila.values())
+    return cursor.lastrowid
+
+
+def crear_backend(config, conn_str):
+    """Elige el backend según app.config['DB_BACKEND'] ('sqlserver' o 'sqlite')."""
+    nombre = config.get('DB_BACKEND', 'sqlserver')
+    timeout_consulta = config.get('DB_QUERY_TIMEOUT', 0)
+    if nombre == 'sqlite':
+        return BackendSQLite(config['SQLITE_PATH'], timeout_consulta=timeout_consulta)
+    if nombre == 'sqlserver':
+        return BackendSQLServer(conn_str, timeout_consulta=timeout_consulta)
+    raise ValueError(f"Backend de base de datos desconocido: {nombre}")
+
+
+# -------------------------------------------------------------------
+# --- POOL DE CONEXIONES ---
+# -------------------------------------------------------------------
+
+class PoolConexiones:
+    """
+    Pool acotado y seguro entre hilos. Reutiliza las conexiones en lugar de abrir
+    una nueva por solicitud, valida las que llevan tiempo sin usarse, descarta las
+    que superan 'max_inactividad' y limita la espera de checkout con 'timeout'.
+    """
+
+    def __init__(self, backend, tamano_max=10, timeout=5.0,
+                 max_inactividad=300.0, validar_despues_de=30.0):
+        self.backend = backend
+        self.tamano_max = tamano_max
+        self.timeout = timeout
+        self.max_inactividad = max_inactividad
+        self.validar_despues_de = validar_despues_de
+
+        self._libres = deque()  # (conexion, instante en que se devolvió)
+        self._en_uso = 0
+        self._cond = threading.Condition()
+        self._stats = {'creadas': 0, 'checkouts': 0, 'esperas': 0,
+                       'timeouts': 0, 'descartadas': 0, 'validaciones_fallidas': 0}
+
+    # --- Checkout / devolución ---
+
+    def obtener(self):
+        """Entrega una conexión sana; espera como máximo 'timeout' segundos si el pool está lleno."""
+        limite = time.monotonic() + self.timeout
+        with self._cond:
+            esperando = False
+            while True:
+                self._desalojar_inactivas()
+                if self._libres:
+                    conn, devuelta_en = self._libres.pop()  # LIFO: la más reciente está "caliente"
+                    self._en_uso += 1
+                    break
+                if self._en_uso < self.tamano_max:
+                    conn, devuelta_en = None, None
+                    self._en_uso += 1
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolAgotado(f"No hay conexiones libres tras {self.timeout}s "
+                                      f"({self.tamano_max} en uso).")
+                if not esperando:
+                    self._stats['esperas'] += 1
+                    esperando = True
+                self._cond.wait(restante)
+            self._stats['checkouts'] += 1
+
+        # Crear/validar fuera del lock para no bloquear a los demás hilos
+        try:
+            if conn is not None and time.monotonic() - devuelta_en > self.validar_despues_de:
+                try:
+                    self.backend.validar(conn)
+                except Exception:
+                    self._stats_inc('validaciones_fallidas')
+                    self._cerrar_silencioso(conn)
+                    conn = None
+            if conn is None:
+                conn = self.backend.conectar()
+                self._stats_inc('creadas')
+            return conn
+        except Exception:
+            with self._cond:
+                self._en_uso -= 1
+                self._cond.notify()
+            raise
+
+    def devolver(self, conn, descartar=False):
+        """Devuelve la conexión al pool tras deshacer cualquier transacción abierta."""
+        if not descartar:
+            try:
+                conn.rollback()
+            except Exception:
+                descartar = True
+        if descartar:
+            self._cerrar_silencioso(conn)
+        with self._cond:
+            self._en_uso -= 1
+            if descartar:
+                self._stats['descartadas'] += 1
+            else:
+                self._libres.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    # --- Mantenimiento ---
+
+    def _desalojar_inactivas(self):
+        """Cierra las conexiones libres que superan 'max_inactividad'. Se llama con el lock tomado."""
+        ahora = time.monotonic()
+        # Las más antiguas están al principio de la deque
+        while self._libres and ahora - self._libres[0][1] > self.max_inactividad:
+            conn, _ = self._libres.popleft()
+            self._stats['descartadas'] += 1
+            self._cerrar_silencioso(conn)
+
+    def cerrar(self):
+        """Cierra todas las conexiones libres (las que están en uso se cierran al devolverse)."""
+        with self._cond:
+            while self._libres:
+                conn, _ = self._libres.popleft()
+                self._cerrar_silencioso(conn)
+
+    def metricas(self):
+        """Estado actual y contadores acumulados del pool."""
+        with self._cond:
+            datos = dict(self._stats)
+            datos.update(backend=self.backend.nombre, en_uso=self._en_uso,
+                         libres=len(self._libres), tamano_max=self.tamano_max)
+        return datos
+
+    def _stats_inc(self, clave):
+        with self._cond:
+            self._stats[clave] += 1
+
+    @staticmethod
+    def _cerrar_silencioso(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,264 @@
+# Credenciales: hashes con sal, búsqueda por correo en una sola consulta, caché negativa y límite de intentos
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Almacén único de credenciales (clientes y estilistas), con el hash en lugar de la clave.
+# Rol + IDUsuario apuntan a la fila de CLIENTE o ESTILISTA.
+DDL_CREDENCIAL = {
+    'sqlserver': """
+    IF OBJECT_ID('CREDENCIAL', 'U') IS NULL
+    CREATE TABLE CREDENCIAL (
+        Correo NVARCHAR(255) NOT NULL PRIMARY KEY,
+        Rol NVARCHAR(20) NOT NULL,
+        IDUsuario INT NOT NULL,
+        Hash NVARCHAR(255) NOT NULL,
+        Actualizada DATETIME2 NOT NULL DEFAULT SYSDATETIME()
+    )
+    """,
+    'sqlite': """
+    CREATE TABLE IF NOT EXISTS CREDENCIAL (
+        Correo TEXT NOT NULL PRIMARY KEY,
+        Rol TEXT NOT NULL,
+        IDUsuario INTEGER NOT NULL,
+        Hash TEXT NOT NULL,
+        Actualizada DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+}
+
+# El login busca el correo ya normalizado (normalizar_correo). SQL Server compara sin distinguir
+# mayúsculas, pero SQLite no: ahí se pasan a minúsculas los correos guardados tal como se escribieron,
+# salvo los que chocarían con otra fila (esos quedan para revisarlos a mano).
+DDL_CORREOS_MINUSCULAS = {
+    'sqlserver': [],
+    'sqlite': [
+        """
+        UPDATE CLIENTE SET Correo = LOWER(TRIM(Correo))
+        WHERE Correo <> LOWER(TRIM(Correo))
+          AND NOT EXISTS (SELECT 1 FROM CLIENTE C2 WHERE LOWER(TRIM(C2.Correo)) = LOWER(TRIM(CLIENTE.Correo))
+                          AND C2.IDCliente <> CLIENTE.IDCliente)
+        """,
+        "UPDATE ESTILISTA SET Correo = LOWER(TRIM(Correo)) WHERE Correo <> LOWER(TRIM(Correo))",
+        """
+        UPDATE CREDENCIAL SET Correo = LOWER(TRIM(Correo))
+        WHERE Correo <> LOWER(TRIM(Correo))
+          AND NOT EXISTS (SELECT 1 FROM CREDENCIAL C2 WHERE LOWER(TRIM(C2.Correo)) = LOWER(TRIM(CREDENCIAL.Correo))
+                          AND C2.Correo <> CREDENCIAL.Correo)
+        """,
+    ],
+}
+
+# Un solo viaje a la BD: la credencial (si ya existe) y las filas de CLIENTE / ESTILISTA con ese
+# correo, cada parte resuelta por su índice único de Correo. Columnas: Origen, Rol, ID, Nombre, Secreto
+_CONSULTA_CLIENTE_ESTILISTA = """
+SELECT 'CLIENTE', 'Cliente', IDCliente, Nombre, contraseña FROM CLIENTE WHERE Correo = ?
+UNION ALL
+SELECT 'ESTILISTA', 'Estilista', IDEstilista, Nombre, Telefono FROM ESTILISTA WHERE Correo = ?
+"""
+CONSULTA_LOGIN = """
+SELECT 'CREDENCIAL', Rol, IDUsuario, NULL, Hash FROM CREDENCIAL WHERE Correo = ?
+UNION ALL""" + _CONSULTA_CLIENTE_ESTILISTA
+
+# Prioridad al resolver: la credencial con hash manda; sin ella, el cliente antes que la estilista (como antes)
+_ORDEN_ORIGEN = {'CREDENCIAL': 0, 'CLIENTE': 1, 'ESTILISTA': 2}
+
+
+def normalizar_correo(correo):
+    """Correo tal como se guarda y se busca en CLIENTE, ESTILISTA y CREDENCIAL (sin espacios, en minúsculas)."""
+    return correo.strip().lower() if correo else correo
+
+
+_HASHES_FICTICIOS = {}
+
+
+def _hash_ficticio(metodo):
+    # Hash de una clave al azar con el mismo factor de trabajo, para comparar cuando el correo no existe
+    if metodo not in _HASHES_FICTICIOS:
+        _HASHES_FICTICIOS[metodo] = crear_hash(secrets.token_urlsafe(16), metodo)
+    return _HASHES_FICTICIOS[metodo]
+
+
+def crear_hash(clave, metodo):
+    """Hash con sal al estilo werkzeug ('scrypt:N:r:p$sal$hash' o 'pbkdf2:sha256:iteraciones$sal$hash')."""
+    return generate_password_hash(clave, method=metodo)
+
+
+def necesita_rehash(hash_guardado, metodo):
+    """True si el hash se creó con otro método o factor de trabajo que el configurado."""
+    return not hash_guardado.startswith(metodo + '$')
+
+
+def buscar(cursor, correo, con_credencial=True):
+    """Filas (Origen, Rol, ID, Nombre, Secreto) del correo, en orden de prioridad."""
+    if con_credencial:
+        cursor.execute(CONSULTA_LOGIN, correo, correo, correo)
+    else:
+        cursor.execute(_CONSULTA_CLIENTE_ESTILISTA, correo, correo)
+    return sorted(cursor.fetchall(), key=lambda fila: _ORDEN_ORIGEN[fila[0]])
+
+
+def verificar(filas, clave, metodo):
+    """
+    Devuelve (rol, id_usuario, nombre, hash_nuevo) si la clave es correcta, o None.
+    'hash_nuevo' no es None cuando hay que guardar la credencial: la cuenta todavía
+    no estaba migrada (clave en texto plano en CLIENTE/ESTILISTA) o su hash usa un
+    factor de trabajo distinto al configurado.
+    """
+    if not clave:
+        return None
+    if not filas:
+        # Correo inexistente: se paga el mismo hash que con una cuenta real, para no delatar qué correos existen
+        check_password_hash(_hash_ficticio(metodo), clave)
+        return None
+    nombres = {(fila[1], fila[2]): fila[3] for fila in filas if fila[0] != 'CREDENCIAL'}
+    if filas and filas[0][0] == 'CREDENCIAL':
+        _, rol, id_usuario, _, hash_guardado = filas[0]
+        if not check_password_hash(hash_guardado, clave):
+            return None
+        hash_nuevo = crear_hash(clave, metodo) if necesita_rehash(hash_guardado, metodo) else None
+        return rol, id_usuario, nombres.get((rol, id_usuario)), hash_nuevo
+
+    for _, rol, id_usuario, nombre, secreto in filas:
+        if secreto and hmac.compare_digest(str(secreto).encode(), clave.encode()):
+            return rol, id_usuario, nombre, crear_hash(clave, metodo)
+    return None
+
+
+def guardar(cursor, correo, rol, id_usuario, hash_clave):
+    """Crea o actualiza la credencial del correo. No hace commit."""
+    cursor.execute("UPDATE CREDENCIAL SET Rol = ?, IDUsuario = ?, Hash = ? WHERE Correo = ?",
+                   rol, id_usuario, hash_clave, correo)
+    if cursor.rowcount == 0:
+        cursor.execute("INSERT INTO CREDENCIAL (Correo, Rol, IDUsuario, Hash) VALUES (?, ?, ?, ?)",
+                       correo, rol, id_usuario, hash_clave)
+
+
+def migrar(cursor, backend, metodo, borrar_texto_plano=False):
+    """
+    Crea CREDENCIAL si falta y le agrega, con hash, las cuentas que aún no tienen
+    credencial: clientes (columna contraseña) y estilistas (Telefono). Con
+    'borrar_texto_plano' vacía CLIENTE.contraseña de las cuentas migradas.
+    Devuelve cuántas credenciales se crearon. No hace commit.
+    """
+    cursor.execute(DDL_CREDENCIAL[backend])
+    cursor.execute("""
+    SELECT Correo, 'Cliente', IDCliente, contraseña FROM CLIENTE
+    WHERE Correo NOT IN (SELECT Correo FROM CREDENCIAL) AND contraseña IS NOT NULL AND contraseña <> ''
+    UNION ALL
+    SELECT Correo, 'Estilista', IDEstilista, Telefono FROM ESTILISTA
+    WHERE Correo NOT IN (SELECT Correo FROM CREDENCIAL) AND Correo IS NOT NULL AND Telefono IS NOT NULL
+    """)
+    nuevas, vistos = [], set()
+    for correo, rol, id_usuario, clave in cursor.fetchall():
+        correo = normalizar_correo(correo)
+        if correo in vistos:  # mismo correo como cliente y estilista: gana el cliente, como en el login
+            continue
+        vistos.add(correo)
+        nuevas.append((correo, rol, id_usuario, crear_hash(str(clave), metodo)))
+    if nuevas:
+        cursor.executemany("INSERT INTO CREDENCIAL (Correo, Rol, IDUsuario, Hash) VALUES (?, ?, ?, ?)", nuevas)
+    if borrar_texto_plano:
+        cursor.execute("UPDATE CLIENTE SET contraseña = '' WHERE Correo IN (SELECT Correo FROM CREDENCIAL)")
+    return len(nuevas)
+
+
+# -------------------------------------------------------------------
+# --- CACHÉ NEGATIVA Y LÍMITE DE INTENTOS ---
+# -------------------------------------------------------------------
+
+class CacheNegativa:
+    """
+    Correos que no existen en ninguna tabla, recordados 'ttl' segundos (acotada a
+    'max_entradas', LRU). Un ataque con listas de correos ajenos se responde sin
+    tocar la BD. El TTL es corto porque un registro hecho en otro proceso no la limpia.
+    """
+
+    def __init__(self, ttl=60, max_entradas=10000):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._correos = OrderedDict()  # correo -> vence
+        self._stats = {'hits': 0, 'agregados': 0}
+
+    def contiene(self, correo):
+        with self._lock:
+            vence = self._correos.get(correo)
+            if vence is None:
+                return False
+            if vence < time.monotonic():
+                del self._correos[correo]
+                return False
+            self._correos.move_to_end(correo)
+            self._stats['hits'] += 1
+            return True
+
+    def agregar(self, correo):
+        with self._lock:
+            self._correos[correo] = time.monotonic() + self.ttl
+            self._correos.move_to_end(correo)
+            self._stats['agregados'] += 1
+            while len(self._correos) > self.max_entradas:
+                self._correos.popitem(last=False)
+
+    def olvidar(self, correo=None):
+        """Quita un correo (tras registrarlo) o vacía la caché (tras una importación)."""
+        with self._lock:
+            if correo is None:
+                self._correos.clear()
+            else:
+                self._correos.pop(correo, None)
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._stats)
+            datos['entradas'] = len(self._correos)
+        return datos
+
+
+class LimitadorIntentos:
+    """
+    Cubeta de fichas por clave (p. ej. 'ip:1.2.3.4' o 'cuenta:ana@x.com'): hasta
+    'capacidad' intentos seguidos, que se recargan a razón de capacidad/periodo por
+    segundo. Acotado a 'max_claves' (LRU); una cubeta que se olvida vuelve llena.
+    """
+
+    def __init__(self, capacidad, periodo, max_claves=10000):
+        self.capacidad = capacidad
+        self.recarga = capacidad / periodo
+        self.max_claves = max_claves
+        self._lock = threading.Lock()
+        self._cubetas = OrderedDict()  # clave -> (fichas, instante)
+        self._stats = {'bloqueos': 0}
+
+    def _fichas(self, clave, ahora):
+        fichas, instante = self._cubetas.get(clave, (self.capacidad, ahora))
+        return min(self.capacidad, fichas + (ahora - instante) * self.recarga)
+
+    def espera(self, clave):
+        """Segundos que faltan para poder intentar (0 si hay fichas). No consume."""
+        ahora = time.monotonic()
+        with self._lock:
+            fichas = self._fichas(clave, ahora)
+            if fichas >= 1:
+                return 0
+            self._stats['bloqueos'] += 1
+            return int((1 - fichas) / self.recarga) + 1
+
+    def consumir(self, clave):
+        ahora = time.monotonic()
+        with self._lock:
+            self._cubetas[clave] = (max(self._fichas(clave, ahora) - 1, 0), ahora)
+            self._cubetas.move_to_end(clave)
+            while len(self._cubetas) > self.max_claves:
+                self._cubetas.popitem(last=False)
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._stats)
+            datos['claves'] = len(self._cubetas)
+        return datos
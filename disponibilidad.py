@@ -0,0 +1,306 @@
+# Índice en memoria de disponibilidad de horarios por estilista y día
+import bisect
+import threading
+from datetime import date, datetime, time, timedelta
+
+
+def normalizar_fecha(fecha):
+    """Acepta date/datetime o 'YYYY-MM-DD' y devuelve siempre la cadena ISO."""
+    if isinstance(fecha, datetime):
+        return fecha.date().isoformat()
+    if isinstance(fecha, date):
+        return fecha.isoformat()
+    return date.fromisoformat(str(fecha)[:10]).isoformat()
+
+
+def normalizar_hora(hora):
+    """Acepta time/datetime o 'HH:MM[:SS]' y devuelve siempre 'HH:MM:SS' (formato de app.config['HOURS'])."""
+    if isinstance(hora, (time, datetime)):
+        return hora.strftime('%H:%M:%S')
+    return time.fromisoformat(str(hora)[:8]).strftime('%H:%M:%S')
+
+
+def minutos(hora):
+    """Minutos desde la medianoche de una hora (time/datetime o 'HH:MM[:SS]')."""
+    hora = normalizar_hora(hora)
+    return int(hora[:2]) * 60 + int(hora[3:5])
+
+
+def hora_de_minutos(total):
+    """Inversa de minutos(): 570 -> '09:30:00'."""
+    return f"{total // 60:02d}:{total % 60:02d}:00"
+
+
+def hora_ampm(total):
+    """Etiqueta para los <select> y las sugerencias: 570 -> '9:30 a.m.'."""
+    return time(total // 60, total % 60).strftime('%I:%M %p').lstrip('0').replace('AM', 'a.m.').replace('PM', 'p.m.')
+
+
+# -------------------------------------------------------------------
+# --- INTERVALOS ORDENADOS ---
+# -------------------------------------------------------------------
+
+class IntervalosOrdenados:
+    """
+    Intervalos [inicio, fin) en minutos, ordenados por inicio, con el máximo
+    acumulado de los fines ('_fin_max[i]' = mayor fin entre los i+1 primeros).
+    Con eso, saber si [a, b) choca con algo es una búsqueda binaria: hay choque
+    si algún intervalo que empieza antes de 'b' termina después de 'a'.
+
+    Costos: choca() es O(log n). agregar() y quitar() son O(n): desplazan las
+    listas y recalculan '_fin_max' desde la posición tocada. Con n = citas de
+    un estilista en un día (decenas a lo sumo) es más barato que un árbol.
+
+    Tolera intervalos que ya se solapan entre sí (citas viejas o importadas):
+    se guardan tal cual y cada uno se puede quitar por separado.
+    """
+
+    def __init__(self, intervalos=()):
+        self._intervalos = sorted((int(inicio), int(fin)) for inicio, fin in intervalos)
+        self._inicios = [inicio for inicio, _ in self._intervalos]
+        self._fin_max = []
+        self._recalcular(0)
+
+    def _recalcular(self, desde):
+        del self._fin_max[desde:]
+        maximo = self._fin_max[-1] if self._fin_max else 0
+        for _, fin in self._intervalos[desde:]:
+            maximo = max(maximo, fin)
+            self._fin_max.append(maximo)
+
+    def __len__(self):
+        return len(self._intervalos)
+
+    def __iter__(self):
+        return iter(self._intervalos)
+
+    def choca(self, inicio, fin):
+        i = bisect.bisect_left(self._inicios, fin)
+        return i > 0 and self._fin_max[i - 1] > inicio
+
+    def agregar(self, inicio, fin):
+        i = bisect.bisect_right(self._intervalos, (inicio, fin))
+        self._intervalos.insert(i, (inicio, fin))
+        self._inicios.insert(i, inicio)
+        self._recalcular(i)
+
+    def quitar(self, inicio, fin):
+        """Quita una aparición de [inicio, fin). Devuelve False si no estaba."""
+        i = bisect.bisect_left(self._intervalos, (inicio, fin))
+        if i == len(self._intervalos) or self._intervalos[i] != (inicio, fin):
+            return False
+        del self._intervalos[i]
+        del self._inicios[i]
+        self._recalcular(i)
+        return True
+
+    def huecos(self, desde, hasta):
+        """Tramos libres dentro de [desde, hasta), en orden. Salta directo al primer intervalo relevante."""
+        i = bisect.bisect_right(self._inicios, desde)
+        cursor = max(desde, self._fin_max[i - 1]) if i else desde
+        while i < len(self._intervalos) and self._inicios[i] < hasta:
+            inicio, fin = self._intervalos[i]
+            if inicio > cursor:
+                yield cursor, inicio
+            cursor = max(cursor, fin)
+            i += 1
+        if cursor < hasta:
+            yield cursor, hasta
+
+
+def inicios_libres(ocupados, turnos, duracion, paso, desde=0):
+    """
+    Minutos de inicio (múltiplos de 'paso') en los que cabe un servicio de
+    'duracion' minutos: dentro de un turno y sin chocar con 'ocupados'.
+    'desde' descarta los inicios anteriores (p. ej. las horas de hoy que ya pasaron).
+    """
+    resultado = []
+    for inicio_turno, fin_turno in turnos:
+        for inicio, fin in ocupados.huecos(max(inicio_turno, desde), fin_turno):
+            # Primer múltiplo de 'paso' dentro del hueco
+            candidato = -(-inicio // paso) * paso
+            while candidato + duracion <= fin:
+                resultado.append(candidato)
+                candidato += paso
+    return resultado
+
+
+def dentro_de_turno(turnos, inicio, fin):
+    return any(inicio_turno <= inicio and fin <= fin_turno for inicio_turno, fin_turno in turnos)
+
+
+# -------------------------------------------------------------------
+# --- ÍNDICE DE DISPONIBILIDAD ---
+# -------------------------------------------------------------------
+
+class IndiceDisponibilidad:
+    """
+    Guarda, por (estilista, fecha), los intervalos ocupados por sus citas activas
+    (hora de inicio + duración del servicio). Cada día se carga una sola vez desde
+    CITA (de forma perezosa, con 'cargador') y a partir de ahí las reservas se
+    resuelven en memoria y bajo lock, de modo que dos solicitudes simultáneas
+    no pueden tomar horarios que se solapan.
+
+    'turnos(id_estilista, fecha)' devuelve los tramos [inicio, fin) en minutos en
+    que el estilista trabaja ese día (vacío si es su día libre); los descansos
+    son los huecos entre turnos.
+
+    Flujo de una reserva:
+        reservar() -> INSERT + commit -> (nada más, el intervalo queda ocupado)
+                   -> si el INSERT falla -> liberar()
+    """
+
+    def __init__(self, cargador, turnos):
+        # cargador(id_estilista, fecha) -> [(hora, duracion_min)] de las citas activas
+        self._cargador = cargador
+        self._turnos = turnos
+        self._ocupados = {}  # (id_estilista, 'YYYY-MM-DD') -> IntervalosOrdenados
+        self._lock = threading.Lock()
+        self._ultima_purga = None
+
+    # --- Carga perezosa ---
+
+    def _dia(self, id_estilista, fecha):
+        """
+        Devuelve los intervalos del día, cargándolos desde la BD si aún no están en
+        memoria. Se usa el objeto devuelto (no una nueva búsqueda por clave), porque
+        invalidar() puede quitar el día del diccionario en cualquier momento.
+        """
+        clave = (int(id_estilista), normalizar_fecha(fecha))
+        with self._lock:
+            intervalos = self._ocupados.get(clave)
+            if intervalos is not None:
+                return intervalos
+
+        # La consulta se hace fuera del lock para no frenar a los demás días
+        intervalos = IntervalosOrdenados((minutos(hora), minutos(hora) + int(duracion))
+                                         for hora, duracion in self._cargador(*clave))
+
+        with self._lock:
+            # Antes de agregarlo, para no purgar en el acto un día pasado recién cargado
+            self._purgar_pasados()
+            # Si otro hilo lo cargó mientras tanto, su versión (con sus reservas) manda
+            return self._ocupados.setdefault(clave, intervalos)
+
+    def precargar(self, id_estilista, dias):
+        """
+        Carga de una vez varios días del estilista ({fecha: [(hora, duracion_min)]}),
+        leídos con una sola consulta, para no hacer una por día. Los días que ya
+        estaban en memoria se dejan como están (pueden tener reservas en curso).
+        """
+        cargados = {(int(id_estilista), normalizar_fecha(fecha)):
+                    IntervalosOrdenados((minutos(hora), minutos(hora) + int(duracion)) for hora, duracion in citas)
+                    for fecha, citas in dias.items()}
+        with self._lock:
+            for clave, intervalos in cargados.items():
+                self._ocupados.setdefault(clave, intervalos)
+            self._purgar_pasados()
+
+    def _purgar_pasados(self):
+        """Olvida los días anteriores a hoy (una vez por día). Se llama con el lock tomado."""
+        hoy = date.today().isoformat()
+        if self._ultima_purga == hoy:
+            return
+        self._ultima_purga = hoy
+        for clave in [c for c in self._ocupados if c[1] < hoy]:
+            del self._ocupados[clave]
+
+    # --- Consultas ---
+
+    def esta_libre(self, id_estilista, fecha, hora, duracion):
+        """True si el servicio cabe en un turno del estilista y no choca con otra cita o reserva."""
+        inicio = minutos(hora)
+        if not dentro_de_turno(self._turnos(id_estilista, fecha), inicio, inicio + duracion):
+            return False
+        ocupados = self._dia(id_estilista, fecha)
+        with self._lock:
+            return not ocupados.choca(inicio, inicio + duracion)
+
+    def horas_libres(self, id_estilista, fecha, duracion, paso):
+        """Lista de hora_24 (cada 'paso' minutos) en las que cabe un servicio de 'duracion' minutos."""
+        turnos = self._turnos(id_estilista, fecha)
+        if not turnos:
+            return []
+        ocupados = self._dia(id_estilista, fecha)
+        with self._lock:
+            inicios = inicios_libres(ocupados, turnos, duracion, paso)
+        return [hora_de_minutos(inicio) for inicio in inicios]
+
+    # --- Reservas ---
+
+    def reservar(self, id_estilista, fecha, hora, duracion):
+        """
+        Ocupa [hora, hora + duracion) si estaba libre. Devuelve False si choca con
+        otra cita; lanza ValueError si cae fuera del horario del estilista.
+        """
+        inicio = minutos(hora)
+        fin = inicio + duracion
+        if not dentro_de_turno(self._turnos(id_estilista, fecha), inicio, fin):
+            raise ValueError(f"El horario {normalizar_hora(hora)}-{hora_de_minutos(fin)} "
+                             f"está fuera de la jornada del estilista.")
+        clave = (int(id_estilista), normalizar_fecha(fecha))
+        while True:
+            ocupados = self._dia(id_estilista, fecha)
+            with self._lock:
+                if self._ocupados.get(clave) is not ocupados:
+                    continue  # invalidado entre la carga y la reserva: una reserva ahí se perdería, se relee
+                if ocupados.choca(inicio, fin):
+                    return False
+                ocupados.agregar(inicio, fin)
+                return True
+
+    def liberar(self, id_estilista, fecha, hora, duracion):
+        """Deshace una reserva fallida o libera el intervalo de una cita cancelada."""
+        inicio = minutos(hora)
+        clave = (int(id_estilista), normalizar_fecha(fecha))
+        with self._lock:
+            if clave in self._ocupados:
+                self._ocupados[clave].quitar(inicio, inicio + duracion)
+
+    def invalidar(self, id_estilista=None, fecha=None):
+        """Descarta días cargados para que se relean de la BD (todo si no se indica nada)."""
+        with self._lock:
+            if id_estilista is None and fecha is None:
+                self._ocupados.clear()
+                return
+            fecha = normalizar_fecha(fecha) if fecha is not None else None
+            for clave in list(self._ocupados):
+                if (id_estilista is None or clave[0] == int(id_estilista)) and \
+                        (fecha is None or clave[1] == fecha):
+                    del self._ocupados[clave]
+
+
+def buscar_slots_libres(estilistas, ocupadas, fecha_desde, fecha_hasta, turnos, duracion, paso, limite,
+                        ahora=None):
+    """
+    Devuelve los primeros 'limite' horarios (día x hora x estilista, en orden
+    cronológico) en los que cabe un servicio de 'duracion' minutos. 'ocupadas' son
+    las filas (IDEstilista, Fecha, Hora, DuracionMin) de CITA del rango, obtenidas
+    con una sola consulta; no se consulta slot por slot.
+    """
+    por_dia = {}
+    for id_est, fecha, hora, duracion_cita in ocupadas:
+        inicio = minutos(hora)
+        por_dia.setdefault((int(id_est), normalizar_fecha(fecha)), []).append((inicio, inicio + int(duracion_cita)))
+    ahora = ahora or datetime.now()
+    hoy = ahora.date()
+
+    resultado = []
+    dia = max(fecha_desde, hoy)
+    while dia <= fecha_hasta:
+        fecha_iso = dia.isoformat()
+        # Los horarios de hoy que ya pasaron no se ofrecen
+        desde = ahora.hour * 60 + ahora.minute + 1 if dia == hoy else 0
+        candidatos = []
+        for orden, (id_estilista, nombre_estilista) in enumerate(estilistas):
+            ocupados = IntervalosOrdenados(por_dia.get((int(id_estilista), fecha_iso), ()))
+            for inicio in inicios_libres(ocupados, turnos(id_estilista, dia), duracion, paso, desde):
+                candidatos.append((inicio, orden, id_estilista, nombre_estilista))
+        for inicio, _, id_estilista, nombre_estilista in sorted(candidatos):
+            resultado.append({'id_estilista': id_estilista, 'estilista': nombre_estilista,
+                              'fecha': fecha_iso, 'hora_24': hora_de_minutos(inicio), 'hora_ampm': hora_ampm(inicio),
+                              'hora_fin': hora_de_minutos(inicio + duracion)})
+            if len(resultado) >= limite:
+                return resultado
+        dia += timedelta(days=1)
+    return resultado
@@ -0,0 +1,171 @@
+# Escritor con commit agrupado: junta escrituras pequeñas y concurrentes en menos transacciones
+import queue
+import threading
+
+
+class Tarea:
+    def __init__(self, trabajo):
+        self.trabajo = trabajo
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._estado = 'en_cola'  # 'en_cola' -> 'tomada' (la corre el escritor) o 'cancelada' (no se correrá)
+
+    def tomar(self):
+        """El escritor la reserva para correrla. False si quien la encoló ya se cansó de esperar."""
+        with self._lock:
+            if self._estado == 'cancelada':
+                return False
+            self._estado = 'tomada'
+            return True
+
+    def cancelar(self):
+        """La retira si el escritor todavía no la tomó. False si ya se está corriendo (o terminó)."""
+        with self._lock:
+            if self._estado == 'tomada':
+                return False
+            self._estado = 'cancelada'
+            return True
+
+    def resolver(self, resultado):
+        self.resultado = resultado
+        self.listo.set()
+
+    def fallar(self, error):
+        self.error = error
+        self.listo.set()
+
+
+class EscritorAgrupado:
+    """
+    Un hilo con su propia conexión ejecuta los trabajos encolados por las
+    solicitudes. Cada trabajo es una función trabajo(cursor) -> resultado que
+    hace sus INSERT/UPDATE sin commit. El hilo toma todos los trabajos que hay
+    en la cola (hasta 'max_lote'), los corre en una sola transacción y hace un
+    único commit. Con poca carga el lote es de uno y se comporta como antes;
+    con carga, N reservas simultáneas pagan un commit en lugar de N y no se
+    pelean por el bloqueo de escritura.
+
+    Si un trabajo del lote falla se deshace el lote completo y cada trabajo se
+    repite en su propia transacción, para que el error le llegue solo al
+    culpable. Por eso los trabajos solo deben tocar la BD (se pueden repetir).
+
+    La conexión no sale del pool: las solicitudes que esperan al escritor ya
+    tienen una del pool cada una, y con el pool lleno el escritor nunca
+    conseguiría la suya.
+    """
+
+    def __init__(self, backend, max_lote=32):
+        self.backend = backend
+        self.max_lote = max_lote
+        self._conn = None
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._stats = {'trabajos': 0, 'lotes': 0, 'commits': 0, 'reintentos_individuales': 0,
+                       'fallidos': 0, 'cancelados': 0, 'lote_max': 0}
+
+    def ejecutar(self, trabajo, timeout=30):
+        """
+        Encola el trabajo y espera su commit. Devuelve su resultado o relanza su excepción.
+        Si en 'timeout' segundos el escritor ni siquiera lo tomó, se cancela y lanza
+        TimeoutError: el trabajo no se hizo (quien reservó algo puede liberarlo). Si ya
+        se está corriendo, se espera a que termine para informar lo que de verdad pasó.
+        """
+        self._arrancar()
+        tarea = Tarea(trabajo)
+        self._cola.put(tarea)
+        if not tarea.listo.wait(timeout):
+            if tarea.cancelar():
+                self._contar('cancelados')
+                raise TimeoutError(f"La escritura no se hizo: el escritor no la tomó en {timeout} s.")
+            tarea.listo.wait()  # el lote en curso termina (commit o error) dentro del timeout de la BD
+        if tarea.error is not None:
+            raise tarea.error
+        return tarea.resultado
+
+    def _arrancar(self):
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name='escritor-agrupado', daemon=True)
+                self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            lote = [self._cola.get()]
+            # Lo que llegó mientras se confirmaba el lote anterior viaja en este
+            while len(lote) < self.max_lote:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            self._procesar(lote)
+
+    def _procesar(self, lote):
+        # Las canceladas por timeout se saltan: quien las encoló ya informó que no se hicieron
+        lote = [tarea for tarea in lote if tarea.tomar()]
+        if not lote:
+            return
+        with self._lock:
+            self._stats['lotes'] += 1
+            self._stats['trabajos'] += len(lote)
+            self._stats['lote_max'] = max(self._stats['lote_max'], len(lote))
+        try:
+            if self._conn is None:
+                self._conn = self.backend.conectar()
+        except Exception as e:
+            self._fallar_todas(lote, e)
+            return
+
+        conn = self._conn
+        try:
+            cursor = conn.cursor()
+            try:
+                resultados = [tarea.trabajo(cursor) for tarea in lote]
+                conn.commit()
+                self._contar('commits')
+            except Exception as error_lote:
+                conn.rollback()
+                if len(lote) == 1:
+                    self._fallar_todas(lote, error_lote)
+                    return
+                self._contar('reintentos_individuales')
+                # Se aísla al trabajo que falló repitiendo cada uno por separado
+                for tarea in lote:
+                    try:
+                        resultado = tarea.trabajo(cursor)
+                        conn.commit()
+                        self._contar('commits')
+                    except Exception as e:
+                        conn.rollback()
+                        self._fallar_todas([tarea], e)
+                    else:
+                        tarea.resolver(resultado)
+                return
+            for tarea, resultado in zip(lote, resultados):
+                tarea.resolver(resultado)
+        except Exception as e:
+            # La conexión quedó inservible (p. ej. se cayó el servidor a mitad del lote): el próximo lote abre otra
+            self._conn = None
+            try:
+                conn.close()
+            except Exception:
+                pass
+            self._fallar_todas([tarea for tarea in lote if not tarea.listo.is_set()], e)
+
+    def _fallar_todas(self, tareas, error):
+        with self._lock:
+            self._stats['fallidos'] += len(tareas)
+        for tarea in tareas:
+            tarea.fallar(error)
+
+    def _contar(self, clave):
+        with self._lock:
+            self._stats[clave] += 1
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._stats)
+        datos['en_cola'] = self._cola.qsize()
+        return datos
@@ -0,0 +1,211 @@
+# Lista de espera: clientes que quieren un hueco y el emparejador que les asigna los horarios que se liberan
+import heapq
+import threading
+from datetime import date, timedelta
+
+from disponibilidad import minutos, normalizar_fecha
+
+# Una fila por solicitud. IDEstilista NULL = cualquier estilista. La ventana de horas es
+# donde debe caber el servicio completo: inicio >= HoraDesde y fin <= HoraHasta.
+DDL_LISTA_ESPERA = {
+    'sqlserver': [
+        """
+        IF OBJECT_ID('LISTA_ESPERA', 'U') IS NULL
+        CREATE TABLE LISTA_ESPERA (
+            IDEspera INT IDENTITY(1, 1) PRIMARY KEY,
+            IDCliente INT NOT NULL REFERENCES CLIENTE (IDCliente),
+            IDServicio INT NOT NULL REFERENCES SERVICIO (IDServicio),
+            IDEstilista INT NULL REFERENCES ESTILISTA (IDEstilista),
+            FechaDesde DATE NOT NULL,
+            FechaHasta DATE NOT NULL,
+            HoraDesde TIME NOT NULL,
+            HoraHasta TIME NOT NULL,
+            Prioridad INT NOT NULL DEFAULT 0,
+            Estado NVARCHAR(20) NOT NULL DEFAULT 'Activa',
+            IDCita INT NULL REFERENCES CITA (IDCita),
+            Creada DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+            CHECK (FechaDesde <= FechaHasta),
+            CHECK (HoraDesde < HoraHasta)
+        )
+        """,
+        """
+        IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_LISTA_ESPERA_Estado_FechaHasta')
+        CREATE INDEX IX_LISTA_ESPERA_Estado_FechaHasta ON LISTA_ESPERA (Estado, FechaHasta)
+        """,
+        """
+        IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_LISTA_ESPERA_Cliente')
+        CREATE INDEX IX_LISTA_ESPERA_Cliente ON LISTA_ESPERA (IDCliente, Estado)
+        """,
+    ],
+    'sqlite': [
+        """
+        CREATE TABLE IF NOT EXISTS LISTA_ESPERA (
+            IDEspera INTEGER PRIMARY KEY AUTOINCREMENT,
+            IDCliente INTEGER NOT NULL REFERENCES CLIENTE (IDCliente),
+            IDServicio INTEGER NOT NULL REFERENCES SERVICIO (IDServicio),
+            IDEstilista INTEGER REFERENCES ESTILISTA (IDEstilista),
+            FechaDesde DATE NOT NULL,
+            FechaHasta DATE NOT NULL,
+            HoraDesde TIME NOT NULL,
+            HoraHasta TIME NOT NULL,
+            Prioridad INTEGER NOT NULL DEFAULT 0,
+            Estado TEXT NOT NULL DEFAULT 'Activa',
+            IDCita INTEGER REFERENCES CITA (IDCita),
+            Creada DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            CHECK (FechaDesde <= FechaHasta),
+            CHECK (HoraDesde < HoraHasta)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS IX_LISTA_ESPERA_Estado_FechaHasta ON LISTA_ESPERA (Estado, FechaHasta)",
+        "CREATE INDEX IF NOT EXISTS IX_LISTA_ESPERA_Cliente ON LISTA_ESPERA (IDCliente, Estado)",
+    ],
+}
+
+# Columnas que entiende Solicitud, en este orden
+COLUMNAS = "IDEspera, IDCliente, IDServicio, IDEstilista, FechaDesde, FechaHasta, HoraDesde, HoraHasta, Prioridad"
+
+MAX_DIAS = 31  # rango máximo de fechas de una solicitud
+
+
+class YaAsignada(Exception):
+    """La solicitud dejó de estar activa (la asignó otro proceso o el cliente la canceló)."""
+
+
+class Solicitud:
+    def __init__(self, id_espera, id_cliente, id_servicio, id_estilista, fecha_desde, fecha_hasta,
+                 hora_desde, hora_hasta, prioridad=0):
+        self.id = int(id_espera)
+        self.id_cliente = int(id_cliente)
+        self.id_servicio = int(id_servicio)
+        self.id_estilista = int(id_estilista) if id_estilista is not None else None
+        self.fecha_desde = date.fromisoformat(normalizar_fecha(fecha_desde))
+        self.fecha_hasta = date.fromisoformat(normalizar_fecha(fecha_hasta))
+        self.hora_desde = minutos(hora_desde)
+        self.hora_hasta = minutos(hora_hasta)
+        self.prioridad = int(prioridad or 0)
+
+
+def validar(fecha_desde, fecha_hasta, hora_desde, hora_hasta, duracion, hoy=None):
+    """Lanza ValueError si la ventana pedida no tiene sentido o no admite el servicio."""
+    hoy = hoy or date.today()
+    desde = date.fromisoformat(normalizar_fecha(fecha_desde))
+    hasta = date.fromisoformat(normalizar_fecha(fecha_hasta))
+    if desde < hoy or hasta < desde:
+        raise ValueError("El rango de fechas no es válido.")
+    if (hasta - desde).days >= MAX_DIAS:
+        raise ValueError(f"El rango de fechas puede cubrir como máximo {MAX_DIAS} días.")
+    if minutos(hora_hasta) - minutos(hora_desde) < duracion:
+        raise ValueError("El servicio no cabe entre la hora inicial y la final elegidas.")
+
+
+class EmparejadorEspera:
+    """
+    Solicitudes activas indexadas por (estilista o None, fecha, minuto de inicio),
+    con un montículo por clave ordenado por (Prioridad, orden de llegada). Cada
+    solicitud se anota en todos los inicios de la grilla ('paso' minutos) en los
+    que cabe su servicio, así que al liberarse un horario solo se miran las claves
+    de ese tramo, nunca la tabla completa: mejor candidato en O(log n).
+
+    Las solicitudes asignadas o canceladas se borran de forma perezosa: se quitan
+    del diccionario y sus entradas se descartan al llegar a la cima del montículo.
+    """
+
+    def __init__(self, paso=30):
+        self.paso = paso
+        self._lock = threading.Lock()
+        self._solicitudes = {}  # id -> Solicitud activa
+        self._monticulos = {}  # (id_estilista | None, 'YYYY-MM-DD', inicio) -> [(prioridad, orden, id)]
+        self._orden = 0
+        self._stats = {'agregadas': 0, 'asignadas': 0, 'busquedas': 0}
+
+    def agregar(self, solicitud, duracion, hoy=None):
+        hoy = hoy or date.today()
+        with self._lock:
+            self._orden += 1
+            entrada = (solicitud.prioridad, self._orden, solicitud.id)
+            self._solicitudes[solicitud.id] = solicitud
+            self._stats['agregadas'] += 1
+            dia = max(solicitud.fecha_desde, hoy)
+            # Primer inicio de la grilla dentro de la ventana
+            primero = -(-solicitud.hora_desde // self.paso) * self.paso
+            while dia <= solicitud.fecha_hasta:
+                fecha = dia.isoformat()
+                for inicio in range(primero, solicitud.hora_hasta - duracion + 1, self.paso):
+                    heapq.heappush(self._monticulos.setdefault((solicitud.id_estilista, fecha, inicio), []), entrada)
+                dia += timedelta(days=1)
+
+    def quitar(self, id_espera, asignada=False):
+        with self._lock:
+            if self._solicitudes.pop(id_espera, None) is not None and asignada:
+                self._stats['asignadas'] += 1
+
+    def candidatos(self, id_estilista, fecha, inicio, fin, limite=20):
+        """
+        Hasta 'limite' solicitudes (y la hora de inicio que les toca) que podrían
+        ocupar el tramo libre [inicio, fin) de ese estilista y día, de mejor a peor.
+        Lista [(Solicitud, inicio)]; quien la use decide si de verdad cabe.
+        """
+        fecha = normalizar_fecha(fecha)
+        claves = [(estilista, fecha, minuto)
+                  for minuto in range(-(-inicio // self.paso) * self.paso, fin, self.paso)
+                  for estilista in (int(id_estilista), None)]
+        elegidas, vistas, sacadas = [], set(), []
+        with self._lock:
+            self._stats['busquedas'] += 1
+            monticulos = [(clave, self._monticulos.get(clave)) for clave in claves]
+            monticulos = [(clave, m) for clave, m in monticulos if m]
+            while len(elegidas) < limite:
+                # Cima más baja entre las pocas claves del tramo (a igualdad, el inicio más temprano)
+                mejor = None
+                for clave, monticulo in monticulos:
+                    while monticulo and monticulo[0][2] not in self._solicitudes:
+                        heapq.heappop(monticulo)  # solicitud ya asignada o cancelada
+                    if monticulo and (mejor is None or monticulo[0] < mejor[1][0]):
+                        mejor = (clave, monticulo)
+                if mejor is None:
+                    break
+                clave, monticulo = mejor
+                entrada = heapq.heappop(monticulo)
+                sacadas.append((monticulo, entrada))
+                if entrada[2] not in vistas:
+                    vistas.add(entrada[2])
+                    elegidas.append((self._solicitudes[entrada[2]], clave[2]))
+            # Solo se consultó: las entradas vuelven a su montículo
+            for monticulo, entrada in sacadas:
+                heapq.heappush(monticulo, entrada)
+            for clave, monticulo in monticulos:
+                if not monticulo:
+                    del self._monticulos[clave]
+        return elegidas
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._stats)
+            datos.update(activas=len(self._solicitudes), claves=len(self._monticulos))
+        return datos
+
+
+# -------------------------------------------------------------------
+# --- CONSULTAS ---
+# -------------------------------------------------------------------
+
+def cargar_activas(cursor, hoy=None):
+    """Solicitudes activas que todavía no vencieron, en orden de llegada."""
+    cursor.execute(f"SELECT {COLUMNAS} FROM LISTA_ESPERA WHERE Estado = 'Activa' AND FechaHasta >= ? "
+                   "ORDER BY IDEspera", hoy or date.today())
+    return [Solicitud(*fila) for fila in cursor.fetchall()]
+
+
+def marcar_asignada(cursor, id_espera, id_cita):
+    """Pasa la solicitud a 'Asignada' solo si sigue activa. No hace commit."""
+    cursor.execute("UPDATE LISTA_ESPERA SET Estado = 'Asignada', IDCita = ? WHERE IDEspera = ? AND Estado = 'Activa'",
+                   id_cita, id_espera)
+    if cursor.rowcount != 1:
+        raise YaAsignada(f"La solicitud {id_espera} ya no está activa.")
+
+
+def cancelar(cursor, id_espera, id_cliente):
+    """El cliente retira su solicitud. Devuelve True si estaba activa. No hace commit."""
+    cursor.execute("UPDATE LISTA_ESPERA SET Estado = 'Cancelada' WHERE IDEspera = ? AND IDCliente = ? AND Estado = 'Activa'",
+                   id_espera, id_cliente)
+    return cursor.rowcount == 1
@@ -0,0 +1,122 @@
+# Cambios de estado de citas en lote: una validación y un UPDATE por conjunto, en una sola transacción
+ESTADOS = ('Pendiente', 'En Proceso', 'Realizada', 'Cancelada')
+
+# Estados que ocupan el horario del estilista (todos menos Cancelada)
+ESTADOS_ACTIVOS = ('Pendiente', 'En Proceso', 'Realizada')
+
+# Transiciones permitidas. Realizada y Cancelada son finales: reactivar una cancelada
+# exigiría volver a comprobar el horario, así que se agenda una cita nueva.
+TRANSICIONES = {
+    'Pendiente': ('En Proceso', 'Realizada', 'Cancelada'),
+    'En Proceso': ('Pendiente', 'Realizada', 'Cancelada'),
+    'Realizada': (),
+    'Cancelada': (),
+}
+
+MAX_CAMBIOS = 100  # por solicitud; el UPDATE usa 5 parámetros por cita (SQL Server admite 2100)
+
+
+class ConflictoEstado(Exception):
+    """Otra solicitud cambió alguna de las citas entre la lectura y el UPDATE: se deshace el lote."""
+
+
+class CitaCambiada:
+    """Datos de una cita que sí cambió, para liberar su horario y avisar a las agendas después del commit."""
+
+    def __init__(self, id_cita, id_estilista, fecha, hora, id_servicio, precio, estado_anterior, estado):
+        self.id_cita = id_cita
+        self.id_estilista = id_estilista
+        self.fecha = fecha
+        self.hora = hora
+        self.id_servicio = id_servicio
+        self.precio = precio
+        self.estado_anterior = estado_anterior
+        self.estado = estado
+
+
+def leer_cambios(datos):
+    """
+    Normaliza la lista de cambios de una solicitud: [{'id_cita': 1, 'estado': 'Realizada'}, ...].
+    Devuelve [(id_cita, estado)] o lanza ValueError con el motivo.
+    """
+    if not isinstance(datos, list) or not datos:
+        raise ValueError("Se espera una lista 'cambios' no vacía.")
+    if len(datos) > MAX_CAMBIOS:
+        raise ValueError(f"Máximo {MAX_CAMBIOS} cambios por solicitud.")
+    cambios = []
+    for item in datos:
+        try:
+            cambios.append((int(item['id_cita']), str(item['estado'])))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Cada cambio necesita 'id_cita' (entero) y 'estado'.")
+    return cambios
+
+
+def aplicar_cambios(cursor, cambios, id_estilista=None):
+    """
+    Valida y aplica [(id_cita, estado_nuevo)] sin hacer commit:
+
+    1. Un SELECT trae todas las citas pedidas (IDCita IN (...)).
+    2. Cada una se valida en memoria: que exista, que sea del estilista (si se da
+       'id_estilista') y que la transición esté permitida.
+    3. Un solo UPDATE con CASE aplica todas las válidas. Lleva como condición el
+       estado leído en el paso 1, así que si otra solicitud cambió alguna entre
+       medio, el número de filas no cuadra y se lanza ConflictoEstado.
+
+    Devuelve (resultados, cambiadas): un dict por cambio pedido, en el mismo orden
+    (id_cita, ok, estado_anterior, estado, error), y las CitaCambiada aplicadas.
+    """
+    ids = list(dict.fromkeys(id_cita for id_cita, _ in cambios))
+    marcas = ', '.join('?' for _ in ids)
+    cursor.execute(f"""
+    SELECT C.IDCita, C.IDEstilista, C.Fecha, C.Hora, C.Estado, C.IDServicio, S.Precio
+    FROM CITA C
+    JOIN SERVICIO S ON C.IDServicio = S.IDServicio
+    WHERE C.IDCita IN ({marcas})
+    """, *ids)
+    citas = {fila[0]: fila for fila in cursor.fetchall()}
+
+    resultados, validos, vistos = [], [], set()
+    for id_cita, estado in cambios:
+        resultado = {'id_cita': id_cita, 'ok': False, 'estado_anterior': None, 'estado': estado, 'error': None}
+        resultados.append(resultado)
+        cita = citas.get(id_cita)
+        if id_cita in vistos:
+            resultado['error'] = "Cita repetida en la solicitud."
+        elif estado not in ESTADOS:
+            resultado['error'] = f"Estado no válido: {estado}."
+        elif cita is None:
+            resultado['error'] = "Cita no encontrada."
+        elif id_estilista is not None and cita[1] != id_estilista:
+            resultado['error'] = "Acceso denegado. No puedes modificar esta cita."
+        elif cita[4] == estado:
+            resultado.update(ok=True, estado_anterior=estado)  # ya estaba así: nada que hacer
+        elif estado not in TRANSICIONES.get(cita[4], ()):
+            resultado.update(estado_anterior=cita[4], error=f"No se puede pasar de '{cita[4]}' a '{estado}'.")
+        else:
+            resultado.update(ok=True, estado_anterior=cita[4])
+            validos.append((cita, estado))
+        vistos.add(id_cita)
+
+    if not validos:
+        return resultados, []
+
+    casos = ' '.join('WHEN ? THEN ?' for _ in validos)
+    marcas = ', '.join('?' for _ in validos)
+    params = [valor for cita, estado in validos for valor in (cita[0], estado)]
+    params += [cita[0] for cita, _ in validos]
+    params += [valor for cita, _ in validos for valor in (cita[0], cita[4])]
+    filtro_estilista = ''
+    if id_estilista is not None:
+        filtro_estilista = ' AND IDEstilista = ?'
+        params.append(id_estilista)
+    cursor.execute(f"""
+    UPDATE CITA SET Estado = CASE IDCita {casos} END
+    WHERE IDCita IN ({marcas}) AND Estado = CASE IDCita {casos} END{filtro_estilista}
+    """, *params)
+    if cursor.rowcount != len(validos):
+        raise ConflictoEstado("Alguna cita cambió mientras se procesaba la solicitud. Vuelve a intentarlo.")
+
+    cambiadas = [CitaCambiada(cita[0], cita[1], cita[2], cita[3], cita[5], cita[6], cita[4], estado)
+                 for cita, estado in validos]
+    return resultados, cambiadas
@@ -0,0 +1,145 @@
+# Bus de eventos en proceso (pub/sub) y su serialización como Server-Sent Events
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+
+class DemasiadosSuscriptores(Exception):
+    """Se alcanzó el tope de conexiones SSE abiertas en este proceso."""
+
+
+class Suscripcion:
+    """Cola acotada de un suscriptor. Si se llena (cliente lento), queda marcada como desbordada."""
+
+    def __init__(self, canales, capacidad):
+        self.canales = tuple(canales)
+        self.cola = queue.Queue(maxsize=capacidad)
+        self.desbordada = False
+        self.activa = True
+
+    def entregar(self, evento):
+        try:
+            self.cola.put_nowait(evento)
+        except queue.Full:
+            self.desbordada = True
+
+    def siguiente(self, timeout):
+        """Próximo evento, o None si no llegó ninguno en 'timeout' segundos."""
+        try:
+            return self.cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class BusEventos:
+    """
+    Pub/sub en memoria por canal (p. ej. 'agenda:2025-01-31' o 'agenda:2025-01-31:3').
+    Publicar no toca la BD ni bloquea: reparte el evento a las colas de los suscriptores.
+    Guarda los últimos 'historial' eventos para que un cliente que se reconecta con
+    Last-Event-ID reciba lo que se perdió.
+
+    Cada evento es una tupla (id, canal, tipo, datos) con id creciente en el proceso.
+    """
+
+    def __init__(self, max_suscriptores=500, capacidad_cola=100, historial=500):
+        self.max_suscriptores = max_suscriptores
+        self.capacidad_cola = capacidad_cola
+        self._lock = threading.Lock()
+        self._por_canal = {}  # canal -> set(Suscripcion)
+        self._total = 0
+        self._secuencia = 0
+        self._historial = deque(maxlen=historial)
+
+    def publicar(self, canales, tipo, datos):
+        with self._lock:
+            for canal in canales:
+                self._secuencia += 1
+                evento = (self._secuencia, canal, tipo, datos)
+                self._historial.append(evento)
+                for suscripcion in self._por_canal.get(canal, ()):
+                    suscripcion.entregar(evento)
+
+    def hay_suscriptores(self, canales):
+        with self._lock:
+            return any(self._por_canal.get(canal) for canal in canales)
+
+    def suscribir(self, canales, ultimo_id=None):
+        """
+        Registra un suscriptor y devuelve (suscripcion, pendientes, completo): los eventos
+        posteriores a 'ultimo_id' que siguen en el historial y si el historial alcanzó
+        para cubrir el hueco (si no, el cliente debe recargar la vista completa).
+        """
+        with self._lock:
+            if self._total >= self.max_suscriptores:
+                raise DemasiadosSuscriptores()
+            suscripcion = Suscripcion(canales, self.capacidad_cola)
+            for canal in suscripcion.canales:
+                self._por_canal.setdefault(canal, set()).add(suscripcion)
+            self._total += 1
+
+            pendientes, completo = [], True
+            if ultimo_id is not None and ultimo_id > self._secuencia:
+                completo = False  # id de otro proceso (o de antes de un reinicio): no hay cómo completar
+            elif ultimo_id is not None and ultimo_id < self._secuencia:
+                completo = self._historial[0][0] <= ultimo_id + 1
+                pendientes = [evento for evento in self._historial
+                              if evento[0] > ultimo_id and evento[1] in suscripcion.canales]
+        return suscripcion, pendientes, completo
+
+    def cancelar(self, suscripcion):
+        """Da de baja al suscriptor. Idempotente: puede llamarse desde el generador y desde el cierre."""
+        with self._lock:
+            if not suscripcion.activa:
+                return
+            suscripcion.activa = False
+            for canal in suscripcion.canales:
+                suscriptores = self._por_canal.get(canal)
+                if suscriptores and suscripcion in suscriptores:
+                    suscriptores.discard(suscripcion)
+                    if not suscriptores:
+                        del self._por_canal[canal]
+            self._total -= 1
+
+    def metricas(self):
+        with self._lock:
+            return {'suscriptores': self._total, 'canales': len(self._por_canal), 'ultimo_id': self._secuencia}
+
+
+# -------------------------------------------------------------------
+# --- FORMATO SSE ---
+# -------------------------------------------------------------------
+
+def formatear_sse(id_evento, tipo, datos):
+    linea_id = f"id: {id_evento}\n" if id_evento is not None else ""
+    return f"{linea_id}event: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+def flujo_sse(bus, suscripcion, pendientes, completo, latido=15, duracion_max=1800):
+    """
+    Generador para un Response 'text/event-stream'. Envía un comentario de latido cada
+    'latido' segundos (mantiene viva la conexión a través de proxies) y cierra tras
+    'duracion_max' segundos; EventSource se reconecta solo con Last-Event-ID.
+    """
+    try:
+        yield "retry: 3000\n\n"
+        if not completo:
+            yield formatear_sse(None, 'recargar', {})
+        for id_evento, _, tipo, datos in pendientes:
+            yield formatear_sse(id_evento, tipo, datos)
+
+        limite = time.monotonic() + duracion_max
+        while time.monotonic() < limite:
+            evento = suscripcion.siguiente(timeout=latido)
+            if suscripcion.desbordada:
+                # Se perdieron eventos: la vista debe recargarse completa
+                yield formatear_sse(None, 'recargar', {})
+                return
+            if evento is None:
+                yield ": latido\n\n"
+                continue
+            id_evento, _, tipo, datos = evento
+            yield formatear_sse(id_evento, tipo, datos)
+    finally:
+        bus.cancelar(suscripcion)
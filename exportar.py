@@ -0,0 +1,80 @@
+# Exportación en streaming (CSV / JSONL) de citas e ingresos
+import csv
+import io
+import json
+from decimal import Decimal
+
+# Cada reporte: (columnas de salida, consulta con parámetros desde/hasta)
+REPORTES = {
+    'citas': (
+        ['IDCita', 'Fecha', 'Hora', 'Estado', 'IDCliente', 'Cliente', 'TelefonoCliente', 'CorreoCliente',
+         'IDServicio', 'Servicio', 'Precio', 'IDEstilista', 'Estilista'],
+        """
+        SELECT C.IDCita, C.Fecha, C.Hora, C.Estado,
+               CL.IDCliente, CL.Nombre, CL.Telefono, CL.Correo,
+               S.IDServicio, S.NombreServicio, S.Precio,
+               E.IDEstilista, E.Nombre
+        FROM CITA C
+        JOIN CLIENTE CL ON C.IDCliente = CL.IDCliente
+        JOIN SERVICIO S ON C.IDServicio = S.IDServicio
+        JOIN ESTILISTA E ON C.IDEstilista = E.IDEstilista
+        WHERE C.Fecha BETWEEN ? AND ?
+        ORDER BY C.Fecha, C.Hora, C.IDCita
+        """,
+    ),
+    'ingresos': (
+        ['Fecha', 'Servicio', 'CitasRealizadas', 'Ingresos'],
+        """
+        SELECT C.Fecha, S.NombreServicio, COUNT(*), SUM(S.Precio)
+        FROM CITA C
+        JOIN SERVICIO S ON C.IDServicio = S.IDServicio
+        WHERE C.Fecha BETWEEN ? AND ?
+          AND C.Estado = 'Realizada'
+        GROUP BY C.Fecha, S.NombreServicio
+        ORDER BY C.Fecha, S.NombreServicio
+        """,
+    ),
+}
+
+FORMATOS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def iterar_filas(cursor, tamano_lote=1000):
+    """Recorre el resultado en lotes con fetchmany: memoria constante sin importar el rango."""
+    while True:
+        lote = cursor.fetchmany(tamano_lote)
+        if not lote:
+            break
+        yield lote
+
+
+def _valor_json(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return str(valor)  # date, time, datetime
+
+
+def generar_reporte(cursor, reporte, desde, hasta, formato='csv', tamano_lote=1000):
+    """
+    Ejecuta la consulta del reporte y va entregando texto por lotes (un 'chunk'
+    por cada fetchmany), listo para un Response de Flask o para escribir a archivo.
+    """
+    columnas, query = REPORTES[reporte]
+    cursor.execute(query, desde, hasta)
+
+    if formato == 'csv':
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        escritor.writerow(columnas)
+        yield buffer.getvalue()
+        for lote in iterar_filas(cursor, tamano_lote):
+            buffer.seek(0)
+            buffer.truncate()
+            escritor.writerows(lote)
+            yield buffer.getvalue()
+    elif formato == 'jsonl':
+        for lote in iterar_filas(cursor, tamano_lote):
+            yield ''.join(json.dumps(dict(zip(columnas, fila)), default=_valor_json, ensure_ascii=False) + '\n'
+                          for fila in lote)
+    else:
+        raise ValueError(f"Formato no soportado: {formato}")
@@ -0,0 +1,95 @@
+# Caché de fragmentos HTML renderizados, con llaves que incluyen la versión de los datos
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from markupsafe import Markup
+
+
+class VersionesDatos:
+    """
+    Un contador por tabla ('CITA', 'SERVICIO', ...) que sube cada vez que la app
+    escribe en ella. Un fragmento guardado con versiones viejas ya no coincide.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versiones = defaultdict(int)
+
+    def incrementar(self, *tablas):
+        with self._lock:
+            for tabla in tablas:
+                self._versiones[tabla] += 1
+
+    def version(self, tablas):
+        with self._lock:
+            return tuple(self._versiones[tabla] for tabla in tablas)
+
+
+class CacheFragmentos:
+    """
+    LRU de fragmentos por (nombre, clave). Cada entrada guarda las versiones de
+    las tablas de las que depende; si alguna cambió, se vuelve a renderizar.
+    El 'ttl' cubre las escrituras hechas por otros procesos, que no suben las
+    versiones de este.
+    """
+
+    def __init__(self, versiones, ttl=300, max_entradas=256):
+        self.versiones = versiones
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # (nombre, clave) -> (versiones, expira, html)
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def renderizar(self, nombre, tablas, clave, generar):
+        llave = (nombre, clave)
+        versiones = self.versiones.version(tablas)
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(llave)
+            if entrada and entrada[0] == versiones and entrada[1] > ahora:
+                self._entradas.move_to_end(llave)
+                self._stats['hits'] += 1
+                return entrada[2]
+            self._stats['misses'] += 1
+
+        # Se renderiza fuera del lock; si dos hilos lo hacen a la vez, el resultado es el mismo
+        html = Markup(generar())
+        with self._lock:
+            self._entradas[llave] = (versiones, ahora + self.ttl, html)
+            self._entradas.move_to_end(llave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return html
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._stats)
+            datos['entradas'] = len(self._entradas)
+        return datos
+
+
+class ListaPerezosa:
+    """
+    Lista que se carga recién al usarse. Se le pasa a la plantilla en lugar de las
+    filas: si el fragmento que la usa sale de la caché, la consulta nunca corre.
+    """
+
+    def __init__(self, cargador):
+        self._cargador = cargador
+        self._filas = None
+
+    def _cargar(self):
+        if self._filas is None:
+            self._filas = self._cargador()
+        return self._filas
+
+    def __iter__(self):
+        return iter(self._cargar())
+
+    def __len__(self):
+        return len(self._cargar())
+
+    def __bool__(self):
+        return bool(self._cargar())
@@ -0,0 +1,110 @@
+# Jornadas de trabajo por estilista (turnos, descansos, días libres) y duración de los servicios
+from collections import defaultdict
+from datetime import date
+
+from disponibilidad import hora_ampm, hora_de_minutos, minutos, normalizar_fecha
+
+# Tablas del motor de horarios. DiaSemana sigue a date.weekday(): 0 = lunes ... 6 = domingo.
+# Un estilista puede tener varios turnos el mismo día; el hueco entre ellos es su descanso.
+DDL_HORARIOS = {
+    'sqlserver': [
+        """
+        IF COL_LENGTH('SERVICIO', 'DuracionMin') IS NULL
+        ALTER TABLE SERVICIO ADD DuracionMin INT NULL
+        """,
+        """
+        IF OBJECT_ID('HORARIO_ESTILISTA', 'U') IS NULL
+        CREATE TABLE HORARIO_ESTILISTA (
+            IDHorario INT IDENTITY(1, 1) PRIMARY KEY,
+            IDEstilista INT NOT NULL REFERENCES ESTILISTA (IDEstilista),
+            DiaSemana TINYINT NOT NULL CHECK (DiaSemana BETWEEN 0 AND 6),
+            HoraInicio TIME NOT NULL,
+            HoraFin TIME NOT NULL,
+            CHECK (HoraInicio < HoraFin)
+        )
+        """,
+        """
+        IF OBJECT_ID('AUSENCIA_ESTILISTA', 'U') IS NULL
+        CREATE TABLE AUSENCIA_ESTILISTA (
+            IDEstilista INT NOT NULL REFERENCES ESTILISTA (IDEstilista),
+            Fecha DATE NOT NULL,
+            Motivo NVARCHAR(100) NULL,
+            PRIMARY KEY (IDEstilista, Fecha)
+        )
+        """,
+    ],
+    'sqlite': [
+        # SQLite no tiene "ADD COLUMN IF NOT EXISTS": preparar_esquema() revisa antes la columna
+        "ALTER TABLE SERVICIO ADD COLUMN DuracionMin INTEGER",
+        """
+        CREATE TABLE IF NOT EXISTS HORARIO_ESTILISTA (
+            IDHorario INTEGER PRIMARY KEY AUTOINCREMENT,
+            IDEstilista INTEGER NOT NULL REFERENCES ESTILISTA (IDEstilista),
+            DiaSemana INTEGER NOT NULL CHECK (DiaSemana BETWEEN 0 AND 6),
+            HoraInicio TIME NOT NULL,
+            HoraFin TIME NOT NULL,
+            CHECK (HoraInicio < HoraFin)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS AUSENCIA_ESTILISTA (
+            IDEstilista INTEGER NOT NULL REFERENCES ESTILISTA (IDEstilista),
+            Fecha DATE NOT NULL,
+            Motivo TEXT,
+            PRIMARY KEY (IDEstilista, Fecha)
+        )
+        """,
+    ],
+}
+
+
+def preparar_esquema(cursor, backend):
+    """Agrega SERVICIO.DuracionMin y crea las tablas de jornadas si faltan. No hace commit."""
+    for sentencia in DDL_HORARIOS[backend]:
+        if backend == 'sqlite' and 'DuracionMin' in sentencia:
+            cursor.execute("PRAGMA table_info(SERVICIO)")
+            if any(columna[1] == 'DuracionMin' for columna in cursor.fetchall()):
+                continue
+        cursor.execute(sentencia)
+
+
+def grilla_horas(apertura, cierre, paso):
+    """
+    Horas de inicio que se ofrecen en los formularios: de 'apertura' a 'cierre'
+    cada 'paso' minutos, como [(hora_24, hora_ampm)]. Reemplaza a la lista fija
+    de 90 minutos; si el servicio cabe o no lo decide el índice de disponibilidad.
+    """
+    return [(hora_de_minutos(inicio), hora_ampm(inicio))
+            for inicio in range(minutos(apertura), minutos(cierre) - paso + 1, paso)]
+
+
+class Jornadas:
+    """
+    Turnos de trabajo por estilista, armados con las filas de HORARIO_ESTILISTA
+    (IDEstilista, DiaSemana, HoraInicio, HoraFin) y AUSENCIA_ESTILISTA (IDEstilista, Fecha).
+
+    - Un estilista sin filas en HORARIO_ESTILISTA trabaja el horario del salón todos los días.
+    - Si tiene filas, los días de la semana sin turno son sus días libres.
+    - Una ausencia deja sin turnos ese día puntual (vacaciones, permisos).
+    """
+
+    def __init__(self, turnos=(), ausencias=(), apertura='09:00', cierre='21:00'):
+        self.salon = [(minutos(apertura), minutos(cierre))]
+        self._turnos = defaultdict(lambda: defaultdict(list))  # id_estilista -> día de la semana -> [(inicio, fin)]
+        for id_estilista, dia_semana, hora_inicio, hora_fin in turnos:
+            self._turnos[int(id_estilista)][int(dia_semana)].append((minutos(hora_inicio), minutos(hora_fin)))
+        for por_dia in self._turnos.values():
+            for lista in por_dia.values():
+                lista.sort()
+        self._ausencias = {(int(id_estilista), normalizar_fecha(fecha)) for id_estilista, fecha in ausencias}
+
+    def turnos(self, id_estilista, fecha):
+        """Tramos [inicio, fin) en minutos que el estilista trabaja ese día (vacío si no trabaja)."""
+        id_estilista = int(id_estilista)
+        fecha = normalizar_fecha(fecha)
+        if (id_estilista, fecha) in self._ausencias:
+            return []
+        propios = self._turnos.get(id_estilista)
+        if propios is None:
+            return self.salon
+        return propios.get(date.fromisoformat(fecha).weekday(), [])
@@ -0,0 +1,73 @@
+# Claves de idempotencia para los formularios que escriben (reservas y registros)
+import threading
+import time
+from collections import OrderedDict
+
+
+class Envio:
+    """Un POST identificado por su clave. 'resultado' queda en None si no hay nada que repetir."""
+
+    def __init__(self, expira):
+        self.expira = expira
+        self.listo = threading.Event()
+        self.resultado = None
+
+
+class AlmacenIdempotencia:
+    """
+    Recuerda durante 'ttl' segundos el resultado de cada envío, identificado por
+    la clave aleatoria que viaja oculta en el formulario. Un segundo POST con la
+    misma clave (doble clic, reintento de una red móvil) no vuelve a escribir:
+    espera a que termine el primero y recibe la misma respuesta.
+
+    Es por proceso y en memoria: cubre los duplicados que llegan al mismo worker,
+    que son los de un mismo navegador en pocos segundos.
+    """
+
+    def __init__(self, ttl=600, max_entradas=10000):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._envios = OrderedDict()  # clave -> Envio, en orden de llegada
+        self._stats = {'nuevos': 0, 'duplicados': 0, 'descartados': 0}
+
+    def comenzar(self, clave):
+        """Devuelve (envio, es_primero). Si no es el primero, hay que esperar a envio.listo."""
+        ahora = time.monotonic()
+        with self._lock:
+            self._purgar(ahora)
+            envio = self._envios.get(clave)
+            if envio is not None:
+                self._stats['duplicados'] += 1
+                return envio, False
+            envio = self._envios[clave] = Envio(ahora + self.ttl)
+            self._stats['nuevos'] += 1
+            return envio, True
+
+    def terminar(self, envio, resultado):
+        """Guarda la respuesta del primer envío y despierta a los duplicados que esperaban."""
+        envio.resultado = resultado
+        envio.listo.set()
+
+    def descartar(self, clave, envio):
+        """El primer envío falló sin respuesta repetible: se olvida la clave para que un reintento se procese."""
+        with self._lock:
+            if self._envios.get(clave) is envio:
+                del self._envios[clave]
+            self._stats['descartados'] += 1
+        envio.listo.set()
+
+    def _purgar(self, ahora):
+        # Todas las entradas viven lo mismo, así que las vencidas están al principio
+        while self._envios:
+            clave, envio = next(iter(self._envios.items()))
+            if envio.expira > ahora and len(self._envios) < self.max_entradas:
+                break
+            del self._envios[clave]
+            envio.listo.set()
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._stats)
+            datos['entradas'] = len(self._envios)
+        return datos
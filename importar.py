@@ -0,0 +1,340 @@
+# Carga masiva de clientes, servicios y citas históricas desde CSV / JSONL
+import csv
+import io
+import json
+from datetime import date, datetime
+
+import credenciales
+from busqueda import normalizar_texto, solo_digitos
+from disponibilidad import normalizar_hora
+
+ESTADOS_VALIDOS = ('Pendiente', 'En Proceso', 'Realizada', 'Cancelada')
+
+# Nombres de columna aceptados (ya normalizados) -> campo interno
+ALIAS_COLUMNAS = {
+    'nombre': 'nombre', 'nombre_completo': 'nombre', 'cliente': 'nombre',
+    'telefono': 'telefono', 'tel': 'telefono', 'celular': 'telefono',
+    'correo': 'correo', 'email': 'correo', 'e_mail': 'correo',
+    'fecha_registro': 'fecha_registro', 'fecharegistro': 'fecha_registro',
+    'contrasena': 'contrasena', 'password': 'contrasena',
+    'nombreservicio': 'nombre', 'nombre_servicio': 'nombre', 'servicio': 'servicio', 'precio': 'precio',
+    'correo_cliente': 'correo_cliente', 'cliente_correo': 'correo_cliente',
+    'telefono_cliente': 'telefono_cliente', 'cliente_telefono': 'telefono_cliente',
+    'estilista': 'estilista', 'nombre_estilista': 'estilista',
+    'fecha': 'fecha', 'hora': 'hora', 'estado': 'estado',
+}
+
+
+class FilaInvalida(Exception):
+    """Error de validación de una fila (se reporta y se sigue con la siguiente)."""
+
+
+# -------------------------------------------------------------------
+# --- LECTURA EN STREAMING ---
+# -------------------------------------------------------------------
+
+def _normalizar_columna(nombre):
+    return ALIAS_COLUMNAS.get(normalizar_texto(nombre).replace(' ', '_'), normalizar_texto(nombre))
+
+
+def leer_filas(archivo, formato):
+    """
+    Genera (número de línea, dict) sin cargar el archivo completo en memoria.
+    'archivo' es un objeto de texto (archivo abierto o stream de subida envuelto).
+    """
+    if formato == 'csv':
+        lector = csv.DictReader(archivo)
+        for registro in lector:
+            yield lector.line_num, {_normalizar_columna(k): (v or '').strip()
+                                    for k, v in registro.items() if k is not None}
+    elif formato == 'jsonl':
+        for numero, linea in enumerate(archivo, start=1):
+            if not linea.strip():
+                continue
+            try:
+                registro = json.loads(linea)
+            except ValueError as e:
+                yield numero, FilaInvalida(f"JSON inválido: {e}")
+                continue
+            yield numero, {_normalizar_columna(k): str(v).strip() if v is not None else ''
+                           for k, v in registro.items()}
+    else:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+
+def abrir_subida(archivo_subido):
+    """Envuelve el stream binario de un FileStorage de Flask como texto UTF-8 (acepta BOM de Excel)."""
+    return io.TextIOWrapper(archivo_subido.stream, encoding='utf-8-sig', newline='')
+
+
+def _fecha(valor, campo):
+    for formato in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            pass
+    raise FilaInvalida(f"{campo} '{valor}' no es una fecha válida (YYYY-MM-DD o DD/MM/YYYY).")
+
+
+def _requerido(registro, campo):
+    valor = registro.get(campo, '')
+    if not valor:
+        raise FilaInvalida(f"Falta el campo '{campo}'.")
+    return valor
+
+
+# -------------------------------------------------------------------
+# --- REPORTE ---
+# -------------------------------------------------------------------
+
+class ReporteImportacion:
+    """Totales de la carga y errores por fila (se guardan como máximo 'max_errores')."""
+
+    def __init__(self, tipo, max_errores=1000):
+        self.tipo = tipo
+        self.max_errores = max_errores
+        self.leidas = 0
+        self.insertadas = 0
+        self.duplicadas = 0
+        self.con_error = 0
+        self.errores = []  # (línea, mensaje)
+
+    def error(self, linea, mensaje):
+        self.con_error += 1
+        if len(self.errores) < self.max_errores:
+            self.errores.append((linea, str(mensaje)))
+
+    def como_dict(self):
+        return {'tipo': self.tipo, 'leidas': self.leidas, 'insertadas': self.insertadas,
+                'duplicadas': self.duplicadas, 'con_error': self.con_error, 'errores': self.errores}
+
+    def resumen(self):
+        return (f"Importación de {self.tipo}: {self.leidas} filas leídas, {self.insertadas} insertadas, "
+                f"{self.duplicadas} duplicadas, {self.con_error} con error.")
+
+
+# -------------------------------------------------------------------
+# --- IMPORTADOR ---
+# -------------------------------------------------------------------
+
+class Importador:
+    """
+    Valida fila por fila, resuelve nombres a IDs con mapas en memoria (cargados una vez)
+    y escribe por lotes con executemany, un commit por lote. Si un lote falla en la BD,
+    se reintenta fila por fila para reportar exactamente cuál falló.
+
+    Con 'metodo_hash' (CREDENCIAL ya existe) la clave de cada cliente va con hash a
+    CREDENCIAL en la misma transacción y CLIENTE.contraseña queda vacía, como en
+    insertar_cliente. Sin él se guarda en texto plano, como antes de CREDENCIAL.
+    """
+
+    def __init__(self, conn, backend='sqlserver', tamano_lote=1000, generar_contrasena=None, metodo_hash=None):
+        self.conn = conn
+        self.backend = backend
+        self.tamano_lote = tamano_lote
+        self.generar_contrasena = generar_contrasena
+        self.metodo_hash = metodo_hash
+
+    def _cursor(self):
+        cursor = self.conn.cursor()
+        if self.backend == 'sqlserver':
+            cursor.fast_executemany = True  # pyodbc envía el lote completo en un solo viaje
+        return cursor
+
+    def _escribir_lote(self, query, lote, reporte, extra=None):
+        """
+        lote: lista de (línea, parámetros). 'extra' es (query, funcion): funcion(parámetros)
+        da los de una segunda sentencia de la misma fila (o None), en la misma transacción.
+        """
+        if not lote:
+            return
+        cursor = self._cursor()
+        try:
+            cursor.executemany(query, [params[:query.count('?')] for _, params in lote])
+            if extra is not None:
+                filas_extra = [p for p in (extra[1](params) for _, params in lote) if p is not None]
+                if filas_extra:  # pyodbc no acepta executemany() sin filas
+                    cursor.executemany(extra[0], filas_extra)
+            self.conn.commit()
+            reporte.insertadas += len(lote)
+        except Exception:
+            self.conn.rollback()
+            for linea, params in lote:
+                try:
+                    cursor.execute(query, params[:query.count('?')])
+                    params_extra = extra[1](params) if extra is not None else None
+                    if params_extra is not None:
+                        cursor.execute(extra[0], params_extra)
+                    self.conn.commit()
+                    reporte.insertadas += 1
+                except Exception as e:
+                    self.conn.rollback()
+                    reporte.error(linea, f"Error de BD: {e}")
+
+    def _procesar(self, filas, reporte, validar, query, extra=None):
+        lote = []
+        for linea, registro in filas:
+            reporte.leidas += 1
+            if isinstance(registro, Exception):
+                reporte.error(linea, registro)
+                continue
+            try:
+                params = validar(registro)
+            except FilaInvalida as e:
+                reporte.error(linea, e)
+                continue
+            if params is None:
+                reporte.duplicadas += 1
+                continue
+            lote.append((linea, params))
+            if len(lote) >= self.tamano_lote:
+                self._escribir_lote(query, lote, reporte, extra)
+                lote = []
+        self._escribir_lote(query, lote, reporte, extra)
+        return reporte
+
+    # --- Clientes ---
+
+    def _mapas_clientes(self):
+        """Mapas correo -> IDCliente y teléfono (solo dígitos) -> IDCliente."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT IDCliente, Correo, Telefono FROM CLIENTE")
+        por_correo, por_telefono = {}, {}
+        for lote in iter(lambda: cursor.fetchmany(5000), []):
+            for id_cliente, correo, telefono in lote:
+                if correo:
+                    por_correo[correo.strip().lower()] = id_cliente
+                if solo_digitos(telefono):
+                    por_telefono[solo_digitos(telefono)] = id_cliente
+        return por_correo, por_telefono
+
+    def importar_clientes(self, filas):
+        reporte = ReporteImportacion('clientes')
+        por_correo, por_telefono = self._mapas_clientes()
+        hoy = date.today()
+
+        def validar(registro):
+            nombre = _requerido(registro, 'nombre')
+            telefono = _requerido(registro, 'telefono')
+            correo = _requerido(registro, 'correo').lower()
+            if '@' not in correo:
+                raise FilaInvalida(f"Correo inválido: '{correo}'.")
+            digitos = solo_digitos(telefono)
+            if len(digitos) < 7:
+                raise FilaInvalida(f"Teléfono inválido: '{telefono}'.")
+            # Deduplicación por correo o teléfono (contra la BD y contra el mismo archivo)
+            if correo in por_correo or digitos in por_telefono:
+                return None
+            por_correo[correo] = por_telefono[digitos] = True
+            fecha_registro = _fecha(registro['fecha_registro'], 'fecha_registro') \
+                if registro.get('fecha_registro') else hoy
+            contrasena = registro.get('contrasena') or (self.generar_contrasena() if self.generar_contrasena else '')
+            if self.metodo_hash and contrasena:
+                return (nombre, telefono, correo, fecha_registro, '', credenciales.crear_hash(contrasena, self.metodo_hash))
+            return (nombre, telefono, correo, fecha_registro, contrasena, None)
+
+        query = "INSERT INTO CLIENTE (Nombre, Telefono, Correo, FechaRegistro, contraseña) VALUES (?, ?, ?, ?, ?)"
+        # La credencial toma el IDCliente recién insertado por su correo (índice único), sin leerlo antes
+        credencial = ("INSERT INTO CREDENCIAL (Correo, Rol, IDUsuario, Hash) "
+                      "SELECT Correo, 'Cliente', IDCliente, ? FROM CLIENTE WHERE Correo = ?",
+                      lambda params: (params[5], params[2]) if params[5] else None)
+        return self._procesar(filas, reporte, validar, query, credencial)
+
+    # --- Servicios ---
+
+    def _mapa_servicios(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT IDServicio, NombreServicio FROM SERVICIO")
+        return {normalizar_texto(nombre): id_servicio for id_servicio, nombre in cursor.fetchall()}
+
+    def importar_servicios(self, filas):
+        reporte = ReporteImportacion('servicios')
+        existentes = self._mapa_servicios()
+
+        def validar(registro):
+            nombre = _requerido(registro, 'nombre') if registro.get('nombre') else _requerido(registro, 'servicio')
+            try:
+                precio = round(float(_requerido(registro, 'precio').replace('$', '').replace(',', '')), 2)
+            except ValueError:
+                raise FilaInvalida(f"Precio inválido: '{registro.get('precio')}'.")
+            if precio < 0:
+                raise FilaInvalida("El precio no puede ser negativo.")
+            clave = normalizar_texto(nombre)
+            if clave in existentes:
+                return None
+            existentes[clave] = True
+            return (nombre, precio)
+
+        query = "INSERT INTO SERVICIO (NombreServicio, Precio) VALUES (?, ?)"
+        return self._procesar(filas, reporte, validar, query)
+
+    # --- Citas históricas ---
+
+    def importar_citas(self, filas):
+        reporte = ReporteImportacion('citas')
+        por_correo, por_telefono = self._mapas_clientes()
+        servicios = self._mapa_servicios()
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT IDEstilista, Nombre FROM ESTILISTA")
+        estilistas = {normalizar_texto(nombre): id_estilista for id_estilista, nombre in cursor.fetchall()}
+
+        # Slots ya ocupados y citas ya cargadas (para no duplicar si se reimporta el archivo)
+        ocupados, existentes = set(), set()
+        cursor.execute("SELECT IDCliente, IDEstilista, Fecha, Hora, Estado FROM CITA")
+        for lote in iter(lambda: cursor.fetchmany(5000), []):
+            for id_cliente, id_estilista, fecha, hora, estado in lote:
+                clave = (id_estilista, str(fecha)[:10], normalizar_hora(hora))
+                existentes.add((id_cliente,) + clave)
+                if estado != 'Cancelada':
+                    ocupados.add(clave)
+        hoy = date.today()
+
+        def validar(registro):
+            correo = registro.get('correo_cliente') or registro.get('correo', '')
+            telefono = registro.get('telefono_cliente') or registro.get('telefono', '')
+            id_cliente = por_correo.get(correo.lower()) if correo else None
+            if id_cliente is None and solo_digitos(telefono):
+                id_cliente = por_telefono.get(solo_digitos(telefono))
+            if id_cliente is None:
+                raise FilaInvalida(f"Cliente no encontrado (correo '{correo}', teléfono '{telefono}').")
+
+            nombre_estilista = _requerido(registro, 'estilista')
+            id_estilista = estilistas.get(normalizar_texto(nombre_estilista))
+            if id_estilista is None:
+                raise FilaInvalida(f"Estilista no encontrado: '{nombre_estilista}'.")
+            nombre_servicio = _requerido(registro, 'servicio')
+            id_servicio = servicios.get(normalizar_texto(nombre_servicio))
+            if id_servicio is None:
+                raise FilaInvalida(f"Servicio no encontrado: '{nombre_servicio}'.")
+
+            fecha = _fecha(_requerido(registro, 'fecha'), 'fecha')
+            try:
+                hora = normalizar_hora(_requerido(registro, 'hora'))
+            except ValueError:
+                raise FilaInvalida(f"Hora inválida: '{registro.get('hora')}' (use HH:MM).")
+            # Sin estado: las citas pasadas se asumen realizadas y las futuras pendientes
+            estado = registro.get('estado') or ('Realizada' if fecha < hoy else 'Pendiente')
+            estado = estado.strip().title().replace('En proceso', 'En Proceso')
+            if estado not in ESTADOS_VALIDOS:
+                raise FilaInvalida(f"Estado inválido: '{estado}'.")
+
+            slot = (id_estilista, fecha.isoformat(), hora)
+            if (id_cliente,) + slot in existentes:
+                return None
+            if estado != 'Cancelada':
+                if slot in ocupados:
+                    raise FilaInvalida(f"El estilista ya tiene una cita el {fecha} a las {hora}.")
+                ocupados.add(slot)
+            existentes.add((id_cliente,) + slot)
+            return (id_cliente, id_estilista, id_servicio, fecha, hora, estado)
+
+        query = """
+        INSERT INTO CITA (IDCliente, IDEstilista, IDServicio, Fecha, Hora, Estado)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """
+        return self._procesar(filas, reporte, validar, query)
+
+    def importar(self, tipo, filas):
+        return {'clientes': self.importar_clientes,
+                'servicios': self.importar_servicios,
+                'citas': self.importar_citas}[tipo](filas)
@@ -0,0 +1,309 @@
+# Instrumentación de SQL por solicitud: conteo, tiempo en BD, filas y consultas lentas
+import heapq
+import logging
+from collections import deque
+import re
+import threading
+import time
+
+logger_sql = logging.getLogger('rossy_salon.sql')
+
+# Límites de los buckets (segundos) de los histogramas, al estilo Prometheus
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BUCKETS_CONSULTAS = (1, 2, 3, 5, 8, 13, 21, 34, 55)
+# Ventana móvil por endpoint: los últimos 10 minutos, en 10 tramos de 1 minuto
+VENTANA_SEGUNDOS = 600
+VENTANA_TRAMOS = 10
+CUANTILES = (0.5, 0.95, 0.99)
+
+
+def redactar_parametros(params):
+    """Sustituye cada parámetro por su tipo (y largo si es texto): nunca se registran datos personales."""
+    redactados = []
+    for valor in params:
+        if valor is None:
+            redactados.append('NULL')
+        elif isinstance(valor, str):
+            redactados.append(f'<str:{len(valor)}>')
+        else:
+            redactados.append(f'<{type(valor).__name__}>')
+    return redactados
+
+
+def _sql_compacto(sql):
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+# -------------------------------------------------------------------
+# --- REGISTRO DE UNA SOLICITUD ---
+# -------------------------------------------------------------------
+
+class RegistroSolicitud:
+    """Acumula lo que hizo una solicitud contra la BD y guarda las 'max_lentas' consultas más lentas."""
+
+    def __init__(self, max_lentas=5):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.errores = 0
+        self.tiempo_db = 0.0
+        self.filas = 0
+        self.max_lentas = max_lentas
+        self._lentas = []  # heap de (duración, n, sql)
+
+    def anotar(self, sql, duracion):
+        self.consultas += 1
+        self.tiempo_db += duracion
+        entrada = (duracion, self.consultas, _sql_compacto(sql))
+        if len(self._lentas) < self.max_lentas:
+            heapq.heappush(self._lentas, entrada)
+        else:
+            heapq.heappushpop(self._lentas, entrada)
+
+    def transcurrido(self):
+        return time.perf_counter() - self.inicio
+
+    def mas_lentas(self):
+        return [(sql, duracion) for duracion, _, sql in sorted(self._lentas, reverse=True)]
+
+
+# -------------------------------------------------------------------
+# --- ENVOLTORIOS DE CONEXIÓN Y CURSOR ---
+# -------------------------------------------------------------------
+
+class CursorInstrumentado:
+    """Mide cada execute/executemany y cuenta las filas leídas. Delegación total para lo demás."""
+
+    def __init__(self, cursor, registro, umbral_lenta):
+        self._cursor = cursor
+        self._registro = registro
+        self._umbral_lenta = umbral_lenta
+
+    def _medir(self, metodo, sql, params):
+        inicio = time.perf_counter()
+        try:
+            metodo(sql, *params)
+        except Exception as e:
+            self._registro.errores += 1
+            METRICAS.error_consulta()
+            logger_sql.error("Error SQL: %s | %s | params=%s", e, _sql_compacto(sql), redactar_parametros(params))
+            raise
+        finally:
+            duracion = time.perf_counter() - inicio
+            self._registro.anotar(sql, duracion)
+            METRICAS.observar_consulta(duracion)
+            if duracion * 1000 >= self._umbral_lenta:
+                logger_sql.warning("Consulta lenta (%.1f ms): %s | params=%s", duracion * 1000,
+                                   _sql_compacto(sql), redactar_parametros(params))
+        return self
+
+    def execute(self, sql, *params):
+        # Se pasan los parámetros tal cual (estilo pyodbc: varios o una tupla)
+        return self._medir(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, filas):
+        return self._medir(self._cursor.executemany, sql, (filas,))
+
+    def fetchone(self):
+        fila = self._cursor.fetchone()
+        if fila is not None:
+            self._registro.filas += 1
+        return fila
+
+    def fetchmany(self, *args):
+        filas = self._cursor.fetchmany(*args)
+        self._registro.filas += len(filas)
+        return filas
+
+    def fetchall(self):
+        filas = self._cursor.fetchall()
+        self._registro.filas += len(filas)
+        return filas
+
+    def __iter__(self):
+        for fila in self._cursor:
+            self._registro.filas += 1
+            yield fila
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __setattr__(self, nombre, valor):
+        # Atributos propios con '_'; el resto (p. ej. fast_executemany) va al cursor real
+        if nombre.startswith('_'):
+            object.__setattr__(self, nombre, valor)
+        else:
+            setattr(self._cursor, nombre, valor)
+
+
+class ConexionInstrumentada:
+    """Conexión del pool envuelta: sus cursores quedan instrumentados."""
+
+    def __init__(self, conn, registro, umbral_lenta):
+        self.conexion_real = conn
+        self._registro = registro
+        self._umbral_lenta = umbral_lenta
+
+    def cursor(self):
+        return CursorInstrumentado(self.conexion_real.cursor(), self._registro, self._umbral_lenta)
+
+    def __getattr__(self, nombre):
+        return getattr(self.conexion_real, nombre)
+
+
+# -------------------------------------------------------------------
+# --- MÉTRICAS DEL PROCESO (FORMATO PROMETHEUS) ---
+# -------------------------------------------------------------------
+
+class Histograma:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.conteos = [0] * len(buckets)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.suma += valor
+        self.total += 1
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.conteos[i] += 1
+                break
+
+    def lineas(self, nombre, etiquetas=''):
+        separador = ',' if etiquetas else ''
+        acumulado = 0
+        for limite, conteo in zip(self.buckets, self.conteos):
+            acumulado += conteo
+            yield f'{nombre}_bucket{{{etiquetas}{separador}le="{limite}"}} {acumulado}'
+        yield f'{nombre}_bucket{{{etiquetas}{separador}le="+Inf"}} {self.total}'
+        llaves = f'{{{etiquetas}}}' if etiquetas else ''
+        yield f'{nombre}_sum{llaves} {self.suma:.6f}'
+        yield f'{nombre}_count{llaves} {self.total}'
+
+    def sumar(self, otro):
+        self.suma += otro.suma
+        self.total += otro.total
+        self.conteos = [a + b for a, b in zip(self.conteos, otro.conteos)]
+
+    def cuantil(self, q):
+        """Límite superior del bucket donde cae el cuantil q ('+Inf' si pasa del último; None sin datos)."""
+        if not self.total:
+            return None
+        objetivo = q * self.total
+        acumulado = 0
+        for limite, conteo in zip(self.buckets, self.conteos):
+            acumulado += conteo
+            if acumulado >= objetivo:
+                return limite
+        return '+Inf'
+
+
+class HistogramaVentana:
+    """
+    Histograma de los últimos 'ventana' segundos: 'tramos' histogramas que rotan
+    (uno por cada ventana/tramos segundos). Al exportar se suman los tramos que
+    siguen dentro de la ventana; los viejos se descartan solos.
+    """
+
+    def __init__(self, buckets, ventana=VENTANA_SEGUNDOS, tramos=VENTANA_TRAMOS):
+        self.buckets = buckets
+        self.tramos = tramos
+        self.duracion_tramo = ventana / tramos
+        self._tramos = deque(maxlen=tramos)  # (número de tramo, Histograma)
+
+    def observar(self, valor, ahora=None):
+        numero = int((time.monotonic() if ahora is None else ahora) // self.duracion_tramo)
+        if not self._tramos or self._tramos[-1][0] != numero:
+            self._tramos.append((numero, Histograma(self.buckets)))
+        self._tramos[-1][1].observar(valor)
+
+    def combinado(self, ahora=None):
+        primero = int((time.monotonic() if ahora is None else ahora) // self.duracion_tramo) - self.tramos + 1
+        total = Histograma(self.buckets)
+        for numero, histograma in self._tramos:
+            if numero >= primero:
+                total.sumar(histograma)
+        return total
+
+    def lineas(self, nombre, etiquetas, ahora=None):
+        """Resumen (summary) de la ventana: cuantiles estimados por bucket, _sum y _count."""
+        histograma = self.combinado(ahora)
+        for q in CUANTILES:
+            valor = histograma.cuantil(q)
+            if valor is not None:
+                yield f'{nombre}{{{etiquetas},quantile="{q}"}} {valor}'
+        yield f'{nombre}_sum{{{etiquetas}}} {histograma.suma:.6f}'
+        yield f'{nombre}_count{{{etiquetas}}} {histograma.total}'
+
+
+class MetricasProceso:
+    """
+    Histogramas acumulados desde que arrancó el proceso (por endpoint y globales),
+    como los espera Prometheus: rate() y histogram_quantile() sacan de ellos
+    cualquier ventana. Para leer /metrics directamente, cada endpoint lleva además
+    una ventana móvil de los últimos VENTANA_SEGUNDOS (exportada como summary).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._consulta_segundos = Histograma(BUCKETS_SEGUNDOS)
+        self._errores = 0
+        self._por_endpoint = {}  # endpoint -> (hist db segundos, hist consultas, hist duración total)
+        self._ventanas = {}      # endpoint -> las mismas tres, en ventana móvil
+
+    def observar_consulta(self, duracion):
+        with self._lock:
+            self._consulta_segundos.observar(duracion)
+
+    def error_consulta(self):
+        with self._lock:
+            self._errores += 1
+
+    def observar_solicitud(self, endpoint, registro, duracion_total):
+        with self._lock:
+            if endpoint not in self._por_endpoint:
+                self._por_endpoint[endpoint] = (Histograma(BUCKETS_SEGUNDOS), Histograma(BUCKETS_CONSULTAS),
+                                                Histograma(BUCKETS_SEGUNDOS))
+                self._ventanas[endpoint] = (HistogramaVentana(BUCKETS_SEGUNDOS), HistogramaVentana(BUCKETS_CONSULTAS),
+                                            HistogramaVentana(BUCKETS_SEGUNDOS))
+            valores = (registro.tiempo_db, registro.consultas, duracion_total)
+            ahora = time.monotonic()
+            for acumulado, ventana, valor in zip(self._por_endpoint[endpoint], self._ventanas[endpoint], valores):
+                acumulado.observar(valor)
+                ventana.observar(valor, ahora)
+
+    def exportar(self, extras=()):
+        """Texto en formato de exposición de Prometheus. 'extras': (nombre, tipo, ayuda, valor)."""
+        with self._lock:
+            lineas = ['# HELP rossy_db_consulta_segundos Duración de cada sentencia SQL (acumulado).',
+                      '# TYPE rossy_db_consulta_segundos histogram']
+            lineas += self._consulta_segundos.lineas('rossy_db_consulta_segundos')
+            lineas += ['# HELP rossy_db_errores_total Sentencias SQL que terminaron en error.',
+                       '# TYPE rossy_db_errores_total counter',
+                       f'rossy_db_errores_total {self._errores}']
+            ahora = time.monotonic()
+            minutos = f'{VENTANA_SEGUNDOS // 60} min'
+            for nombre, ayuda, indice in (
+                    ('rossy_solicitud_db_segundos', 'Tiempo en BD por solicitud', 0),
+                    ('rossy_solicitud_consultas', 'Sentencias SQL por solicitud', 1),
+                    ('rossy_solicitud_segundos', 'Duración total de la solicitud', 2)):
+                lineas += [f'# HELP {nombre} {ayuda} (acumulado desde el arranque).', f'# TYPE {nombre} histogram']
+                for endpoint, histogramas in sorted(self._por_endpoint.items()):
+                    lineas += histogramas[indice].lineas(nombre, f'endpoint="{endpoint}"')
+                lineas += [f'# HELP {nombre}_ventana {ayuda} en los últimos {minutos} '
+                           f'(cuantiles = límite superior del bucket).', f'# TYPE {nombre}_ventana summary']
+                for endpoint, ventanas in sorted(self._ventanas.items()):
+                    lineas += ventanas[indice].lineas(f'{nombre}_ventana', f'endpoint="{endpoint}"', ahora)
+        for nombre, tipo, ayuda, valor in extras:
+            lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} {tipo}', f'{nombre} {valor}']
+        return '\n'.join(lineas) + '\n'
+
+
+METRICAS = MetricasProceso()
+
+
+def server_timing(registro, duracion_total):
+    """Valor del header Server-Timing: tiempo total, tiempo en BD y número de consultas."""
+    return (f'app;dur={duracion_total * 1000:.1f}, '
+            f'db;dur={registro.tiempo_db * 1000:.1f};desc="{registro.consultas} consultas", '
+            f'dbfilas;desc="{registro.filas} filas"')
@@ -0,0 +1,183 @@
+# Resúmenes diarios (rollups) para el dashboard de la Administradora
+from collections import defaultdict
+from datetime import date, timedelta
+
+import conexiones
+from disponibilidad import normalizar_fecha
+
+# Tabla de agregados: una fila por día. Se mantiene de forma incremental desde las
+# rutas que crean citas, cambian su estado o registran clientes.
+DDL_RESUMEN_DIARIO = {
+    'sqlserver': """
+    IF OBJECT_ID('RESUMEN_DIARIO', 'U') IS NULL
+    CREATE TABLE RESUMEN_DIARIO (
+        Fecha DATE NOT NULL PRIMARY KEY,
+        CitasAgendadas INT NOT NULL DEFAULT 0,
+        CitasRealizadas INT NOT NULL DEFAULT 0,
+        CitasCanceladas INT NOT NULL DEFAULT 0,
+        Ingresos DECIMAL(12, 2) NOT NULL DEFAULT 0,
+        ClientesNuevos INT NOT NULL DEFAULT 0
+    )
+    """,
+    'sqlite': """
+    CREATE TABLE IF NOT EXISTS RESUMEN_DIARIO (
+        Fecha DATE NOT NULL PRIMARY KEY,
+        CitasAgendadas INTEGER NOT NULL DEFAULT 0,
+        CitasRealizadas INTEGER NOT NULL DEFAULT 0,
+        CitasCanceladas INTEGER NOT NULL DEFAULT 0,
+        Ingresos REAL NOT NULL DEFAULT 0,
+        ClientesNuevos INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+}
+
+COLUMNAS = ['CitasAgendadas', 'CitasRealizadas', 'CitasCanceladas', 'Ingresos', 'ClientesNuevos']
+
+
+# -------------------------------------------------------------------
+# --- ACTUALIZACIÓN INCREMENTAL ---
+# -------------------------------------------------------------------
+
+def _sumar(cursor, fecha, **deltas):
+    """
+    Suma los deltas a la fila del día (UPDATE y, si no existía, INSERT). No hace commit.
+    Si otra transacción inserta el mismo día entre el UPDATE y el INSERT, el INSERT
+    choca con la clave primaria y se repite el UPDATE, que ahora sí encuentra la fila:
+    el incremento no se pierde.
+    """
+    deltas = {col: valor for col, valor in deltas.items() if valor}
+    if not deltas:
+        return
+    fecha = normalizar_fecha(fecha)
+    asignaciones = ', '.join(f"{col} = {col} + ?" for col in deltas)
+    actualizar = f"UPDATE RESUMEN_DIARIO SET {asignaciones} WHERE Fecha = ?"
+    cursor.execute(actualizar, *deltas.values(), fecha)
+    if cursor.rowcount == 0:
+        columnas = ', '.join(deltas)
+        marcas = ', '.join('?' for _ in deltas)
+        try:
+            cursor.execute(f"INSERT INTO RESUMEN_DIARIO (Fecha, {columnas}) VALUES (?, {marcas})",
+                           fecha, *deltas.values())
+        except conexiones.IntegrityError:
+            # Solo falla la sentencia, no la transacción (SQLite y SQL Server sin XACT_ABORT)
+            cursor.execute(actualizar, *deltas.values(), fecha)
+
+
+def registrar_cita(cursor, fecha):
+    """Una cita nueva cuenta como agendada en el día de la cita."""
+    _sumar(cursor, fecha, CitasAgendadas=1)
+
+
+def _acumular_cambio(deltas, estado_anterior, estado_nuevo, precio):
+    for estado, signo in ((estado_anterior, -1), (estado_nuevo, 1)):
+        if estado == 'Realizada':
+            deltas['CitasRealizadas'] += signo
+            deltas['Ingresos'] += signo * float(precio or 0)
+        elif estado == 'Cancelada':
+            deltas['CitasCanceladas'] += signo
+
+
+def registrar_cambio_estado(cursor, fecha, estado_anterior, estado_nuevo, precio):
+    """Mueve los contadores de Realizada/Cancelada (e ingresos) según la transición."""
+    deltas = defaultdict(float)
+    _acumular_cambio(deltas, estado_anterior, estado_nuevo, precio)
+    _sumar(cursor, fecha, **deltas)
+
+
+def registrar_cambios_estado(cursor, cambios):
+    """Como registrar_cambio_estado para una lista de (fecha, anterior, nuevo, precio): una escritura por día."""
+    por_dia = defaultdict(lambda: defaultdict(float))
+    for fecha, estado_anterior, estado_nuevo, precio in cambios:
+        _acumular_cambio(por_dia[normalizar_fecha(fecha)], estado_anterior, estado_nuevo, precio)
+    for fecha, deltas in sorted(por_dia.items()):
+        _sumar(cursor, fecha, **deltas)
+
+
+def registrar_cliente_nuevo(cursor, fecha):
+    _sumar(cursor, fecha, ClientesNuevos=1)
+
+
+# -------------------------------------------------------------------
+# --- RECONSTRUCCIÓN COMPLETA (BACKFILL / CORRECCIÓN) ---
+# -------------------------------------------------------------------
+
+def reconstruir(cursor, backend):
+    """Crea la tabla si falta y recalcula todos los días desde CITA y CLIENTE. No hace commit."""
+    cursor.execute(DDL_RESUMEN_DIARIO[backend])
+    dias = defaultdict(lambda: dict.fromkeys(COLUMNAS, 0))
+
+    cursor.execute("""
+    SELECT C.Fecha, C.Estado, COUNT(*), SUM(S.Precio)
+    FROM CITA C
+    JOIN SERVICIO S ON C.IDServicio = S.IDServicio
+    GROUP BY C.Fecha, C.Estado
+    """)
+    for fecha, estado, cantidad, total in cursor.fetchall():
+        dia = dias[normalizar_fecha(fecha)]
+        dia['CitasAgendadas'] += cantidad
+        if estado == 'Realizada':
+            dia['CitasRealizadas'] += cantidad
+            dia['Ingresos'] += float(total or 0)
+        elif estado == 'Cancelada':
+            dia['CitasCanceladas'] += cantidad
+
+    cursor.execute("SELECT FechaRegistro, COUNT(*) FROM CLIENTE WHERE FechaRegistro IS NOT NULL GROUP BY FechaRegistro")
+    for fecha, cantidad in cursor.fetchall():
+        dias[normalizar_fecha(fecha)]['ClientesNuevos'] += cantidad
+
+    cursor.execute("DELETE FROM RESUMEN_DIARIO")
+    if not dias:  # pyodbc no acepta executemany() sin filas (BD recién creada)
+        return 0
+    cursor.executemany(
+        f"INSERT INTO RESUMEN_DIARIO (Fecha, {', '.join(COLUMNAS)}) VALUES (?, ?, ?, ?, ?, ?)",
+        [(fecha, *(valores[col] for col in COLUMNAS)) for fecha, valores in sorted(dias.items())])
+    return len(dias)
+
+
+# -------------------------------------------------------------------
+# --- LECTURA PARA EL DASHBOARD ---
+# -------------------------------------------------------------------
+
+def resumen_dashboard(cursor, hoy=None):
+    """
+    Lee solo las filas diarias del mes anterior y el actual (O(días), no O(citas))
+    y devuelve los totales que muestra administradora.html.
+    """
+    hoy = hoy or date.today()
+    inicio_mes = hoy.replace(day=1)
+    inicio_mes_anterior = (inicio_mes - timedelta(days=1)).replace(day=1)
+    inicio_semana = hoy - timedelta(days=hoy.weekday())
+    fin_semana = inicio_semana + timedelta(days=6)
+    fin_mes = (inicio_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+    cursor.execute(f"""
+    SELECT Fecha, {', '.join(COLUMNAS)}
+    FROM RESUMEN_DIARIO
+    WHERE Fecha BETWEEN ? AND ?
+    """, inicio_mes_anterior.isoformat(), max(fin_mes, fin_semana).isoformat())
+
+    resumen = {'ingresos_mes': 0.0, 'ingresos_mes_anterior': 0.0, 'citas_mes': 0, 'citas_semana': 0,
+               'realizadas_mes': 0, 'canceladas_mes': 0, 'clientes_nuevos_mes': 0,
+               'clientes_nuevos_mes_anterior': 0}
+    for fila in cursor.fetchall():
+        fecha = date.fromisoformat(normalizar_fecha(fila[0]))
+        valores = dict(zip(COLUMNAS, fila[1:]))
+        if inicio_semana <= fecha <= fin_semana:
+            resumen['citas_semana'] += valores['CitasAgendadas']
+        if fecha < inicio_mes:
+            resumen['ingresos_mes_anterior'] += float(valores['Ingresos'])
+            resumen['clientes_nuevos_mes_anterior'] += valores['ClientesNuevos']
+        elif fecha <= fin_mes:
+            resumen['ingresos_mes'] += float(valores['Ingresos'])
+            resumen['citas_mes'] += valores['CitasAgendadas']
+            resumen['realizadas_mes'] += valores['CitasRealizadas']
+            resumen['canceladas_mes'] += valores['CitasCanceladas']
+            resumen['clientes_nuevos_mes'] += valores['ClientesNuevos']
+    return resumen
+
+
+def sumar_resumenes(resumenes):
+    """Suma los resúmenes de varias sucursales (mismas claves que resumen_dashboard). None si no hay ninguno."""
+    if not resumenes:
+        return None
+    return {clave: sum(resumen[clave] for resumen in resumenes) for clave in resumenes[0]}
@@ -0,0 +1,322 @@
+# Migraciones versionadas del esquema (SQL Server y SQLite) e índices de las consultas calientes
+import conexiones
+import credenciales
+import espera
+import estados
+import horarios
+import metricas
+import sucursales
+
+# Registro de las versiones aplicadas. Se crea antes de la primera migración.
+DDL_ESQUEMA_VERSION = {
+    'sqlserver': """
+    IF OBJECT_ID('ESQUEMA_VERSION', 'U') IS NULL
+    CREATE TABLE ESQUEMA_VERSION (
+        Version INT NOT NULL PRIMARY KEY,
+        Descripcion NVARCHAR(200) NOT NULL,
+        Aplicada DATETIME2 NOT NULL DEFAULT SYSDATETIME()
+    )
+    """,
+    'sqlite': """
+    CREATE TABLE IF NOT EXISTS ESQUEMA_VERSION (
+        Version INTEGER NOT NULL PRIMARY KEY,
+        Descripcion TEXT NOT NULL,
+        Aplicada DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+}
+
+# Tablas que la aplicación siempre supuso en SQL Server. Con guardas (IF OBJECT_ID / IF NOT EXISTS)
+# para que una BD existente quede registrada en la versión 1 sin tocar sus datos.
+_TABLAS_BASE = {
+    'sqlserver': [
+        """
+        IF OBJECT_ID('CLIENTE', 'U') IS NULL
+        CREATE TABLE CLIENTE (
+            IDCliente INT IDENTITY(1, 1) PRIMARY KEY,
+            Nombre NVARCHAR(150) NOT NULL,
+            Telefono NVARCHAR(20) NOT NULL,
+            Correo NVARCHAR(255) NOT NULL,
+            FechaRegistro DATE NOT NULL,
+            contraseña NVARCHAR(255) NOT NULL DEFAULT ''
+        )
+        """,
+        """
+        IF OBJECT_ID('ESTILISTA', 'U') IS NULL
+        CREATE TABLE ESTILISTA (
+            IDEstilista INT IDENTITY(1, 1) PRIMARY KEY,
+            Nombre NVARCHAR(150) NOT NULL,
+            Especialidad NVARCHAR(100) NULL,
+            Telefono NVARCHAR(20) NOT NULL,
+            Correo NVARCHAR(255) NULL,
+            Estado NVARCHAR(20) NOT NULL DEFAULT 'Activo'
+        )
+        """,
+        """
+        IF OBJECT_ID('SERVICIO', 'U') IS NULL
+        CREATE TABLE SERVICIO (
+            IDServicio INT IDENTITY(1, 1) PRIMARY KEY,
+            NombreServicio NVARCHAR(150) NOT NULL,
+            Precio DECIMAL(10, 2) NOT NULL
+        )
+        """,
+        """
+        IF OBJECT_ID('CITA', 'U') IS NULL
+        CREATE TABLE CITA (
+            IDCita INT IDENTITY(1, 1) PRIMARY KEY,
+            IDCliente INT NOT NULL REFERENCES CLIENTE (IDCliente),
+            IDEstilista INT NOT NULL REFERENCES ESTILISTA (IDEstilista),
+            IDServicio INT NOT NULL REFERENCES SERVICIO (IDServicio),
+            Fecha DATE NOT NULL,
+            Hora TIME NOT NULL,
+            Estado NVARCHAR(20) NOT NULL DEFAULT 'Pendiente'
+        )
+        """,
+    ],
+    'sqlite': [
+        """
+        CREATE TABLE IF NOT EXISTS CLIENTE (
+            IDCliente INTEGER PRIMARY KEY AUTOINCREMENT,
+            Nombre TEXT NOT NULL,
+            Telefono TEXT NOT NULL,
+            Correo TEXT NOT NULL,
+            FechaRegistro DATE NOT NULL,
+            contraseña TEXT NOT NULL DEFAULT ''
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ESTILISTA (
+            IDEstilista INTEGER PRIMARY KEY AUTOINCREMENT,
+            Nombre TEXT NOT NULL,
+            Especialidad TEXT,
+            Telefono TEXT NOT NULL,
+            Correo TEXT,
+            Estado TEXT NOT NULL DEFAULT 'Activo'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS SERVICIO (
+            IDServicio INTEGER PRIMARY KEY AUTOINCREMENT,
+            NombreServicio TEXT NOT NULL,
+            Precio REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS CITA (
+            IDCita INTEGER PRIMARY KEY AUTOINCREMENT,
+            IDCliente INTEGER NOT NULL REFERENCES CLIENTE (IDCliente),
+            IDEstilista INTEGER NOT NULL REFERENCES ESTILISTA (IDEstilista),
+            IDServicio INTEGER NOT NULL REFERENCES SERVICIO (IDServicio),
+            Fecha DATE NOT NULL,
+            Hora TIME NOT NULL,
+            Estado TEXT NOT NULL DEFAULT 'Pendiente'
+        )
+        """,
+    ],
+}
+
+# (tabla, nombre, columnas, incluidas solo en SQL Server, único). Cada uno cubre un predicado caliente:
+INDICES = [
+    # conflictos y carga de disponibilidad (IDEstilista = ? AND Fecha = ?), agenda del estilista
+    ('CITA', 'IX_CITA_Estilista_Fecha_Hora', 'IDEstilista, Fecha, Hora', 'Estado, IDServicio, IDCliente', False),
+    # agenda del día, vistas semana/mes, exportaciones y búsqueda de huecos (Fecha = ? / BETWEEN)
+    ('CITA', 'IX_CITA_Fecha_Hora', 'Fecha, Hora', 'IDEstilista, Estado, IDServicio, IDCliente', False),
+    # historial y próximas citas del cliente (IDCliente = ? AND Fecha >= ?)
+    ('CITA', 'IX_CITA_Cliente_Fecha_Hora', 'IDCliente, Fecha, Hora', 'Estado, IDServicio, IDEstilista', False),
+    # login y registro (Correo = ?); el registro cuenta con el error de duplicado
+    ('CLIENTE', 'UX_CLIENTE_Correo', 'Correo', '', True),
+    ('ESTILISTA', 'IX_ESTILISTA_Correo', 'Correo', '', False),
+]
+
+
+def _ddl_indice(backend, tabla, nombre, columnas, incluidas, unico):
+    tipo = 'UNIQUE INDEX' if unico else 'INDEX'
+    if backend == 'sqlserver':
+        incluir = f" INCLUDE ({incluidas})" if incluidas else ''
+        return (f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{nombre}' "
+                f"AND object_id = OBJECT_ID('{tabla}'))\n"
+                f"CREATE {tipo} {nombre} ON {tabla} ({columnas}){incluir}")
+    return f"CREATE {tipo} IF NOT EXISTS {nombre} ON {tabla} ({columnas})"
+
+
+_DDL_INDICES = {backend: [_ddl_indice(backend, *indice) for indice in INDICES] for backend in ('sqlserver', 'sqlite')}
+
+
+def _copiar_esquema_anterior(cursor, backend):
+    """
+    rossy_salon.db traía otro esquema (usuarios, servicios, citas). Si esas tablas
+    existen y CLIENTE está vacía, se copian conservando los IDs; las citas que apuntan
+    a usuarios inexistentes se omiten. La clave inicial del cliente es su teléfono,
+    como ya pasaba con las estilistas.
+    """
+    if backend != 'sqlite':
+        return
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('usuarios', 'servicios', 'citas')")
+    if len(cursor.fetchall()) < 3:
+        return
+    cursor.execute("SELECT COUNT(*) FROM CLIENTE")
+    if cursor.fetchone()[0]:
+        return
+    cursor.execute("""
+    INSERT INTO CLIENTE (IDCliente, Nombre, Telefono, Correo, FechaRegistro, contraseña)
+    SELECT id, nombre, telefono, correo, DATE('now'), telefono FROM usuarios WHERE rol = 'Cliente'
+    """)
+    cursor.execute("""
+    INSERT INTO ESTILISTA (IDEstilista, Nombre, Telefono, Correo, Estado)
+    SELECT id, nombre, telefono, correo, 'Activo' FROM usuarios WHERE rol = 'Estilista'
+    """)
+    cursor.execute("INSERT OR IGNORE INTO SERVICIO (IDServicio, NombreServicio, Precio) SELECT id, nombre, precio FROM servicios")
+    cursor.execute("""
+    INSERT INTO CITA (IDCita, IDCliente, IDEstilista, IDServicio, Fecha, Hora, Estado)
+    SELECT c.id, c.id_cliente, c.id_estilista, c.id_servicio, c.fecha, c.hora, c.estado
+    FROM citas c
+    WHERE c.id_cliente IN (SELECT IDCliente FROM CLIENTE)
+      AND c.id_estilista IN (SELECT IDEstilista FROM ESTILISTA)
+      AND c.id_servicio IN (SELECT IDServicio FROM SERVICIO)
+    """)
+
+
+def _resumen_diario(cursor, backend):
+    metricas.reconstruir(cursor, backend)
+
+
+# Lista ordenada: (versión, descripción, pasos). Los pasos son un dict backend -> [sentencias]
+# o una función paso(cursor, backend). Una versión publicada no se edita: se agrega otra.
+MIGRACIONES = [
+    (1, "Tablas base CLIENTE, ESTILISTA, SERVICIO y CITA", _TABLAS_BASE),
+    (2, "Datos del esquema anterior de rossy_salon.db (solo SQLite)", _copiar_esquema_anterior),
+    (3, "Índices de citas, clientes y estilistas", _DDL_INDICES),
+    (4, "RESUMEN_DIARIO calculada desde CITA y CLIENTE", _resumen_diario),
+    (5, "Duración de servicios y jornadas de estilistas", horarios.preparar_esquema),
+    (6, "CREDENCIAL (claves con hash)",
+     {backend: [ddl] for backend, ddl in credenciales.DDL_CREDENCIAL.items()}),
+    (7, "Correos de CLIENTE, ESTILISTA y CREDENCIAL en minúsculas", credenciales.DDL_CORREOS_MINUSCULAS),
+    (8, "LISTA_ESPERA", espera.DDL_LISTA_ESPERA),
+    (9, "SUCURSAL (identidad de la partición)", sucursales.DDL_SUCURSAL),
+]
+
+# Desde esta versión 'flask migrar' anota en SUCURSAL la sucursal de la BD (sucursales.registrar)
+VERSION_SUCURSAL = 9
+
+
+# -------------------------------------------------------------------
+# --- APLICACIÓN ---
+# -------------------------------------------------------------------
+
+def version_actual(cursor, backend):
+    """Última versión aplicada (0 en una BD sin ESQUEMA_VERSION). Crea la tabla si falta."""
+    cursor.execute(DDL_ESQUEMA_VERSION[backend])
+    cursor.execute("SELECT MAX(Version) FROM ESQUEMA_VERSION")
+    fila = cursor.fetchone()
+    return fila[0] or 0
+
+
+def pendientes(cursor, backend, hasta=None):
+    actual = version_actual(cursor, backend)
+    return [m for m in MIGRACIONES if m[0] > actual and (hasta is None or m[0] <= hasta)]
+
+
+def aplicar(conn, backend, hasta=None, aviso=print):
+    """
+    Aplica en orden las migraciones pendientes (hasta la versión 'hasta', si se da),
+    cada una en su propia transacción junto con su fila en ESQUEMA_VERSION. Si una
+    falla se deshace y se detiene ahí; como todas las sentencias tienen guardas, se
+    puede volver a correr. Devuelve las versiones aplicadas.
+    """
+    cursor = conn.cursor()
+    aplicadas = []
+    lista = pendientes(cursor, backend, hasta)
+    conn.commit()
+    for version, descripcion, pasos in lista:
+        try:
+            if backend == 'sqlite':
+                cursor.execute("BEGIN")  # sqlite3 no abre transacción antes de un DDL por su cuenta
+            if callable(pasos):
+                pasos(cursor, backend)
+            else:
+                for sentencia in pasos[backend]:
+                    cursor.execute(sentencia)
+            cursor.execute("INSERT INTO ESQUEMA_VERSION (Version, Descripcion) VALUES (?, ?)", version, descripcion)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            aviso(f"Falló la migración {version} ({descripcion}).")
+            raise
+        aviso(f"Migración {version} aplicada: {descripcion}.")
+        aplicadas.append(version)
+    return aplicadas
+
+
+# -------------------------------------------------------------------
+# --- VERIFICACIÓN: ÍNDICES Y PLANES DE LAS CONSULTAS CALIENTES ---
+# -------------------------------------------------------------------
+
+# Versiones sin parámetros de los predicados que deben resolverse con un seek, no con un scan
+CONSULTAS_CRITICAS = {
+    'disponibilidad_estilista': "SELECT Hora, IDServicio FROM CITA WHERE IDEstilista = 1 AND Fecha = '2025-01-06' "
+                                f"AND Estado IN ({', '.join(repr(e) for e in estados.ESTADOS_ACTIVOS)})",
+    'agenda_dia': "SELECT IDCita, IDEstilista, Hora, Estado FROM CITA WHERE Fecha = '2025-01-06' ORDER BY Hora",
+    'rango_fechas': "SELECT IDEstilista, Fecha, Hora, IDServicio FROM CITA "
+                    "WHERE Fecha BETWEEN '2025-01-06' AND '2025-01-12'",
+    'citas_cliente': "SELECT IDCita, Fecha, Hora FROM CITA WHERE IDCliente = 1 AND Fecha >= '2025-01-06' "
+                     "ORDER BY Fecha, Hora",
+    'login_cliente': "SELECT IDCliente FROM CLIENTE WHERE Correo = 'x@rossy.test'",
+    'login_estilista': "SELECT IDEstilista FROM ESTILISTA WHERE Correo = 'x@rossy.test'",
+}
+
+
+def indices_faltantes(cursor, backend):
+    """Nombres de INDICES que no existen en la BD."""
+    if backend == 'sqlserver':
+        cursor.execute("SELECT name FROM sys.indexes WHERE name IS NOT NULL")
+    else:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    existentes = {fila[0].upper() for fila in cursor.fetchall()}
+    return [indice[1] for indice in INDICES if indice[1].upper() not in existentes]
+
+
+def plan(cursor, backend, consulta):
+    """Líneas del plan estimado de la consulta (EXPLAIN QUERY PLAN / SHOWPLAN_TEXT). No la ejecuta."""
+    if backend == 'sqlserver':
+        cursor.execute("SET SHOWPLAN_TEXT ON")
+        try:
+            cursor.execute(consulta)
+            lineas = []
+            while True:  # primero el texto de la sentencia, después el plan
+                lineas.extend(str(fila[0]).strip() for fila in cursor.fetchall())
+                if not cursor.nextset():
+                    break
+        finally:
+            cursor.execute("SET SHOWPLAN_TEXT OFF")
+        return lineas[1:]
+    cursor.execute("EXPLAIN QUERY PLAN " + consulta)
+    return [fila[-1] for fila in cursor.fetchall()]
+
+
+def usa_scan(lineas, backend):
+    """True si el plan recorre una tabla o índice completo en lugar de buscar por clave."""
+    if backend == 'sqlserver':
+        return any('Scan(' in linea for linea in lineas)
+    return any(linea.startswith('SCAN') for linea in lineas)
+
+
+def verificar(cursor, backend):
+    """
+    Estado del esquema: versión, migraciones pendientes, índices faltantes y, por cada
+    consulta crítica, (plan, usa_scan). Sirve para comprobar tras 'flask migrar' que
+    la agenda y los chequeos de conflicto son seeks en cualquier backend.
+    """
+    planes = {}
+    for nombre, consulta in CONSULTAS_CRITICAS.items():
+        try:
+            lineas = plan(cursor, backend, consulta)
+        except conexiones.DatabaseError as e:  # p. ej. la tabla todavía no existe
+            planes[nombre] = ([f"Error: {e}"], True)
+            continue
+        planes[nombre] = (lineas, usa_scan(lineas, backend))
+    return {
+        'version': version_actual(cursor, backend),
+        'pendientes': [m[0] for m in pendientes(cursor, backend)],
+        'indices_faltantes': indices_faltantes(cursor, backend),
+        'planes': planes,
+    }
@@ -0,0 +1,84 @@
+# Notificaciones a clientes: textos de los correos y enviadores intercambiables (SMTP o consola)
+import smtplib
+import sys
+from email.message import EmailMessage
+
+
+class EnviadorConsola:
+    """
+    Imprime los correos en lugar de enviarlos (desarrollo y pruebas). Van a
+    stderr: stdout queda para la salida de los comandos (p. ej. el JSON de benchmark.py).
+    """
+
+    def enviar(self, para, asunto, cuerpo):
+        print(f"[correo] Para: {para} | Asunto: {asunto}\n{cuerpo}", file=sys.stderr)
+
+
+class EnviadorSMTP:
+    """
+    Envía por SMTP. Con los valores por defecto (localhost:1025, sin TLS ni
+    usuario) funciona contra un servidor SMTP local de pruebas como MailHog
+    o 'python -m aiosmtpd -n -l localhost:1025'.
+    """
+
+    def __init__(self, host='localhost', puerto=1025, remitente='citas@rossysalon.com', usuario=None, clave=None,
+                 starttls=False, timeout=10):
+        self.host = host
+        self.puerto = puerto
+        self.remitente = remitente
+        self.usuario = usuario
+        self.clave = clave
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def enviar(self, para, asunto, cuerpo):
+        mensaje = EmailMessage()
+        mensaje['From'] = self.remitente
+        mensaje['To'] = para
+        mensaje['Subject'] = asunto
+        mensaje.set_content(cuerpo)
+        with smtplib.SMTP(self.host, self.puerto, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.usuario:
+                smtp.login(self.usuario, self.clave)
+            smtp.send_message(mensaje)
+
+
+def crear_enviador(config):
+    """Elige el enviador según app.config['NOTIFICACIONES_ENVIADOR'] ('consola' o 'smtp')."""
+    nombre = config.get('NOTIFICACIONES_ENVIADOR', 'consola')
+    if nombre == 'consola':
+        return EnviadorConsola()
+    if nombre == 'smtp':
+        return EnviadorSMTP(config['SMTP_HOST'], config['SMTP_PUERTO'], config['SMTP_REMITENTE'],
+                            config.get('SMTP_USUARIO'), config.get('SMTP_CLAVE'), config.get('SMTP_STARTTLS', False))
+    raise ValueError(f"Enviador de notificaciones desconocido: {nombre}")
+
+
+# -------------------------------------------------------------------
+# --- MENSAJES ---
+# -------------------------------------------------------------------
+
+def confirmacion_cita(nombre, servicio, estilista, fecha, hora):
+    """(asunto, cuerpo) del correo que se manda al agendar."""
+    return ("Tu cita en Rossy Salón está agendada",
+            f"Hola {nombre},\n\n"
+            f"Tu cita de {servicio} con {estilista} quedó agendada para el {fecha} ({hora}).\n\n"
+            "Si no puedes asistir, avísanos para ofrecer el horario a otra clienta.\n\nRossy Salón")
+
+
+def recordatorio_cita(nombre, servicio, estilista, fecha, hora):
+    """(asunto, cuerpo) del recordatorio previo a la cita."""
+    return ("Recordatorio: tu cita en Rossy Salón",
+            f"Hola {nombre},\n\n"
+            f"Te recordamos tu cita de {servicio} con {estilista} el {fecha} ({hora}).\n\n"
+            "¡Te esperamos!\n\nRossy Salón")
+
+
+def bienvenida(nombre):
+    """(asunto, cuerpo) del correo de bienvenida tras el registro (sin la clave, que ya se mostró en pantalla)."""
+    return ("Bienvenida a Rossy Salón",
+            f"Hola {nombre},\n\n"
+            "Tu cuenta quedó creada. Desde tu perfil puedes agendar citas, ver tu historial "
+            "y anotarte en la lista de espera.\n\nRossy Salón")
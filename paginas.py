@@ -0,0 +1,143 @@
+# Cargadores de datos por página: todos los conjuntos de resultados de una vista en un solo viaje a la BD
+from datetime import date, time
+
+from disponibilidad import normalizar_fecha, normalizar_hora
+
+# Cómo limitar filas en cada backend (va al final, después del ORDER BY)
+LIMITE_FILAS = {
+    'sqlserver': 'OFFSET 0 ROWS FETCH NEXT {n} ROWS ONLY',
+    'sqlite': 'LIMIT {n}',
+}
+
+
+def ejecutar_lote(cursor, backend, consultas):
+    """
+    Ejecuta varias consultas (lista de (sql, params)) y devuelve una lista con las
+    filas de cada una, en el mismo orden.
+
+    En SQL Server se envían juntas en un único batch y se recorren los conjuntos de
+    resultados con nextset(): un solo viaje de red sin importar cuántas sean. En
+    SQLite (archivo local, sin red) se ejecutan una tras otra en la misma conexión.
+    """
+    if backend == 'sqlserver' and len(consultas) > 1:
+        sql = ';\n'.join(query.strip().rstrip(';') for query, _ in consultas)
+        cursor.execute(sql, *[param for _, params in consultas for param in params])
+        resultados = [cursor.fetchall()]
+        while cursor.nextset():
+            resultados.append(cursor.fetchall())
+        return resultados
+
+    resultados = []
+    for query, params in consultas:
+        cursor.execute(query, *params)
+        resultados.append(cursor.fetchall())
+    return resultados
+
+
+# -------------------------------------------------------------------
+# --- PERFIL DEL CLIENTE: PRÓXIMAS CITAS + HISTORIAL PAGINADO ---
+# -------------------------------------------------------------------
+
+# Columnas: Fecha, Hora, Estado, Servicio, Estilista, IDCita (el IDCita desempata el cursor de paginación)
+_CITAS_CLIENTE = """
+SELECT C.Fecha, C.Hora, C.Estado, S.NombreServicio, E.Nombre AS Estilista, C.IDCita
+FROM CITA C
+JOIN SERVICIO S ON C.IDServicio = S.IDServicio
+JOIN ESTILISTA E ON C.IDEstilista = E.IDEstilista
+WHERE C.IDCliente = ?
+"""
+
+
+def _consulta_proximas(backend, id_cliente, hoy, limite):
+    query = (_CITAS_CLIENTE + "AND C.Fecha >= ?\nORDER BY C.Fecha, C.Hora, C.IDCita\n"
+             + LIMITE_FILAS[backend].format(n=int(limite)))
+    return query, (id_cliente, hoy)
+
+
+def _consulta_historial(backend, id_cliente, hoy, limite, despues_de=None):
+    """
+    Paginación por keyset sobre (Fecha, Hora, IDCita) descendente: cada página
+    arranca justo después de la última fila de la anterior, así que su costo no
+    crece con el número de visitas del cliente (a diferencia de OFFSET).
+    """
+    orden = "ORDER BY C.Fecha DESC, C.Hora DESC, C.IDCita DESC\n" + LIMITE_FILAS[backend].format(n=int(limite))
+    if despues_de is None:
+        return _CITAS_CLIENTE + "AND C.Fecha < ?\n" + orden, (id_cliente, hoy)
+    fecha, hora, id_cita = despues_de
+    condicion = "AND (C.Fecha < ? OR (C.Fecha = ? AND (C.Hora < ? OR (C.Hora = ? AND C.IDCita < ?))))\n"
+    return _CITAS_CLIENTE + condicion + orden, (id_cliente, fecha, fecha, hora, hora, id_cita)
+
+
+def codificar_cursor(fila):
+    """Cursor opaco para 'cargar más' a partir de la última fila mostrada: 'YYYY-MM-DD_HH:MM:SS_ID'."""
+    return f"{normalizar_fecha(fila[0])}_{normalizar_hora(fila[1])}_{fila[5]}"
+
+
+def decodificar_cursor(texto):
+    """Inverso de codificar_cursor. Lanza ValueError si el cursor no es válido."""
+    fecha, hora, id_cita = texto.split('_')
+    return date.fromisoformat(fecha), time.fromisoformat(hora), int(id_cita)
+
+
+def _cortar_pagina(filas, por_pagina):
+    """Se piden por_pagina + 1 filas: si llegó la extra, hay más páginas y el cursor es la última mostrada."""
+    filas = [list(fila) for fila in filas]
+    if len(filas) > por_pagina:
+        filas = filas[:por_pagina]
+        return filas, codificar_cursor(filas[-1])
+    return filas, None
+
+
+# Columnas: IDEspera, Servicio, Estilista (NULL = cualquiera), FechaDesde, FechaHasta, HoraDesde, HoraHasta, Estado
+_LISTA_ESPERA_CLIENTE = """
+SELECT L.IDEspera, S.NombreServicio, E.Nombre AS Estilista, L.FechaDesde, L.FechaHasta, L.HoraDesde, L.HoraHasta, L.Estado
+FROM LISTA_ESPERA L
+JOIN SERVICIO S ON L.IDServicio = S.IDServicio
+LEFT JOIN ESTILISTA E ON L.IDEstilista = E.IDEstilista
+WHERE L.IDCliente = ? AND L.FechaHasta >= ? AND L.Estado IN ('Activa', 'Asignada')
+ORDER BY L.FechaDesde, L.IDEspera
+"""
+
+
+def pagina_cliente(cursor, backend, id_cliente, por_pagina, max_proximas, hoy=None, con_espera=False):
+    """
+    Datos de perfil_cliente en un solo lote: próximas citas (ascendente), la primera
+    página del historial (descendente) y, con 'con_espera', sus solicitudes vigentes
+    de la lista de espera. Devuelve (proximas, historial, cursor_siguiente, espera).
+    """
+    hoy = hoy or date.today()
+    consultas = [
+        _consulta_proximas(backend, id_cliente, hoy, max_proximas),
+        _consulta_historial(backend, id_cliente, hoy, por_pagina + 1),
+    ]
+    if con_espera:
+        consultas.append((_LISTA_ESPERA_CLIENTE, (id_cliente, hoy)))
+    proximas, historial, *espera = ejecutar_lote(cursor, backend, consultas)
+    historial, siguiente = _cortar_pagina(historial, por_pagina)
+    espera = [list(fila) for fila in espera[0]] if espera else []
+    return [list(fila) for fila in proximas], historial, siguiente, espera
+
+
+def pagina_historial(cursor, backend, id_cliente, despues_de, por_pagina):
+    """Página siguiente del historial ('cargar más'). Devuelve (filas, cursor_siguiente)."""
+    filas, = ejecutar_lote(cursor, backend, [
+        _consulta_historial(backend, id_cliente, None, por_pagina + 1, despues_de=despues_de)])
+    return _cortar_pagina(filas, por_pagina)
+
+
+# -------------------------------------------------------------------
+# --- AGENDA DE RECEPCIÓN ---
+# -------------------------------------------------------------------
+
+def pagina_recepcion(cursor, backend, fecha):
+    """Agenda del día (los catálogos los sirve la caché, así que es el único viaje a la BD)."""
+    citas_hoy, = ejecutar_lote(cursor, backend, [("""
+    SELECT C.IDCita, C.Hora, C.Estado, CL.Nombre AS Cliente, S.NombreServicio, E.Nombre AS Estilista
+    FROM CITA C
+    JOIN CLIENTE CL ON C.IDCliente = CL.IDCliente
+    JOIN SERVICIO S ON C.IDServicio = S.IDServicio
+    JOIN ESTILISTA E ON C.IDEstilista = E.IDEstilista
+    WHERE C.Fecha = ?
+    ORDER BY C.Hora
+    """, (fecha,))])
+    return [list(fila) for fila in citas_hoy]
@@ -0,0 +1,76 @@
+# Series de citas recurrentes: fechas de la serie, citas del estilista en una sola consulta y alternativas cercanas
+from datetime import date, timedelta
+
+from disponibilidad import minutos, normalizar_fecha
+from estados import ESTADOS_ACTIVOS
+
+MAX_OCURRENCIAS = 26  # medio año a una cita por semana
+MAX_SEMANAS = 8  # intervalo máximo entre dos citas de la serie
+DIAS_ALTERNATIVA = 3  # días antes y después de un choque en que se busca otro horario
+
+
+def fechas_serie(fecha_inicio, cada_semanas, hasta=None, repeticiones=None, hoy=None):
+    """
+    Fechas de una serie 'cada N semanas' desde fecha_inicio, hasta una fecha
+    (inclusive) o un número de repeticiones. Lanza ValueError si la serie no es válida.
+    """
+    hoy = hoy or date.today()
+    inicio = date.fromisoformat(normalizar_fecha(fecha_inicio))
+    if inicio < hoy:
+        raise ValueError("La serie no puede empezar en una fecha pasada.")
+    if not 1 <= cada_semanas <= MAX_SEMANAS:
+        raise ValueError(f"El intervalo debe ser de 1 a {MAX_SEMANAS} semanas.")
+    if (hasta is None) == (repeticiones is None):
+        raise ValueError("Indica una fecha final o un número de repeticiones (solo uno).")
+
+    if repeticiones is None:
+        hasta = date.fromisoformat(normalizar_fecha(hasta))
+        if hasta < inicio:
+            raise ValueError("La fecha final es anterior a la primera cita.")
+        repeticiones = (hasta - inicio).days // (7 * cada_semanas) + 1
+    if not 1 <= repeticiones <= MAX_OCURRENCIAS:
+        raise ValueError(f"Una serie puede tener de 1 a {MAX_OCURRENCIAS} citas.")
+    return [inicio + timedelta(weeks=cada_semanas * i) for i in range(repeticiones)]
+
+
+def fechas_vecinas(fechas, hoy=None):
+    """Las fechas de la serie y las DIAS_ALTERNATIVA de cada lado (sin días pasados), ordenadas."""
+    hoy = hoy or date.today()
+    vecinas = {fecha + timedelta(days=delta)
+               for fecha in fechas for delta in range(-DIAS_ALTERNATIVA, DIAS_ALTERNATIVA + 1)}
+    return sorted(fecha for fecha in vecinas if fecha >= hoy)
+
+
+def cargar_ocupadas(cursor, id_estilista, fechas, duracion_de):
+    """
+    Citas activas del estilista en todas las fechas dadas, con una sola consulta
+    (Fecha IN (...), por IX_CITA_Estilista_Fecha_Hora). Devuelve
+    {'YYYY-MM-DD': [(hora, duracion_min)]} con una entrada por fecha, aunque esté vacía.
+    """
+    marcas_estado = ', '.join('?' for _ in ESTADOS_ACTIVOS)
+    marcas_fecha = ', '.join('?' for _ in fechas)
+    cursor.execute(f"""
+    SELECT Fecha, Hora, IDServicio
+    FROM CITA
+    WHERE IDEstilista = ? AND Fecha IN ({marcas_fecha}) AND Estado IN ({marcas_estado})
+    """, int(id_estilista), *fechas, *ESTADOS_ACTIVOS)
+    ocupadas = {fecha.isoformat(): [] for fecha in fechas}
+    for fecha, hora, id_servicio in cursor.fetchall():
+        ocupadas.setdefault(normalizar_fecha(fecha), []).append((hora, duracion_de(id_servicio)))
+    return ocupadas
+
+
+def mas_cercana(fecha, hora, libres):
+    """
+    De los horarios libres [(fecha, hora_24)], el más cercano al pedido: primero el
+    mismo día, luego el día más próximo (antes que después, a igual distancia) y,
+    dentro del día, la hora más próxima. None si no hay ninguno.
+    """
+    fecha = date.fromisoformat(normalizar_fecha(fecha))
+    inicio = minutos(hora)
+
+    def distancia(libre):
+        dias = (date.fromisoformat(libre[0]) - fecha).days
+        return abs(dias), dias > 0, abs(minutos(libre[1]) - inicio), minutos(libre[1])
+
+    return min(libres, key=distancia, default=None)
@@ -0,0 +1,202 @@
+# Sesiones del lado del servidor: la cookie solo guarda un ID opaco
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+# -------------------------------------------------------------------
+# --- ALMACENES (BACKENDS) ---
+# -------------------------------------------------------------------
+
+class AlmacenMemoria:
+    """Almacén LRU en memoria del proceso, con expiración por entrada."""
+
+    def __init__(self, max_entradas=10000):
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()  # clave -> (valor, expira)
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            if entrada[1] < time.time():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return entrada[0]
+
+    def guardar(self, clave, valor, ttl):
+        with self._lock:
+            self._datos[clave] = (valor, time.time() + ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)  # se descarta la menos usada
+
+    def borrar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+
+class AlmacenSQLite:
+    """Almacén en un archivo SQLite: compartido entre procesos de la misma máquina y sobrevive reinicios."""
+
+    def __init__(self, ruta, purgar_cada=500):
+        self.ruta = ruta
+        self.purgar_cada = purgar_cada
+        self._escrituras = 0
+        self._local = threading.local()
+        conn = self._conexion()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sesiones (
+                clave TEXT PRIMARY KEY,
+                valor TEXT NOT NULL,
+                expira REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_sesiones_expira ON sesiones (expira)")
+
+    def _conexion(self):
+        # Una conexión por hilo; autocommit para no dejar transacciones abiertas
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+        return conn
+
+    def obtener(self, clave):
+        fila = self._conexion().execute(
+            "SELECT valor FROM sesiones WHERE clave = ? AND expira >= ?", (clave, time.time())).fetchone()
+        return fila[0] if fila else None
+
+    def guardar(self, clave, valor, ttl):
+        conn = self._conexion()
+        conn.execute("INSERT OR REPLACE INTO sesiones (clave, valor, expira) VALUES (?, ?, ?)",
+                     (clave, valor, time.time() + ttl))
+        self._escrituras += 1
+        if self._escrituras % self.purgar_cada == 0:
+            conn.execute("DELETE FROM sesiones WHERE expira < ?", (time.time(),))
+
+    def borrar(self, clave):
+        self._conexion().execute("DELETE FROM sesiones WHERE clave = ?", (clave,))
+
+
+# -------------------------------------------------------------------
+# --- INTERFAZ DE SESIÓN PARA FLASK ---
+# -------------------------------------------------------------------
+
+# Claves que definen quién es el usuario: si cambian (login, registro, logout) la sesión cambia de ID
+CLAVES_PRIVILEGIO = ('rol', 'id_usuario')
+
+
+class SesionServidor(CallbackDict, SessionMixin):
+    """Diccionario de sesión que recuerda su ID, si fue modificado y con qué privilegios se abrió."""
+
+    # La cookie vence junto con la entrada del almacén (permanent_session_lifetime), no al cerrar el navegador
+    permanent = True
+
+    def __init__(self, datos=None, sid=None, nueva=False):
+        def al_modificar(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, datos, al_modificar)
+        self.sid = sid
+        self.new = nueva
+        self.modified = False
+        self.privilegios = self._privilegios()
+
+    def _privilegios(self):
+        return tuple(self.get(clave) for clave in CLAVES_PRIVILEGIO)
+
+    def cambio_privilegios(self):
+        return self._privilegios() != self.privilegios
+
+
+class InterfazSesionServidor(SessionInterface):
+    """
+    Reemplaza la sesión en cookie firmada de Flask. La cookie lleva solo un ID aleatorio;
+    el contenido vive en 'almacen'. Los valores grandes (por ejemplo resultados de
+    búsqueda) se guardan aparte con guardar_valor() y en la sesión queda solo la referencia.
+
+    Cuando cambian 'rol' o 'id_usuario' la sesión pasa a un ID nuevo y el anterior se
+    borra del almacén: un ID fijado antes del login (session fixation) no sirve después.
+    """
+
+    serializer = TaggedJSONSerializer()  # soporta date/datetime, tuplas, etc.
+
+    def __init__(self, almacen):
+        self.almacen = almacen
+
+    @staticmethod
+    def _nuevo_id():
+        return secrets.token_urlsafe(32)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            datos = self.almacen.obtener('sesion:' + sid)
+            if datos is not None:
+                return SesionServidor(self.serializer.loads(datos), sid=sid)
+        return SesionServidor(sid=self._nuevo_id(), nueva=True)
+
+    def save_session(self, app, session, response):
+        nombre = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        ruta = self.get_cookie_path(app)
+
+        # Sesión vacía (por ejemplo tras logout): se borra del almacén y de la cookie
+        if not session:
+            if session.modified:
+                self.almacen.borrar('sesion:' + session.sid)
+                response.delete_cookie(nombre, domain=dominio, path=ruta)
+            return
+
+        # La cookie solo se emite junto con la escritura en el almacén, así ambas vencen a la vez
+        if not session.modified:
+            return
+        if session.cambio_privilegios() and not session.new:
+            self.almacen.borrar('sesion:' + session.sid)
+            session.sid = self._nuevo_id()
+        ttl = app.permanent_session_lifetime.total_seconds()
+        self.almacen.guardar('sesion:' + session.sid, self.serializer.dumps(dict(session)), ttl)
+
+        response.set_cookie(nombre, session.sid,
+                            expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app),
+                            secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app),
+                            domain=dominio, path=ruta)
+
+    # --- Valores por referencia ---
+
+    def guardar_valor(self, valor, ttl):
+        """Guarda 'valor' fuera de la sesión y devuelve la referencia a poner en ella."""
+        ref = self._nuevo_id()
+        self.almacen.guardar('valor:' + ref, self.serializer.dumps(valor), ttl)
+        return ref
+
+    def obtener_valor(self, ref, borrar=False):
+        """Recupera un valor guardado con guardar_valor() (None si no existe o expiró)."""
+        if not ref:
+            return None
+        datos = self.almacen.obtener('valor:' + ref)
+        if borrar:
+            self.almacen.borrar('valor:' + ref)
+        return self.serializer.loads(datos) if datos is not None else None
+
+
+def crear_interfaz_sesion(config):
+    """Elige el almacén según app.config['SESSION_BACKEND'] ('memoria' o 'sqlite')."""
+    nombre = config.get('SESSION_BACKEND', 'sqlite')
+    if nombre == 'memoria':
+        return InterfazSesionServidor(AlmacenMemoria(config.get('SESSION_MAX_ENTRADAS', 10000)))
+    if nombre == 'sqlite':
+        return InterfazSesionServidor(AlmacenSQLite(config['SESSION_SQLITE_PATH']))
+    raise ValueError(f"Backend de sesiones desconocido: {nombre}")
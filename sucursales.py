@@ -0,0 +1,165 @@
+# Sucursales: a qué base de datos va cada una, identidad de cada partición y consultas en paralelo a todas
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Cada partición (BD o archivo) guarda una sola fila con la sucursal a la que pertenece. Así,
+# todo lo que hay en su CITA, ESTILISTA y catálogos es de esa sucursal y las consultas calientes
+# no necesitan filtrar por sucursal; la fila sirve para detectar un enrutamiento mal configurado.
+DDL_SUCURSAL = {
+    'sqlserver': [
+        """
+        IF OBJECT_ID('SUCURSAL', 'U') IS NULL
+        CREATE TABLE SUCURSAL (
+            IDSucursal INT NOT NULL PRIMARY KEY,
+            Nombre NVARCHAR(100) NOT NULL
+        )
+        """,
+    ],
+    'sqlite': [
+        """
+        CREATE TABLE IF NOT EXISTS SUCURSAL (
+            IDSucursal INTEGER NOT NULL PRIMARY KEY,
+            Nombre TEXT NOT NULL
+        )
+        """,
+    ],
+}
+
+
+class SucursalEquivocada(Exception):
+    """La BD a la que apunta una sucursal pertenece a otra (error en ROSSY_SUCURSALES)."""
+
+
+class Sucursal:
+    def __init__(self, id_sucursal, nombre, backend, destino):
+        self.id = int(id_sucursal)
+        self.nombre = nombre
+        self.backend = backend  # 'sqlserver' o 'sqlite'
+        self.destino = destino  # cadena de conexión o ruta del archivo
+
+    def config(self, base):
+        """Copia de la configuración de la app con el backend y el destino de esta sucursal."""
+        config = dict(base)
+        config['DB_BACKEND'] = self.backend
+        if self.backend == 'sqlite':
+            config['SQLITE_PATH'] = self.destino
+        return config
+
+
+def cargar(config, conn_str):
+    """
+    Sucursales definidas en ROSSY_SUCURSALES (el JSON o la ruta a un archivo con él):
+
+        [{"id": 1, "nombre": "Centro", "backend": "sqlserver", "conn_str": "DRIVER=...;DATABASE=ROSSY_CENTRO"},
+         {"id": 2, "nombre": "Norte", "backend": "sqlite", "sqlite_path": "norte.db"}]
+
+    Sin la variable hay una sola sucursal (1) en la BD de siempre (DB_BACKEND / conn_str / SQLITE_PATH).
+    Devuelve {id: Sucursal} en el orden definido.
+    """
+    texto = os.environ.get('ROSSY_SUCURSALES')
+    if not texto:
+        backend = config.get('DB_BACKEND', 'sqlserver')
+        destino = config['SQLITE_PATH'] if backend == 'sqlite' else conn_str
+        return {1: Sucursal(1, config.get('SALON_NOMBRE', 'Rossy Salón'), backend, destino)}
+    if not texto.lstrip().startswith('['):
+        with open(texto, encoding='utf-8') as archivo:
+            texto = archivo.read()
+    sucursales = {}
+    for definicion in json.loads(texto):
+        backend = definicion.get('backend', 'sqlserver')
+        destino = definicion['sqlite_path'] if backend == 'sqlite' else definicion['conn_str']
+        sucursal = Sucursal(definicion['id'], definicion['nombre'], backend, destino)
+        if sucursal.id in sucursales:
+            raise ValueError(f"Sucursal repetida en ROSSY_SUCURSALES: {sucursal.id}")
+        sucursales[sucursal.id] = sucursal
+    if not sucursales:
+        raise ValueError("ROSSY_SUCURSALES no define ninguna sucursal.")
+    return sucursales
+
+
+# -------------------------------------------------------------------
+# --- IDENTIDAD DE LA PARTICIÓN ---
+# -------------------------------------------------------------------
+
+def registrar(cursor, sucursal):
+    """Anota en la partición a qué sucursal pertenece (si todavía no lo dice). No hace commit."""
+    cursor.execute("SELECT IDSucursal FROM SUCURSAL")
+    filas = cursor.fetchall()
+    if not filas:
+        cursor.execute("INSERT INTO SUCURSAL (IDSucursal, Nombre) VALUES (?, ?)", sucursal.id, sucursal.nombre)
+    else:
+        comprobar(filas, sucursal)
+
+
+def comprobar(filas, sucursal):
+    """Lanza SucursalEquivocada si las filas de SUCURSAL no son las de esta sucursal."""
+    ids = {int(fila[0]) for fila in filas}
+    if ids and ids != {sucursal.id}:
+        raise SucursalEquivocada(f"La BD de la sucursal {sucursal.id} ({sucursal.nombre}) pertenece a "
+                                 f"la sucursal {', '.join(str(i) for i in sorted(ids))}.")
+
+
+# -------------------------------------------------------------------
+# --- CONSULTAS EN PARALELO ---
+# -------------------------------------------------------------------
+
+class ConsultaParalela:
+    """
+    Corre la misma función en varias sucursales a la vez, cada una con su propia
+    conexión (de su propio pool). El tiempo total es el de la más lenta, acotado
+    por 'timeout': una sucursal que no responde a tiempo se informa como error y
+    no frena a las demás.
+
+    Un hilo que ya está consultando no se puede cancelar, así que cada sucursal
+    tiene su propio ejecutor de 'hilos_por_sucursal' hilos: una sucursal colgada
+    solo retiene los suyos. Mientras los tenga todos ocupados se informa como
+    ocupada, sin encolarle más trabajo, y las demás siguen respondiendo.
+    """
+
+    def __init__(self, hilos_por_sucursal=2):
+        self._hilos = hilos_por_sucursal
+        self._lock = threading.Lock()
+        self._ejecutores = {}  # {id_sucursal: ThreadPoolExecutor}
+        self._en_curso = {}    # {id_sucursal: consultas enviadas que aún no terminan}
+
+    def _enviar(self, funcion, sucursal):
+        """Futuro de funcion(sucursal), o None si la sucursal ya tiene todos sus hilos ocupados."""
+        with self._lock:
+            if self._en_curso.get(sucursal.id, 0) >= self._hilos:
+                return None
+            self._en_curso[sucursal.id] = self._en_curso.get(sucursal.id, 0) + 1
+            ejecutor = self._ejecutores.get(sucursal.id)
+            if ejecutor is None:
+                ejecutor = self._ejecutores[sucursal.id] = ThreadPoolExecutor(
+                    max_workers=self._hilos, thread_name_prefix=f'rossy-sucursal-{sucursal.id}')
+        futuro = ejecutor.submit(funcion, sucursal)
+        # Se libera al terminar de verdad, o al cancelarse si no alcanzó a empezar
+        futuro.add_done_callback(lambda _: self._terminar(sucursal.id))
+        return futuro
+
+    def _terminar(self, id_sucursal):
+        with self._lock:
+            self._en_curso[id_sucursal] -= 1
+
+    def ejecutar(self, funcion, sucursales, timeout=10):
+        """{id: (resultado, error)} con funcion(sucursal) de cada sucursal; error es None si salió bien."""
+        resultados = {}
+        futuros = {}
+        for sucursal in sucursales:
+            futuro = self._enviar(funcion, sucursal)
+            if futuro is None:
+                resultados[sucursal.id] = (None, "Sigue ocupada con consultas anteriores que no respondieron.")
+            else:
+                futuros[futuro] = sucursal.id
+        hechos, _ = wait(futuros, timeout=timeout)
+        for futuro, id_sucursal in futuros.items():
+            if futuro not in hechos:
+                futuro.cancel()
+                resultados[id_sucursal] = (None, f"Sin respuesta en {timeout} s.")
+            elif futuro.exception() is not None:
+                resultados[id_sucursal] = (None, str(futuro.exception()))
+            else:
+                resultados[id_sucursal] = (futuro.result(), None)
+        return resultados
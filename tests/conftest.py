@@ -0,0 +1,45 @@
+# Fixtures comunes: una BD SQLite temporal con el esquema de 'flask migrar' y datos mínimos
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import conexiones  # noqa: E402
+import migraciones  # noqa: E402
+
+
+@pytest.fixture
+def ruta_bd(tmp_path):
+    """Archivo SQLite migrado, con 2 estilistas, 2 clientes y 2 servicios (60 y 90 minutos)."""
+    ruta = str(tmp_path / 'salon.db')
+    conn = sqlite3.connect(ruta)
+    migraciones.aplicar(conexiones.ConexionSQLite(conn), 'sqlite', aviso=lambda mensaje: None)
+    conn.executemany("INSERT INTO SERVICIO (NombreServicio, Precio, DuracionMin) VALUES (?, ?, ?)",
+                     [('Corte', 100, 60), ('Tinte', 300, 90)])
+    conn.executemany("INSERT INTO ESTILISTA (Nombre, Especialidad, Telefono, Correo, Estado) "
+                     "VALUES (?, 'General', ?, ?, 'Activo')",
+                     [('Eva', '7700000001', 'eva@rossy.test'), ('Lía', '7700000002', 'lia@rossy.test')])
+    conn.executemany("INSERT INTO CLIENTE (Nombre, Telefono, Correo, FechaRegistro, contraseña) "
+                     "VALUES (?, ?, ?, '2026-01-01', 'x')",
+                     [('Ana', '5500000001', 'ana@rossy.test'), ('Bea', '5500000002', 'bea@rossy.test')])
+    conn.commit()
+    conn.close()
+    return ruta
+
+
+@pytest.fixture
+def backend(ruta_bd):
+    return conexiones.BackendSQLite(ruta_bd, timeout=5)
+
+
+def insertar_cita(ruta, id_estilista, fecha, hora, estado='Pendiente', id_servicio=1, id_cliente=1):
+    conn = sqlite3.connect(ruta)
+    id_cita = conn.execute("INSERT INTO CITA (IDCliente, IDEstilista, IDServicio, Fecha, Hora, Estado) "
+                           "VALUES (?, ?, ?, ?, ?, ?)",
+                           (id_cliente, id_estilista, id_servicio, fecha, hora, estado)).lastrowid
+    conn.commit()
+    conn.close()
+    return id_cita
@@ -0,0 +1,101 @@
+# IndiceDisponibilidad sobre una BD SQLite real: choques, liberación y reservas concurrentes
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+import estados
+from conftest import insertar_cita
+from disponibilidad import IndiceDisponibilidad, IntervalosOrdenados, minutos
+
+FECHA = (date.today() + timedelta(days=7)).isoformat()
+JORNADA = [(9 * 60, 20 * 60)]
+
+
+def crear_indice(backend):
+    def cargador(id_estilista, fecha):
+        conn = backend.conectar()
+        try:
+            cursor = conn.cursor()
+            marcas = ', '.join('?' for _ in estados.ESTADOS_ACTIVOS)
+            cursor.execute(f"""
+            SELECT C.Hora, S.DuracionMin
+            FROM CITA C JOIN SERVICIO S ON C.IDServicio = S.IDServicio
+            WHERE C.IDEstilista = ? AND C.Fecha = ? AND C.Estado IN ({marcas})
+            """, id_estilista, fecha, *estados.ESTADOS_ACTIVOS)
+            return cursor.fetchall()
+        finally:
+            conn.close()
+    return IndiceDisponibilidad(cargador, lambda id_estilista, fecha: JORNADA)
+
+
+def test_reservar_respeta_citas_de_la_bd(ruta_bd, backend):
+    insertar_cita(ruta_bd, 1, FECHA, '10:00:00')  # Corte: 10:00-11:00
+    insertar_cita(ruta_bd, 1, FECHA, '15:00:00', estado='Cancelada')
+    indice = crear_indice(backend)
+
+    assert not indice.reservar(1, FECHA, '10:30:00', 60)
+    assert not indice.reservar(1, FECHA, '09:30:00', 60)
+    assert indice.reservar(1, FECHA, '09:00:00', 60)  # termina justo cuando empieza la cita
+    assert indice.reservar(1, FECHA, '11:00', 90)  # 'HH:MM' y 'HH:MM:SS' son la misma hora
+    assert indice.reservar(1, FECHA, '15:00:00', 60)  # la cancelada no ocupa
+    assert indice.reservar(2, FECHA, '10:00:00', 60)  # otro estilista
+
+
+def test_reservar_fuera_de_jornada(backend):
+    indice = crear_indice(backend)
+    with pytest.raises(ValueError):
+        indice.reservar(1, FECHA, '19:30:00', 60)
+
+
+def test_liberar_devuelve_el_intervalo(backend):
+    indice = crear_indice(backend)
+    assert indice.reservar(1, FECHA, '12:00:00', 90)
+    assert not indice.esta_libre(1, FECHA, '13:00:00', 60)
+    indice.liberar(1, FECHA, '12:00:00', 90)
+    assert indice.esta_libre(1, FECHA, '13:00:00', 60)
+    assert indice.reservar(1, FECHA, '12:30:00', 60)
+
+
+def test_liberar_solo_quita_una_aparicion():
+    # Citas viejas que ya se solapaban: cada una se quita por separado
+    intervalos = IntervalosOrdenados([(600, 660), (600, 660)])
+    assert intervalos.quitar(600, 660)
+    assert intervalos.choca(630, 640)
+    assert intervalos.quitar(600, 660)
+    assert not intervalos.choca(630, 640)
+    assert not intervalos.quitar(600, 660)
+
+
+def test_invalidar_vuelve_a_leer_la_bd(ruta_bd, backend):
+    indice = crear_indice(backend)
+    assert indice.esta_libre(1, FECHA, '16:00:00', 60)
+    insertar_cita(ruta_bd, 1, FECHA, '16:00:00')  # p. ej. la agendó otro proceso
+    assert indice.esta_libre(1, FECHA, '16:00:00', 60)  # todavía el día en memoria
+    indice.invalidar(1, FECHA)
+    assert not indice.reservar(1, FECHA, '16:30:00', 60)
+
+
+@pytest.mark.parametrize('horas', [
+    ['10:00:00'] * 16,  # todos al mismo horario
+    ['10:00:00', '10:20:00', '09:40:00', '10:10:00'] * 4,  # horarios distintos, todos solapados entre sí
+])
+def test_reservas_simultaneas_no_se_solapan(backend, horas):
+    indice = crear_indice(backend)
+    barrera = threading.Barrier(len(horas))
+    ganadas = []
+
+    def intentar(hora):
+        barrera.wait()
+        if indice.reservar(1, FECHA, hora, 60):
+            ganadas.append(hora)
+
+    hilos = [threading.Thread(target=intentar, args=(hora,)) for hora in horas]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert len(ganadas) == 1
+    # Lo que quedó en el índice es exactamente la reserva ganadora
+    assert list(indice._dia(1, FECHA)) == [(minutos(ganadas[0]), minutos(ganadas[0]) + 60)]
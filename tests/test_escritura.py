@@ -0,0 +1,91 @@
+# EscritorAgrupado: lotes con un trabajo que falla se deshacen y se repiten de a uno
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from escritura import EscritorAgrupado
+
+
+def insertar(valor):
+    def trabajo(cursor):
+        cursor.execute("INSERT INTO NUMEROS (Valor) VALUES (?)", valor)
+        return valor
+    return trabajo
+
+
+def valores(ruta):
+    conn = sqlite3.connect(ruta)
+    try:
+        return sorted(fila[0] for fila in conn.execute("SELECT Valor FROM NUMEROS"))
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def escritor(ruta_bd, backend):
+    conn = sqlite3.connect(ruta_bd)
+    conn.execute("CREATE TABLE NUMEROS (Valor INTEGER NOT NULL UNIQUE)")
+    conn.commit()
+    conn.close()
+    return EscritorAgrupado(backend, max_lote=8)
+
+
+def esperar_en_cola(escritor, cantidad, timeout=5):
+    limite = time.monotonic() + timeout
+    while escritor.metricas()['en_cola'] < cantidad:
+        assert time.monotonic() < limite, "los trabajos no llegaron a la cola"
+        time.sleep(0.005)
+
+
+def test_lote_con_un_fallo_se_repite_de_a_uno(ruta_bd, escritor):
+    # El primer trabajo retiene al escritor para que los siguientes lleguen juntos en un lote
+    soltar = threading.Event()
+
+    def retener(cursor):
+        soltar.wait(5)
+        return insertar(0)(cursor)
+
+    resultados, errores = {}, {}
+
+    def encolar(nombre, trabajo):
+        try:
+            resultados[nombre] = escritor.ejecutar(trabajo, timeout=10)
+        except Exception as e:
+            errores[nombre] = e
+
+    hilos = [threading.Thread(target=encolar, args=('retener', retener))]
+    hilos[0].start()
+    while escritor.metricas()['lotes'] < 1:
+        time.sleep(0.005)
+    for nombre, trabajo in [('uno', insertar(1)), ('repetido', insertar(0)), ('dos', insertar(2))]:
+        hilos.append(threading.Thread(target=encolar, args=(nombre, trabajo)))
+        hilos[-1].start()
+    esperar_en_cola(escritor, 3)
+    soltar.set()
+    for hilo in hilos:
+        hilo.join()
+
+    # Solo el culpable recibe el error; los demás quedan confirmados una sola vez
+    assert resultados == {'retener': 0, 'uno': 1, 'dos': 2}
+    assert list(errores) == ['repetido']
+    assert isinstance(errores['repetido'], sqlite3.IntegrityError)
+    assert valores(ruta_bd) == [0, 1, 2]
+    metricas = escritor.metricas()
+    assert metricas['lote_max'] == 3
+    assert metricas['reintentos_individuales'] == 1
+    assert metricas['fallidos'] == 1
+    assert metricas['commits'] == 3  # el lote de 'retener' y las dos repeticiones que sí funcionaron
+
+
+def test_fallo_en_lote_de_uno_no_deja_nada_a_medias(ruta_bd, escritor):
+    def dos_inserts(cursor):
+        cursor.execute("INSERT INTO NUMEROS (Valor) VALUES (?)", 5)
+        cursor.execute("INSERT INTO NUMEROS (Valor) VALUES (?)", 5)
+
+    with pytest.raises(sqlite3.IntegrityError):
+        escritor.ejecutar(dos_inserts)
+    assert valores(ruta_bd) == []
+    assert escritor.ejecutar(insertar(5)) == 5
+    assert valores(ruta_bd) == [5]
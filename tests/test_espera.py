@@ -0,0 +1,69 @@
+# EmparejadorEspera: orden de los candidatos para un horario liberado
+import sqlite3
+from datetime import date
+
+import pytest
+
+import espera
+
+FECHA = '2030-03-04'
+HOY = date(2030, 3, 1)
+
+
+@pytest.fixture
+def emparejador(ruta_bd, backend):
+    """Carga desde LISTA_ESPERA (como al arrancar la app) un emparejador con grilla de 30 minutos."""
+    conn = sqlite3.connect(ruta_bd)
+    conn.executemany("""
+        INSERT INTO LISTA_ESPERA (IDCliente, IDServicio, IDEstilista, FechaDesde, FechaHasta,
+                                  HoraDesde, HoraHasta, Prioridad, Estado)
+        VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?)
+    """, [
+        (1, 1, FECHA, FECHA, '09:00:00', '18:00:00', 1, 'Activa'),     # 1: menos prioritaria
+        (2, None, FECHA, FECHA, '09:00:00', '18:00:00', 0, 'Activa'),  # 2: cualquier estilista
+        (1, 1, FECHA, FECHA, '10:30:00', '12:00:00', 0, 'Activa'),     # 3: llegó después de la 2
+        (2, 2, FECHA, FECHA, '09:00:00', '18:00:00', 0, 'Activa'),     # 4: otro estilista
+        (1, 1, FECHA, FECHA, '15:00:00', '18:00:00', 0, 'Activa'),     # 5: ventana fuera del tramo
+        (2, 1, FECHA, FECHA, '09:00:00', '18:00:00', 0, 'Cancelada'),  # 6: no se carga
+        (1, 1, '2030-02-01', '2030-02-20', '09:00:00', '18:00:00', 0, 'Activa'),  # 7: ya venció
+    ])
+    conn.commit()
+    conn.close()
+
+    conn = backend.conectar()
+    activas = espera.cargar_activas(conn.cursor(), hoy=HOY)
+    conn.close()
+    assert [s.id for s in activas] == [1, 2, 3, 4, 5]
+    emparejador = espera.EmparejadorEspera(paso=30)
+    for solicitud in activas:
+        emparejador.agregar(solicitud, 60, hoy=HOY)
+    return emparejador
+
+
+def ids(candidatos):
+    return [(solicitud.id, inicio) for solicitud, inicio in candidatos]
+
+
+def test_prioridad_y_orden_de_llegada(emparejador):
+    # Se liberó 10:00-12:00 de la estilista 1
+    assert ids(emparejador.candidatos(1, FECHA, 600, 720)) == [(2, 600), (3, 630), (1, 600)]
+
+
+def test_cada_solicitud_aparece_una_vez_en_su_primer_inicio(emparejador):
+    candidatos = ids(emparejador.candidatos(1, FECHA, 540, 1080))
+    assert [id_espera for id_espera, _ in candidatos] == [2, 3, 5, 1]
+    assert dict(candidatos) == {2: 540, 3: 630, 5: 900, 1: 540}
+
+
+def test_limite_y_quitadas(emparejador):
+    assert ids(emparejador.candidatos(1, FECHA, 600, 720, limite=1)) == [(2, 600)]
+    emparejador.quitar(2, asignada=True)
+    assert ids(emparejador.candidatos(1, FECHA, 600, 720)) == [(3, 630), (1, 600)]
+    # Consultar no consume: la misma búsqueda devuelve lo mismo
+    assert ids(emparejador.candidatos(1, FECHA, 600, 720)) == [(3, 630), (1, 600)]
+    assert emparejador.metricas()['asignadas'] == 1
+
+
+def test_otro_estilista_y_otro_dia(emparejador):
+    assert ids(emparejador.candidatos(2, FECHA, 600, 660)) == [(2, 600), (4, 600)]
+    assert emparejador.candidatos(1, '2030-03-05', 600, 720) == []
@@ -0,0 +1,99 @@
+# estados.aplicar_cambios: validación por cita y detección de cambios concurrentes
+import sqlite3
+
+import pytest
+
+import estados
+from conftest import insertar_cita
+
+FECHA = '2030-01-15'
+
+
+def estado_de(ruta, id_cita):
+    conn = sqlite3.connect(ruta)
+    try:
+        return conn.execute("SELECT Estado FROM CITA WHERE IDCita = ?", (id_cita,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_aplica_las_validas_y_reporta_las_demas(ruta_bd, backend):
+    pendiente = insertar_cita(ruta_bd, 1, FECHA, '10:00:00')
+    realizada = insertar_cita(ruta_bd, 1, FECHA, '12:00:00', estado='Realizada')
+    de_otra = insertar_cita(ruta_bd, 2, FECHA, '10:00:00')
+    otra = insertar_cita(ruta_bd, 1, FECHA, '16:00:00')
+    conn = backend.conectar()
+    cambios = [(pendiente, 'En Proceso'), (realizada, 'Pendiente'), (de_otra, 'Cancelada'),
+               (999, 'Realizada'), (pendiente, 'Cancelada'), (otra, 'Inventado')]
+
+    resultados, cambiadas = estados.aplicar_cambios(conn.cursor(), cambios, id_estilista=1)
+    conn.commit()
+
+    assert [r['ok'] for r in resultados] == [True, False, False, False, False, False]
+    assert resultados[1]['estado_anterior'] == 'Realizada'
+    assert 'No se puede pasar' in resultados[1]['error']
+    assert resultados[2]['error'].startswith('Acceso denegado')
+    assert resultados[3]['error'] == "Cita no encontrada."
+    assert resultados[4]['error'] == "Cita repetida en la solicitud."
+    assert resultados[5]['error'].startswith('Estado no válido')
+    assert [(c.id_cita, c.estado_anterior, c.estado, c.precio) for c in cambiadas] == \
+        [(pendiente, 'Pendiente', 'En Proceso', 100)]
+    assert estado_de(ruta_bd, pendiente) == 'En Proceso'
+    assert estado_de(ruta_bd, de_otra) == 'Pendiente'
+
+
+def test_mismo_estado_no_hace_update(ruta_bd, backend):
+    id_cita = insertar_cita(ruta_bd, 1, FECHA, '10:00:00')
+    conn = backend.conectar()
+    resultados, cambiadas = estados.aplicar_cambios(conn.cursor(), [(id_cita, 'Pendiente')])
+    assert resultados[0]['ok'] and cambiadas == []
+
+
+class CursorConIntrusa:
+    """Deja que otra conexión cambie la cita justo después de la lectura de aplicar_cambios."""
+
+    def __init__(self, cursor, ruta, id_cita, estado):
+        self._cursor = cursor
+        self._intrusa = (ruta, id_cita, estado)
+
+    def fetchall(self):
+        resultado = self._cursor.fetchall()
+        if self._intrusa:
+            ruta, id_cita, estado = self._intrusa
+            self._intrusa = None
+            otra = sqlite3.connect(ruta)
+            otra.execute("UPDATE CITA SET Estado = ? WHERE IDCita = ?", (estado, id_cita))
+            otra.commit()
+            otra.close()
+        return resultado
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+
+def test_cambio_concurrente_lanza_conflicto_y_se_deshace(ruta_bd, backend):
+    primera = insertar_cita(ruta_bd, 1, FECHA, '10:00:00')
+    segunda = insertar_cita(ruta_bd, 1, FECHA, '12:00:00')
+    conn = backend.conectar()
+    cursor = CursorConIntrusa(conn.cursor(), ruta_bd, segunda, 'Cancelada')
+
+    with pytest.raises(estados.ConflictoEstado):
+        estados.aplicar_cambios(cursor, [(primera, 'Realizada'), (segunda, 'Realizada')])
+    conn.rollback()
+
+    # Nada del lote quedó aplicado y lo que hizo la otra solicitud se respeta
+    assert estado_de(ruta_bd, primera) == 'Pendiente'
+    assert estado_de(ruta_bd, segunda) == 'Cancelada'
+    # Al reintentar, la cita ya cancelada se rechaza por transición y la otra sí cambia
+    resultados, cambiadas = estados.aplicar_cambios(conn.cursor(), [(primera, 'Realizada'), (segunda, 'Realizada')])
+    conn.commit()
+    assert [r['ok'] for r in resultados] == [True, False]
+    assert [c.id_cita for c in cambiadas] == [primera]
+
+
+def test_leer_cambios_valida_la_forma():
+    assert estados.leer_cambios([{'id_cita': '3', 'estado': 'Realizada'}]) == [(3, 'Realizada')]
+    for datos in (None, [], [{'estado': 'Realizada'}], [{'id_cita': 'x', 'estado': 'Realizada'}],
+                  [{'id_cita': 1, 'estado': 'Realizada'}] * (estados.MAX_CAMBIOS + 1)):
+        with pytest.raises(ValueError):
+            estados.leer_cambios(datos)
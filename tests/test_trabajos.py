@@ -0,0 +1,126 @@
+# ColaTrabajos: orden y exclusividad de tomar(), y recuperación de trabajos abandonados
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from trabajos import ColaTrabajos
+
+
+@pytest.fixture
+def ruta_cola(tmp_path):
+    return str(tmp_path / 'trabajos.db')
+
+
+def fila(ruta, id_trabajo):
+    conn = sqlite3.connect(ruta)
+    try:
+        return conn.execute("SELECT estado, intentos, error FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()
+    finally:
+        conn.close()
+
+
+def ejecutar_sql(ruta, query, params):
+    conn = sqlite3.connect(ruta)
+    conn.execute(query, params)
+    conn.commit()
+    conn.close()
+
+
+def test_tomar_respeta_ejecutar_en(ruta_cola):
+    cola = ColaTrabajos(ruta_cola)
+    ahora = time.time()
+    tarde = cola.encolar('correo', {'n': 1}, ejecutar_en=ahora - 10)
+    antes = cola.encolar('correo', {'n': 2}, ejecutar_en=ahora - 60)
+    cola.encolar('recordatorio', {'n': 3}, ejecutar_en=ahora + 3600)
+
+    assert cola.tomar() == (antes, 'correo', {'n': 2}, 1)
+    assert cola.tomar() == (tarde, 'correo', {'n': 1}, 1)
+    assert cola.tomar() is None  # el programado todavía no vence
+    assert 3500 < cola.proximo() <= 3600
+
+
+def test_clave_no_duplica_y_cancelar_la_retira(ruta_cola):
+    cola = ColaTrabajos(ruta_cola)
+    id_trabajo = cola.encolar('recordatorio', {}, ejecutar_en=time.time() + 60, clave='cita:1')
+    assert id_trabajo is not None
+    assert cola.encolar('recordatorio', {}, clave='cita:1') is None
+    assert cola.cancelar('cita:1')
+    assert cola.encolar('recordatorio', {}, clave='cita:1') is not None
+
+
+@pytest.mark.parametrize('version_sqlite', [None, (3, 34, 0)])
+def test_tomar_concurrente_entrega_cada_trabajo_una_vez(ruta_cola, monkeypatch, version_sqlite):
+    if version_sqlite:
+        monkeypatch.setattr(sqlite3, 'sqlite_version_info', version_sqlite)  # camino sin RETURNING
+    cola = ColaTrabajos(ruta_cola)
+    ids = {cola.encolar('correo', {'n': n}) for n in range(40)}
+    barrera = threading.Barrier(8)
+    tomados, lock = [], threading.Lock()
+
+    def trabajador():
+        barrera.wait()
+        while True:
+            trabajo = cola.tomar()
+            if trabajo is None:
+                return
+            with lock:
+                tomados.append(trabajo[0])
+
+    hilos = [threading.Thread(target=trabajador) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert sorted(tomados) == sorted(ids)
+    assert cola.metricas()['en_curso'] == 40
+
+
+def test_mantenimiento_recupera_abandonados(ruta_cola):
+    cola = ColaTrabajos(ruta_cola, max_intentos=3, visibilidad=300)
+    reciente = cola.encolar('correo', {'n': 1})
+    abandonado = cola.encolar('correo', {'n': 2})
+    agotado = cola.encolar('correo', {'n': 3})
+    while cola.tomar() is not None:
+        pass
+    # Dos de ellos los tomó un proceso que murió hace 10 minutos; uno ya iba por su último intento
+    ejecutar_sql(ruta_cola, "UPDATE trabajos SET tomado_en = ? WHERE id IN (?, ?)",
+                 (time.time() - 600, abandonado, agotado))
+    ejecutar_sql(ruta_cola, "UPDATE trabajos SET intentos = 3 WHERE id = ?", (agotado,))
+
+    assert cola.mantenimiento() == 1
+    assert fila(ruta_cola, reciente)[0] == 'en_curso'  # sigue dentro de su visibilidad
+    assert fila(ruta_cola, abandonado)[:2] == ('pendiente', 1)
+    assert fila(ruta_cola, agotado)[0] == 'fallido'
+    assert cola.tomar() == (abandonado, 'correo', {'n': 2}, 2)
+    assert cola.metricas()['recuperados'] == 1
+
+
+def test_mantenimiento_borra_hechos_viejos(ruta_cola):
+    cola = ColaTrabajos(ruta_cola, conservar_dias=7)
+    viejo = cola.encolar('correo', {})
+    nuevo = cola.encolar('correo', {})
+    for _ in range(2):
+        cola.completar(cola.tomar()[0])
+    ejecutar_sql(ruta_cola, "UPDATE trabajos SET creado = ? WHERE id = ?", (time.time() - 8 * 86400, viejo))
+
+    cola.mantenimiento()
+    assert fila(ruta_cola, viejo) is None
+    assert fila(ruta_cola, nuevo)[0] == 'hecho'
+
+
+def test_fallar_reprograma_y_luego_agota(ruta_cola):
+    cola = ColaTrabajos(ruta_cola, max_intentos=2, backoff_base=30)
+    id_trabajo = cola.encolar('correo', {})
+    _, _, _, intentos = cola.tomar()
+    cola.fallar(id_trabajo, intentos, RuntimeError('SMTP caído'))
+    assert fila(ruta_cola, id_trabajo) == ('pendiente', 1, 'SMTP caído')
+    assert cola.tomar() is None  # espera su backoff
+    assert 24 <= cola.proximo() <= 36
+
+    ejecutar_sql(ruta_cola, "UPDATE trabajos SET ejecutar_en = ? WHERE id = ?", (time.time() - 1, id_trabajo))
+    _, _, _, intentos = cola.tomar()
+    cola.fallar(id_trabajo, intentos, RuntimeError('SMTP caído'))
+    assert fila(ruta_cola, id_trabajo)[:2] == ('fallido', 2)
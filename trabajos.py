@@ -0,0 +1,260 @@
+# Cola de trabajos en segundo plano: persistida en SQLite, con hilos trabajadores, reintentos y trabajos programados
+import json
+import random
+import sqlite3
+import threading
+import time
+
+
+class ColaTrabajos:
+    """
+    Trabajos (tipo + datos JSON) guardados en un archivo SQLite local, así que
+    sobreviven reinicios y los comparten los procesos de la misma máquina.
+    Encolar es un INSERT en autocommit (sin tocar la BD del salón), de modo que
+    la solicitud que encola no espera a que el trabajo se haga.
+
+    Cada trabajo tiene 'ejecutar_en' (epoch): los programados ("recordar 24 h
+    antes") esperan en la tabla hasta su hora. Un trabajo que falla vuelve a
+    'pendiente' con espera exponencial (backoff_base * 2^(intentos-1), con
+    jitter y tope backoff_max) hasta 'max_intentos'; después queda 'fallido'.
+
+    'clave' es opcional y única entre los trabajos pendientes: encolar dos
+    veces el mismo recordatorio no lo duplica, y cancelar(clave) lo retira.
+    """
+
+    def __init__(self, ruta, max_intentos=5, backoff_base=30, backoff_max=3600, visibilidad=300,
+                 conservar_dias=7):
+        self.ruta = ruta
+        self.max_intentos = max_intentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.visibilidad = visibilidad  # segundos tras los que un trabajo 'en_curso' se da por abandonado
+        self.conservar_dias = conservar_dias
+        self._local = threading.local()
+        self._hay_trabajo = threading.Condition()
+        self._lock = threading.Lock()
+        self._stats = {'encolados': 0, 'hechos': 0, 'reintentos': 0, 'fallidos': 0, 'recuperados': 0}
+        conn = self._conexion()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS trabajos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo TEXT NOT NULL,
+                datos TEXT NOT NULL,
+                clave TEXT,
+                estado TEXT NOT NULL DEFAULT 'pendiente',
+                ejecutar_en REAL NOT NULL,
+                intentos INTEGER NOT NULL DEFAULT 0,
+                tomado_en REAL,
+                error TEXT,
+                creado REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_trabajos_estado_ejecutar ON trabajos (estado, ejecutar_en)")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_trabajos_clave ON trabajos (clave) "
+                     "WHERE clave IS NOT NULL AND estado IN ('pendiente', 'en_curso')")
+
+    def _conexion(self):
+        # Una conexión por hilo; autocommit, como el almacén de sesiones
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")  # en WAL solo se arriesga lo último ante un corte de luz
+        return conn
+
+    def _contar(self, nombre, cantidad=1):
+        with self._lock:
+            self._stats[nombre] += cantidad
+
+    # --- Productores (solicitudes) ---
+
+    def encolar(self, tipo, datos, ejecutar_en=None, clave=None):
+        """Agrega un trabajo. Devuelve su id, o None si ya había uno pendiente con esa clave."""
+        ahora = time.time()
+        cursor = self._conexion().execute(
+            "INSERT OR IGNORE INTO trabajos (tipo, datos, clave, ejecutar_en, creado) VALUES (?, ?, ?, ?, ?)",
+            (tipo, json.dumps(datos), clave, ejecutar_en or ahora, ahora))
+        if cursor.rowcount != 1:
+            return None
+        self._contar('encolados')
+        with self._hay_trabajo:
+            self._hay_trabajo.notify()
+        return cursor.lastrowid
+
+    def cancelar(self, clave):
+        """Retira el trabajo pendiente con esa clave (p. ej. el recordatorio de una cita cancelada)."""
+        return self._conexion().execute(
+            "DELETE FROM trabajos WHERE clave = ? AND estado = 'pendiente'", (clave,)).rowcount == 1
+
+    # --- Consumidores (hilos trabajadores) ---
+
+    def tomar(self):
+        """Reserva el próximo trabajo vencido para este hilo: (id, tipo, datos, intentos) o None."""
+        ahora = time.time()
+        conn = self._conexion()
+        if sqlite3.sqlite_version_info >= (3, 35):
+            fila = conn.execute("""
+                UPDATE trabajos SET estado = 'en_curso', tomado_en = ?, intentos = intentos + 1
+                WHERE id = (SELECT id FROM trabajos WHERE estado = 'pendiente' AND ejecutar_en <= ?
+                            ORDER BY ejecutar_en LIMIT 1)
+                  AND estado = 'pendiente'
+                RETURNING id, tipo, datos, intentos
+            """, (ahora, ahora)).fetchall()
+            fila = fila[0] if fila else None
+        else:
+            fila = self._tomar_sin_returning(conn, ahora)
+        if fila is None:
+            return None
+        return fila[0], fila[1], json.loads(fila[2]), fila[3]
+
+    @staticmethod
+    def _tomar_sin_returning(conn, ahora):
+        """
+        tomar() para SQLite < 3.35 (sin RETURNING): BEGIN IMMEDIATE toma el lock de
+        escritura antes del SELECT, así que ningún otro hilo o proceso puede
+        reservar el mismo trabajo entre la lectura y el UPDATE.
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            fila = conn.execute(
+                "SELECT id, tipo, datos, intentos FROM trabajos WHERE estado = 'pendiente' AND ejecutar_en <= ? "
+                "ORDER BY ejecutar_en LIMIT 1", (ahora,)).fetchone()
+            if fila is not None:
+                conn.execute("UPDATE trabajos SET estado = 'en_curso', tomado_en = ?, intentos = intentos + 1 "
+                             "WHERE id = ?", (ahora, fila[0]))
+                fila = (fila[0], fila[1], fila[2], fila[3] + 1)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return fila
+
+    def completar(self, id_trabajo):
+        self._conexion().execute("UPDATE trabajos SET estado = 'hecho', error = NULL WHERE id = ?", (id_trabajo,))
+        self._contar('hechos')
+
+    def fallar(self, id_trabajo, intentos, error):
+        """Programa el reintento con espera exponencial, o lo deja 'fallido' si ya no quedan intentos."""
+        if intentos >= self.max_intentos:
+            self._conexion().execute("UPDATE trabajos SET estado = 'fallido', error = ? WHERE id = ?",
+                                     (str(error)[:500], id_trabajo))
+            self._contar('fallidos')
+            return
+        espera = min(self.backoff_base * 2 ** (intentos - 1), self.backoff_max)
+        espera *= random.uniform(0.8, 1.2)  # jitter: los reintentos de una caída no llegan todos juntos
+        self._conexion().execute(
+            "UPDATE trabajos SET estado = 'pendiente', ejecutar_en = ?, error = ? WHERE id = ?",
+            (time.time() + espera, str(error)[:500], id_trabajo))
+        self._contar('reintentos')
+
+    def proximo(self):
+        """Segundos hasta el próximo trabajo pendiente (None si no hay ninguno)."""
+        fila = self._conexion().execute(
+            "SELECT MIN(ejecutar_en) FROM trabajos WHERE estado = 'pendiente'").fetchone()
+        return None if fila[0] is None else max(fila[0] - time.time(), 0)
+
+    def esperar(self, segundos):
+        """Duerme hasta 'segundos' o hasta que este proceso encole algo."""
+        with self._hay_trabajo:
+            self._hay_trabajo.wait(segundos)
+
+    def mantenimiento(self):
+        """
+        Devuelve a 'pendiente' los trabajos de un proceso que murió a mitad y borra los hechos viejos.
+        Un trabajo abandonado que ya agotó sus intentos queda 'fallido': si es él el que tumba
+        al proceso, no se reintenta para siempre.
+        """
+        ahora = time.time()
+        conn = self._conexion()
+        fallidos = conn.execute(
+            "UPDATE trabajos SET estado = 'fallido', error = 'Abandonado a mitad tras agotar los intentos.' "
+            "WHERE estado = 'en_curso' AND tomado_en < ? AND intentos >= ?",
+            (ahora - self.visibilidad, self.max_intentos)).rowcount
+        recuperados = conn.execute(
+            "UPDATE trabajos SET estado = 'pendiente', ejecutar_en = ? WHERE estado = 'en_curso' AND tomado_en < ?",
+            (ahora, ahora - self.visibilidad)).rowcount
+        conn.execute("DELETE FROM trabajos WHERE estado = 'hecho' AND creado < ?",
+                     (ahora - self.conservar_dias * 86400,))
+        self._contar('recuperados', recuperados)
+        self._contar('fallidos', fallidos)
+        return recuperados
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._stats)
+        datos.update(pendiente=0, en_curso=0, hecho=0, fallido=0)
+        for estado, total in self._conexion().execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado"):
+            datos[estado] = total
+        return datos
+
+
+class GrupoTrabajadores:
+    """
+    'hilos' hilos que toman trabajos de la cola y los pasan a
+    manejadores[tipo](datos). Un manejador que lanza una excepción provoca un
+    reintento; uno que termina bien marca el trabajo como hecho. Cuando no hay
+    nada vencido, los hilos duermen hasta el próximo programado (como mucho
+    'espera_max' segundos, para ver lo que encolan otros procesos).
+    """
+
+    def __init__(self, cola, manejadores, hilos=2, espera_max=5, mantenimiento_cada=60):
+        self.cola = cola
+        self.manejadores = manejadores
+        self.hilos = hilos
+        self.espera_max = espera_max
+        self.mantenimiento_cada = mantenimiento_cada
+        self._lock = threading.Lock()
+        self._hilos = []
+        self._ultimo_mantenimiento = 0
+
+    def arrancar(self):
+        with self._lock:
+            while len(self._hilos) < self.hilos:
+                hilo = threading.Thread(target=self._bucle, name=f'trabajador-{len(self._hilos) + 1}', daemon=True)
+                self._hilos.append(hilo)
+                hilo.start()
+
+    def _bucle(self):
+        while True:
+            try:
+                if not self.procesar_uno():
+                    proximo = self.cola.proximo()
+                    self.cola.esperar(self.espera_max if proximo is None else min(proximo, self.espera_max))
+            except Exception as e:
+                # Error de la propia cola (archivo bloqueado, disco lleno): se reintenta más tarde
+                print(f"Error en la cola de trabajos: {e}")
+                time.sleep(self.espera_max)
+
+    def unirse(self):
+        """Bloquea mientras los hilos sigan vivos (para 'flask trabajos')."""
+        for hilo in list(self._hilos):
+            hilo.join()
+
+    def procesar_uno(self):
+        """Ejecuta un trabajo vencido, si hay. Devuelve False si no había ninguno."""
+        self._mantener()
+        trabajo = self.cola.tomar()
+        if trabajo is None:
+            return False
+        id_trabajo, tipo, datos, intentos = trabajo
+        try:
+            manejador = self.manejadores[tipo]
+        except KeyError:
+            self.cola.fallar(id_trabajo, self.cola.max_intentos, f"Tipo de trabajo desconocido: {tipo}")
+            return True
+        try:
+            manejador(datos)
+        except Exception as e:
+            print(f"Error en el trabajo {id_trabajo} ({tipo}, intento {intentos}): {e}")
+            self.cola.fallar(id_trabajo, intentos, e)
+        else:
+            self.cola.completar(id_trabajo)
+        return True
+
+    def _mantener(self):
+        ahora = time.time()
+        with self._lock:
+            if ahora - self._ultimo_mantenimiento < self.mantenimiento_cada:
+                return
+            self._ultimo_mantenimiento = ahora
+        self.cola.mantenimiento()